@@ -0,0 +1,320 @@
+"""
+Headless batch mode for Neural-Chat.
+
+Runs many discussions concurrently from a JSONL file (or stdin) of topics and
+writes one JSONL record per finished discussion, in completion order, with the
+transcript, the votes of every round, the summary and timings.
+
+Each input line is either a JSON object with a "topic" (and optional "id")
+or a bare JSON string. Lines without an id are numbered by their position in
+the input. When the output file already exists, discussions it records are
+skipped, so an interrupted sweep can be resumed by re-running the same command.
+
+Usage:
+    python batch.py topics.jsonl -o results.jsonl [--concurrency N] [--provider-concurrency N]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import config
+from models import (
+    get_enabled_chat_functions,
+    chat_with_fallback_async,
+    gpt4o_chat,
+    CHAT_MODEL_NAMES,
+    CHAT_PROVIDERS
+)
+from main import randomize_model_order, round_order_seed, fit_context
+from clients import aclose_clients
+import telemetry
+from transcript import Transcript
+from context_window import ContextWindow
+from summarizer import RunningSummary
+from novelty import NoveltyDetector
+from budget import Budget
+import governor
+
+def read_topics(lines):
+    """
+    Parses JSONL topic lines into (id, topic) pairs, skipping blank and malformed lines.
+    """
+    topics = []
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            print(f"Skipping malformed input line {line_number}: {e}", file=sys.stderr)
+            continue
+        if isinstance(record, str):
+            topics.append((str(line_number), record))
+        elif isinstance(record, dict) and record.get("topic"):
+            topics.append((str(record.get("id", line_number)), record["topic"]))
+        else:
+            print(f"Skipping input line {line_number}: no topic", file=sys.stderr)
+    return topics
+
+def load_finished_ids(output_path):
+    """
+    Returns the ids already recorded in an output file.
+
+    A trailing partial line left by an interrupted run is truncated so new
+    records are appended on a line of their own.
+    """
+    if not os.path.exists(output_path):
+        return set()
+    with open(output_path, "rb+") as f:
+        data = f.read()
+        complete = data.rfind(b"\n") + 1
+        if complete < len(data):
+            f.truncate(complete)
+    finished = set()
+    for line in data[:complete].decode("utf-8").splitlines():
+        try:
+            finished.add(str(json.loads(line)["id"]))
+        except (json.JSONDecodeError, KeyError, TypeError):
+            continue
+    return finished
+
+def new_provider_limits(concurrency):
+    """
+    Returns one asyncio.Semaphore of the given size per provider, for run_discussion.
+    """
+    return {provider: asyncio.Semaphore(concurrency) for provider in set(CHAT_PROVIDERS.values())}
+
+async def run_discussion(topic, provider_limits, parallel_rounds=None, on_event=None, stream=False, budget=None):
+    """
+    Runs one full discussion without any terminal interaction.
+
+    Args:
+        topic: The discussion topic
+        provider_limits: Mapping of provider identifier to an asyncio.Semaphore
+            capping concurrent calls to that provider across all discussions
+            (see new_provider_limits)
+        parallel_rounds: Call every model of a round at once; defaults to
+            config.PARALLEL_ROUNDS
+        on_event: Optional function called as on_event(event, data) as the
+            discussion progresses: "round_start", "token" and
+            "token_reset" (only when streaming), "turn", "round_end" and
+            "summary"
+        stream: Stream contributions, reporting each piece as a "token"
+            event; "token_reset" withdraws the pieces of a model's
+            contribution reported so far (a retried or replaced call)
+        budget: Budget limiting the discussion's tokens, cost and time;
+            defaults to a new one with the config.BUDGET_* limits
+
+    Returns:
+        Dict with the transcript, per-round votes, summary and timings
+    """
+    if parallel_rounds is None:
+        parallel_rounds = config.PARALLEL_ROUNDS
+    if budget is None:
+        budget = Budget.from_config()
+
+    def emit(event, data):
+        if on_event is not None:
+            on_event(event, data)
+
+    discussion_context = Transcript()
+    context_window = ContextWindow()
+    running_summary = RunningSummary(topic, budget)
+    novelty = NoveltyDetector()
+    rounds = []
+    start = time.perf_counter()
+
+    async def call(model_fn):
+        model_name = CHAT_MODEL_NAMES[model_fn]
+        round_index = len(rounds)
+        context_messages = fit_context(context_window, discussion_context, model_fn)
+        def on_token(text):
+            if text is None:
+                emit("token_reset", {"round": round_index, "model": model_name})
+            else:
+                emit("token", {"round": round_index, "model": model_name, "text": text})
+        call_start = time.perf_counter()
+        result = await chat_with_fallback_async(
+            model_fn, topic, provider_limits,
+            context_messages=context_messages, stream=stream, on_token=on_token if stream else None, budget=budget,
+        )
+        latency = time.perf_counter() - call_start
+        emit("turn", {"round": round_index, **result, "latency": round(latency, 3)})
+        return result, latency
+
+    try:
+        while len(rounds) < config.MAX_DISCUSSION_ROUNDS:
+            round_start = time.perf_counter()
+            discussion_context.start_round()
+            model_functions = randomize_model_order(get_enabled_chat_functions(), round_order_seed(topic, len(rounds)))
+            emit("round_start", {"round": len(rounds), "models": [CHAT_MODEL_NAMES[model_fn] for model_fn in model_functions]})
+            votes = {}
+            errors = {}
+            latencies = {}
+
+            if parallel_rounds and budget is not None and budget.exhausted:
+                outcomes = []
+            elif parallel_rounds:
+                outcomes = await asyncio.gather(*(call(model_fn) for model_fn in model_functions))
+            else:
+                outcomes = []
+                for model_fn in model_functions:
+                    if budget is not None and budget.exhausted:
+                        break
+                    outcome = await call(model_fn)
+                    outcomes.append(outcome)
+                    discussion_context.add(outcome[0].get("model", CHAT_MODEL_NAMES[model_fn]), outcome[0].get("contribution", ""), bool(outcome[0].get("error")))
+
+            for model_fn, (result, latency) in zip(model_functions, outcomes):
+                model_name = result.get("model", CHAT_MODEL_NAMES[model_fn])
+                if parallel_rounds:
+                    discussion_context.add(model_name, result.get("contribution", ""), bool(result.get("error")))
+                if result.get("error"):
+                    # Failed calls do not cast a vote.
+                    errors[model_name] = result["error"]
+                else:
+                    votes[model_name] = bool(result.get("vote", False))
+                latencies[model_name] = round(latency, 3)
+
+            round_seconds = time.perf_counter() - round_start
+            telemetry.record_round(round_seconds, len(rounds), len(outcomes))
+            rounds.append({
+                "votes": votes,
+                "errors": errors,
+                "latencies": latencies,
+                "elapsed": round(round_seconds, 3),
+            })
+            true_votes = sum(1 for vote in votes.values() if vote)
+            continue_discussion = true_votes > len(votes) - true_votes
+            # Stop a discussion that keeps repeating itself, whatever the vote (opt-in).
+            if novelty.should_stop(discussion_context, len(rounds) - 1) and continue_discussion:
+                continue_discussion = False
+                novelty.record_stop(discussion_context, len(rounds), len(model_functions))
+                rounds[-1]["novelty_stop"] = True
+            # End a discussion whose budget is spent with a summary of what was said.
+            budget_spent = budget.exhausted_reason() if budget is not None else None
+            if budget_spent and continue_discussion:
+                continue_discussion = False
+                rounds[-1]["budget_stop"] = budget_spent
+            emit("round_end", {"round": len(rounds) - 1, **rounds[-1], "continue": continue_discussion})
+            if not continue_discussion:
+                break
+            # Summarize the finished round while the next one runs.
+            if len(rounds) < config.MAX_DISCUSSION_ROUNDS:
+                await running_summary.update_async(discussion_context)
+
+        summary_start = time.perf_counter()
+        # Summaries are written by GPT-4o.
+        async with provider_limits[CHAT_PROVIDERS[gpt4o_chat]]:
+            summary = await running_summary.final_async(discussion_context)
+        emit("summary", {"summary": summary})
+    except asyncio.CancelledError:
+        # Do not leave a background summary update running for a cancelled discussion.
+        running_summary.cancel()
+        raise
+
+    telemetry.record_discussion(time.perf_counter() - start, len(rounds))
+    return {
+        "topic": topic,
+        "transcript": discussion_context.to_list(),
+        "rounds": rounds,
+        "summary": summary,
+        "novelty": {
+            "scores": [round(score, 3) for score in novelty.scores],
+            "rounds_saved": novelty.rounds_saved,
+            "tokens_saved": novelty.tokens_saved,
+        },
+        "budget": budget.usage() if budget is not None else None,
+        "timings": {
+            "total": round(time.perf_counter() - start, 3),
+            "summary": round(time.perf_counter() - summary_start, 3),
+        },
+    }
+
+async def run_batch(topics, output, concurrency=None, provider_concurrency=None, parallel_rounds=None):
+    """
+    Runs discussions for (id, topic) pairs and writes a JSONL record to output as each finishes.
+
+    Args:
+        topics: Iterable of (id, topic) pairs
+        output: Writable text file
+        concurrency: Maximum discussions in flight; defaults to config.BATCH_CONCURRENCY
+        provider_concurrency: Maximum in-flight calls per provider; defaults
+            to config.BATCH_PROVIDER_CONCURRENCY
+        parallel_rounds: See run_discussion
+
+    Returns:
+        Number of discussions that failed
+    """
+    concurrency = concurrency or config.BATCH_CONCURRENCY
+    provider_concurrency = provider_concurrency or config.BATCH_PROVIDER_CONCURRENCY
+    discussion_limit = asyncio.Semaphore(concurrency)
+    provider_limits = new_provider_limits(provider_concurrency)
+    failures = 0
+
+    async def one(discussion_id, topic):
+        nonlocal failures
+        async with discussion_limit:
+            try:
+                record = await run_discussion(topic, provider_limits, parallel_rounds)
+            except Exception as e:
+                failures += 1
+                print(f"Discussion {discussion_id} failed: {e}", file=sys.stderr)
+                return
+        output.write(json.dumps({"id": discussion_id, **record}, ensure_ascii=False) + "\n")
+        output.flush()
+
+    # Discussions are started as concurrency frees up, so huge inputs do not
+    # create every task up front.
+    pending = set()
+    for discussion_id, topic in topics:
+        if len(pending) >= concurrency:
+            _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        pending.add(asyncio.ensure_future(one(discussion_id, topic)))
+    if pending:
+        await asyncio.wait(pending)
+
+    for line in governor.summary_lines():
+        print(f"Response length: {line}", file=sys.stderr)
+    await aclose_clients()
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run Neural-Chat discussions for every topic in a JSONL file.")
+    parser.add_argument("input", nargs="?", default="-", help="JSONL file of topics ('-' for stdin)")
+    parser.add_argument("-o", "--output", default="-", help="JSONL file for results ('-' for stdout); resumed if it exists")
+    parser.add_argument("--concurrency", type=int, default=config.BATCH_CONCURRENCY, help="Maximum discussions in flight")
+    parser.add_argument("--provider-concurrency", type=int, default=config.BATCH_PROVIDER_CONCURRENCY, help="Maximum in-flight calls per provider")
+    parser.add_argument("--parallel-rounds", action="store_true", default=config.PARALLEL_ROUNDS, help="Call every model of a round at once")
+    args = parser.parse_args(argv)
+    telemetry.start()
+
+    if args.input == "-":
+        topics = read_topics(sys.stdin)
+    else:
+        with open(args.input, encoding="utf-8") as f:
+            topics = read_topics(f)
+
+    if args.output == "-":
+        output = sys.stdout
+    else:
+        finished = load_finished_ids(args.output)
+        if finished:
+            print(f"Resuming: {len(finished)} discussions already in {args.output}", file=sys.stderr)
+            topics = [(discussion_id, topic) for discussion_id, topic in topics if discussion_id not in finished]
+        output = open(args.output, "a", encoding="utf-8")
+
+    try:
+        failures = asyncio.run(run_batch(topics, output, args.concurrency, args.provider_concurrency, args.parallel_rounds))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+"""
+Import-time benchmark for the CLI entry points.
+
+Runs `python -X importtime -c "import <module>"` in fresh interpreters and
+reports the median total import time of each module plus the slowest
+imports underneath it, so regressions (such as a provider SDK being
+imported eagerly again) show up before they reach a release.
+
+Usage:
+    python benchmarks/bench_import.py [runs] [module ...]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULES = ("main", "models", "batch")
+
+# Imports that should only happen once a provider is actually called
+PROVIDER_SDKS = ("google.generativeai", "grpc", "openai", "anthropic", "pydantic")
+
+def import_times(module):
+    """
+    Imports a module in a fresh interpreter and returns {imported module: cumulative microseconds}.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr}")
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # "import time: <self us> | <cumulative us> | <indented module name>"
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative_us)
+    return times
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    modules = sys.argv[2:] or DEFAULT_MODULES
+
+    for module in modules:
+        samples = [import_times(module) for _ in range(runs)]
+        total = statistics.median(sample[module] for sample in samples)
+        print(f"{module}: {total / 1000:8.1f} ms (median of {runs})")
+
+        last = samples[-1]
+        eager = [name for name in PROVIDER_SDKS if name in last]
+        if eager:
+            print(f"  eagerly imports: {', '.join(eager)}")
+        slowest = sorted((name for name in last if name != module), key=last.get, reverse=True)[:5]
+        for name in slowest:
+            print(f"  {last[name] / 1000:8.1f} ms  {name}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Microbenchmark for per-call system prompt and response validation overhead.
+
+Compares the previous approach (rebuilding the system prompt f-string and
+defining a new Pydantic model class on every call) with what every call does
+now: the cached prompt from prompts.py and parsing.parse_contribution().
+
+Usage:
+    python benchmarks/bench_prompts.py [iterations]
+"""
+
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parsing import parse_contribution
+from prompts import (
+    PARTICIPANT_MODELS,
+    SYSTEM_PROMPT_SUFFIXES,
+    get_default_system_prompt,
+    get_system_prompt,
+)
+
+SAMPLE_REPLY = json.dumps({"contribution": "I agree with GPT-4o, but Claude raises a fair point.", "vote": True})
+
+def uncached_call(model_name):
+    """
+    Per-call work before caching: build the prompt and a fresh response model.
+    """
+    from pydantic import BaseModel
+
+    system_prompt = get_default_system_prompt.__wrapped__(model_name) + SYSTEM_PROMPT_SUFFIXES.get(model_name, "")
+
+    class Response(BaseModel):
+        contribution: str
+        vote: bool
+
+    return system_prompt, Response(**json.loads(SAMPLE_REPLY))
+
+def cached_call(model_name):
+    """
+    Per-call work now: the cached prompt and the reply parsed by parsing.py.
+    """
+    return get_system_prompt(model_name), parse_contribution(model_name, SAMPLE_REPLY)
+
+def bench(fn, iterations):
+    def run():
+        for model_name in PARTICIPANT_MODELS:
+            fn(model_name)
+    calls = iterations * len(PARTICIPANT_MODELS)
+    return min(timeit.repeat(run, number=iterations, repeat=3)) / calls
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    before = bench(uncached_call, iterations)
+    after = bench(cached_call, iterations)
+    print(f"uncached: {before * 1e6:10.1f} us/call")
+    print(f"cached:   {after * 1e6:10.1f} us/call")
+    print(f"speedup:  {before / after:10.1f}x")
+
+if __name__ == "__main__":
+    main()
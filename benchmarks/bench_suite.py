@@ -0,0 +1,444 @@
+"""
+Repeatable benchmarks of the orchestration hot paths, with regression baselines.
+
+Every provider is replaced by an in-process fake client that answers
+instantly with canned replies, so no network, emulator or API key is
+involved and only Neural-Chat's own work is measured:
+
+- context.<participant>.r<N>: building one request for a participant once
+  the transcript holds N rounds (the transcript grows by one entry per call,
+  as in a discussion)
+- parse.<kind>: parsing a clean, fenced or truncated reply
+- summary_prompt.r<N>: summarize_discussion() of an N-round transcript
+- round.r<N>: wall time per round of a full main.main() run of N rounds
+- memory.r<N>: peak traced memory of a main.main() run of N rounds
+- memory.transcript.<layout>: memory held by many finished discussions
+  (transcripts, every participant's rendered view and the round votes), for
+  the slotted Turn layout and, as a reference, the dict-per-turn layout it
+  replaced
+- import.<module>: median time to import an entry point in a fresh
+  interpreter (see bench_import.py), which grows sharply if a provider SDK
+  is imported eagerly again
+
+All results are "lower is better". `run` writes them to a JSON file;
+`compare` checks a result file (or a fresh run) against a baseline and
+exits with status 1 if any benchmark is slower by more than the threshold.
+
+Usage:
+    python benchmarks/bench_suite.py run [-o results.json] [--only PREFIX]
+    python benchmarks/bench_suite.py run --save-baseline
+    python benchmarks/bench_suite.py compare [results.json] [--baseline FILE] [--threshold 0.25]
+"""
+
+import argparse
+import builtins
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Transcript sizes (rounds) measured by the growing-transcript benchmarks
+CONTEXT_ROUNDS = (1, 10, 50)
+MAIN_ROUNDS = (1, 10, 50)
+
+# Fresh interpreters started per entry point by import.*
+IMPORT_RUNS = 9
+
+# Discussions held at once, and rounds per discussion, by memory.transcript.*
+MEMORY_DISCUSSIONS = 200
+MEMORY_ROUNDS = 10
+
+CANNED_CONTRIBUTIONS = [
+    "I agree with GPT-4o's framing, but Claude's caveat about edge cases deserves more attention. "
+    "The evidence so far points both ways, and we should weigh how often each case actually occurs.",
+    "Gemini raised a fair point; I would add that the trade-off depends heavily on scale. "
+    "At small scale the simple approach wins, while at large scale coordination costs dominate.",
+    "I disagree with Grok here. DeepSeek's earlier example shows the opposite effect, "
+    "because the second-order consequences outweigh the immediate gains in that setting.",
+    "Building on what Claude said, we should separate the short-term and long-term impact, "
+    "then ask which of them the original question is really about before concluding.",
+]
+
+PARSE_SAMPLES = {
+    "clean": json.dumps({"contribution": CANNED_CONTRIBUTIONS[0], "vote": True}),
+    "fenced": "Here is my answer:\n```json\n" + json.dumps({"contribution": CANNED_CONTRIBUTIONS[1], "vote": "yes"}) + "\n```",
+    "truncated": '{"contribution": "' + CANNED_CONTRIBUTIONS[2] + '", "vo',
+}
+
+##############################
+# In-process fake providers
+##############################
+
+class _Replies:
+    """
+    Deterministic canned JSON replies, cycling through CANNED_CONTRIBUTIONS.
+    """
+
+    def __init__(self):
+        self._next = itertools.cycle(CANNED_CONTRIBUTIONS)
+
+    def text(self):
+        return json.dumps({"contribution": next(self._next), "vote": True})
+
+def _tokens(value):
+    return len(str(value)) // 4
+
+class _FakeCompletions:
+    def __init__(self, replies):
+        self.replies = replies
+
+    def _completion(self, messages):
+        text = self.replies.text()
+        usage = SimpleNamespace(prompt_tokens=_tokens(messages), completion_tokens=_tokens(text), prompt_tokens_details=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=usage)
+
+    def create(self, model, messages, **params):
+        return self._completion(messages)
+
+class _FakeAsyncCompletions(_FakeCompletions):
+    async def create(self, model, messages, **params):
+        return self._completion(messages)
+
+class _FakeMessages:
+    def __init__(self, replies):
+        self.replies = replies
+
+    def _message(self, messages, system):
+        text = self.replies.text()
+        usage = SimpleNamespace(input_tokens=_tokens(messages) + _tokens(system), output_tokens=_tokens(text))
+        return SimpleNamespace(content=[SimpleNamespace(text=text)], usage=usage)
+
+    def create(self, model, messages, system=None, **params):
+        return self._message(messages, system)
+
+class _FakeAsyncMessages(_FakeMessages):
+    async def create(self, model, messages, system=None, **params):
+        return self._message(messages, system)
+
+class _FakeGeminiModel:
+    def __init__(self, replies):
+        self.replies = replies
+
+    def _response(self, prompt):
+        text = self.replies.text()
+        usage = SimpleNamespace(prompt_token_count=_tokens(prompt), candidates_token_count=_tokens(text))
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+    def generate_content(self, prompt, **options):
+        return self._response(prompt)
+
+    async def generate_content_async(self, prompt, **options):
+        return self._response(prompt)
+
+def install_fake_providers():
+    """
+    Points models.py at the fake clients and turns off everything that touches the disk or network.
+    """
+    import config
+    import models
+
+    config.RESPONSE_CACHE_PATH = None
+    config.SESSION_STORE_PATH = None
+    config.TELEMETRY_ENABLED = False
+    config.ENABLED_MODELS = None
+    config.PARALLEL_ROUNDS = False
+    config.STREAM_RESPONSES = False
+    config.NOVELTY_THRESHOLD = None
+    # Hedging depends on the latencies seen so far, which would make runs differ.
+    config.HEDGE_PERCENTILE = None
+
+    replies = _Replies()
+    sync_clients = {
+        provider: SimpleNamespace(chat=SimpleNamespace(completions=_FakeCompletions(replies)))
+        for provider in ("openai", "xai", "deepseek")
+    }
+    sync_clients["anthropic"] = SimpleNamespace(messages=_FakeMessages(replies))
+    async_clients = {
+        provider: SimpleNamespace(chat=SimpleNamespace(completions=_FakeAsyncCompletions(replies)))
+        for provider in ("openai", "xai", "deepseek")
+    }
+    async_clients["anthropic"] = SimpleNamespace(messages=_FakeAsyncMessages(replies))
+    gemini = _FakeGeminiModel(replies)
+
+    models.get_client = sync_clients.__getitem__
+    models.get_async_client = async_clients.__getitem__
+    models.get_gemini_model = lambda model_id: gemini
+
+##############################
+# Benchmarks
+##############################
+
+def _best(fn, number, repeat=7):
+    # Best of repeat runs of fn() called number times, in seconds per call.
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        timings.append((time.perf_counter() - start) / number)
+    return min(timings)
+
+def _transcript(rounds):
+    from transcript import Transcript
+
+    transcript = Transcript()
+    names = ("GPT-4o", "Gemini", "Grok", "DeepSeek", "Claude")
+    contributions = itertools.cycle(CANNED_CONTRIBUTIONS)
+    for _ in range(rounds):
+        transcript.start_round()
+        for name in names:
+            transcript.add(name, next(contributions))
+    return transcript
+
+def bench_context(results):
+    import models
+
+    builders = {
+        "gpt4o": lambda t: models._gpt4o_messages("Benchmark topic", t),
+        "gemini": lambda t: models._gemini_prompt("Benchmark topic", t),
+        "grok": lambda t: models._grok_messages("Benchmark topic", t),
+        "deepseek": lambda t: models._deepseek_messages("Benchmark topic", t),
+        "claude": lambda t: models._claude_request("Benchmark topic", t),
+    }
+    for rounds in CONTEXT_ROUNDS:
+        for name, build in builders.items():
+            timings = []
+            for _ in range(5):
+                # A fresh N-round transcript per repeat, so every sample is taken at N rounds.
+                transcript = _transcript(rounds)
+                build(transcript)
+                start = time.perf_counter()
+                for _ in range(50):
+                    transcript.add("Grok", CANNED_CONTRIBUTIONS[0])
+                    build(transcript)
+                timings.append((time.perf_counter() - start) / 50)
+            results[f"context.{name}.r{rounds}"] = (min(timings) * 1e6, "us")
+
+def bench_parse(results):
+    from parsing import parse_contribution
+
+    for kind, text in PARSE_SAMPLES.items():
+        results[f"parse.{kind}"] = (_best(lambda: parse_contribution("GPT-4o", text), 2000) * 1e6, "us")
+
+def bench_summary_prompt(results):
+    from models import summarize_discussion
+    from transcript import Transcript
+
+    for rounds in (10, 50):
+        entries = list(_transcript(rounds))
+        # A fresh Transcript each time, so no rendered view is reused.
+        results[f"summary_prompt.r{rounds}"] = (
+            _best(lambda: summarize_discussion(Transcript(entries), "Benchmark topic"), 50) * 1e6, "us")
+
+def _run_main(rounds):
+    import config
+    import main
+
+    config.MAX_DISCUSSION_ROUNDS = rounds
+    random.seed(0)
+    original_input = builtins.input
+    builtins.input = lambda prompt="": "Benchmark topic"
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            main.main()
+    finally:
+        builtins.input = original_input
+
+def bench_main(results):
+    for rounds in MAIN_ROUNDS:
+        _run_main(rounds)
+        results[f"round.r{rounds}"] = (_best(lambda: _run_main(rounds), 1, repeat=3) / rounds * 1e3, "ms")
+
+def bench_memory(results):
+    for rounds in MAIN_ROUNDS:
+        tracemalloc.start()
+        try:
+            _run_main(rounds)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        results[f"memory.r{rounds}"] = (peak / 1024, "KiB")
+
+# Participants of the memory.transcript.* discussions and the format each one renders
+_PARTICIPANT_FORMATS = {
+    "GPT-4o": "chat",
+    "Claude": "anthropic",
+    "Gemini": "text",
+    "Grok": "chat",
+    "DeepSeek": "chat",
+}
+
+def _dict_discussion(contributions):
+    # The dict-per-turn layout: a fresh dict per turn, a decorated copy of
+    # every turn in each participant's view, and a list of votes per round.
+    entries = []
+    views = {name: [] for name in _PARTICIPANT_FORMATS}
+    votes = []
+    for round_contributions in contributions:
+        round_votes = []
+        for model, content in round_contributions:
+            entries.append({"model": model, "content": content})
+            round_votes.append(True)
+            for name, fmt in _PARTICIPANT_FORMATS.items():
+                line = f"YOUR PREVIOUS RESPONSE: {content}" if name == model else f"{model}: {content}"
+                views[name].append(f"\n{line}" if fmt == "text" else {"role": "assistant", "content": line})
+        votes.append(round_votes)
+    texts = {name: "".join(items) for name, items in views.items() if _PARTICIPANT_FORMATS[name] == "text"}
+    return entries, views, texts, votes
+
+def _slotted_discussion(contributions):
+    from transcript import Transcript, RoundVotes
+
+    transcript = Transcript()
+    votes = []
+    for round_contributions in contributions:
+        transcript.start_round()
+        round_votes = RoundVotes()
+        for model, content in round_contributions:
+            transcript.add(model, content)
+            round_votes.append(True)
+            for name, fmt in _PARTICIPANT_FORMATS.items():
+                transcript.render(name, fmt)
+        votes.append(round_votes)
+    return transcript, votes
+
+def _held_memory(build, inputs):
+    # Traced memory still allocated while every built discussion is kept.
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        held = [build(contributions) for contributions in inputs]
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del held
+    return after - before
+
+def bench_transcript_memory(results):
+    names = list(_PARTICIPANT_FORMATS)
+    canned = itertools.cycle(CANNED_CONTRIBUTIONS)
+    # Every contribution is a distinct string, as model replies are; both
+    # layouts are built from the same strings, so only their overhead differs.
+    inputs = [
+        [[(name, f"{next(canned)} ({discussion}.{round_index})") for name in names] for round_index in range(MEMORY_ROUNDS)]
+        for discussion in range(MEMORY_DISCUSSIONS)
+    ]
+    for layout, build in (("dict", _dict_discussion), ("slotted", _slotted_discussion)):
+        results[f"memory.transcript.{layout}"] = (_held_memory(build, inputs) / 1024, "KiB")
+
+def bench_imports(results):
+    from bench_import import DEFAULT_MODULES, import_times
+
+    for module in DEFAULT_MODULES:
+        samples = sorted(import_times(module)[module] for _ in range(IMPORT_RUNS))
+        results[f"import.{module}"] = (samples[len(samples) // 2] / 1000, "ms")
+
+BENCHMARKS = (
+    ("import", bench_imports),
+    ("context", bench_context),
+    ("parse", bench_parse),
+    ("summary_prompt", bench_summary_prompt),
+    ("round", bench_main),
+    ("memory", bench_memory),
+    ("memory.transcript", bench_transcript_memory),
+)
+
+def run_benchmarks(only=None):
+    """
+    Runs the benchmarks whose names start with only (all by default).
+
+    Returns:
+        Dict with the environment and {"name": {"value": ..., "unit": ...}}
+        under "benchmarks"
+    """
+    install_fake_providers()
+    results = {}
+    for prefix, bench in BENCHMARKS:
+        if only and not prefix.startswith(only) and not only.startswith(prefix):
+            continue
+        print(f"Running {prefix} benchmarks...", file=sys.stderr)
+        bench(results)
+    if only:
+        results = {name: value for name, value in results.items() if name.startswith(only)}
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "benchmarks": {name: {"value": round(value, 3), "unit": unit} for name, (value, unit) in sorted(results.items())},
+    }
+
+def compare(baseline, current, threshold):
+    """
+    Prints every benchmark's change against the baseline and returns the names of the regressions.
+    """
+    regressions = []
+    print(f"{'benchmark':<28} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in current["benchmarks"].items():
+        base = baseline["benchmarks"].get(name)
+        if base is None:
+            print(f"{name:<28} {'-':>12} {result['value']:>9.1f} {result['unit']:<3} {'new':>7}")
+            continue
+        change = result["value"] / base["value"] - 1.0 if base["value"] else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<28} {base['value']:>9.1f} {base['unit']:<3} {result['value']:>8.1f} {result['unit']:<3} {change:>+7.1%}{flag}")
+    missing = sorted(set(baseline["benchmarks"]) - set(current["benchmarks"]))
+    if missing:
+        print(f"Not measured this run: {', '.join(missing)}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Neural-Chat orchestration hot paths.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument("-o", "--output", help="JSON file for the results (default: stdout)")
+    run_parser.add_argument("--only", help="Only run benchmarks whose names start with this prefix")
+    run_parser.add_argument("--save-baseline", action="store_true", help=f"Write the results to {os.path.relpath(DEFAULT_BASELINE)}")
+    compare_parser = commands.add_parser("compare", help="Compare results against a baseline")
+    compare_parser.add_argument("results", nargs="?", help="Results JSON file (default: run the benchmarks now)")
+    compare_parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON file")
+    compare_parser.add_argument("--threshold", type=float, default=0.25, help="Slowdown counted as a regression (0.25 = 25%%)")
+    compare_parser.add_argument("--only", help="Only run benchmarks whose names start with this prefix")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        results = run_benchmarks(args.only)
+        text = json.dumps(results, indent=2) + "\n"
+        output = DEFAULT_BASELINE if args.save_baseline else args.output
+        if output:
+            with open(output, "w", encoding="utf-8") as f:
+                f.write(text)
+            print(f"Wrote {len(results['benchmarks'])} results to {output}", file=sys.stderr)
+        else:
+            sys.stdout.write(text)
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if args.results:
+        with open(args.results, encoding="utf-8") as f:
+            current = json.load(f)
+    else:
+        current = run_benchmarks(args.only)
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    print(f"\nNo regressions beyond {args.threshold:.0%}.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""
+Record/replay round-trip check for the response cache.
+
+Records a full main.main() discussion against the local emulator (see
+emulator.py) with RESPONSE_CACHE_MODE = "record", then replays it offline
+with RESPONSE_CACHE_MODE = "replay" in a fresh interpreter, with every
+provider pointed at an address nothing listens on. The check passes if the
+replay makes only recorded requests and prints the same transcript and
+summary.
+
+The discussion runs for more rounds than config.RESPONSE_CAP_MIN_SAMPLES,
+so the length governor adapts each model's output cap during the run and
+the replay has to adapt it the same way.
+
+Usage:
+    python benchmarks/check_replay.py [--rounds N] [--parallel]
+"""
+
+import argparse
+import builtins
+import os
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+TOPIC = "Should cities replace parking minimums with congestion pricing?"
+
+# Nothing listens here, so a replayed request that misses the cache cannot reach a provider
+OFFLINE_URL = "http://127.0.0.1:9"
+
+def _discussion_output(stdout):
+    # The final transcript and summary printed by main.main().
+    start = stdout.find("--- Final Discussion Transcript ---")
+    return stdout[start:] if start != -1 else ""
+
+def run_child(mode, cache_path, rounds, parallel):
+    """
+    Runs one discussion in this process with the given cache mode.
+    """
+    import config
+    from emulator import start_emulator, use_emulator, EmulatorSettings
+
+    config.RESPONSE_CACHE_MODE = mode
+    config.RESPONSE_CACHE_PATH = cache_path
+    config.SESSION_STORE_PATH = None
+    config.MAX_DISCUSSION_ROUNDS = rounds
+    config.PARALLEL_ROUNDS = parallel
+    if mode == "record":
+        # Every reply votes to continue, so the discussion runs all its rounds.
+        server = start_emulator(settings=EmulatorSettings(latency_ms=5, latency_sigma=0.0, vote_true_rate=1.0))
+        use_emulator(server.url)
+    else:
+        use_emulator(OFFLINE_URL)
+    builtins.input = lambda prompt="": TOPIC
+
+    import main
+    main.main()
+
+def run_mode(mode, cache_path, rounds, parallel):
+    # Each mode runs in a fresh interpreter, so no process-wide state
+    # (length governors, clients) carries over from the recording.
+    command = [sys.executable, os.path.abspath(__file__), "--child", mode, "--cache", cache_path, "--rounds", str(rounds)]
+    if parallel:
+        command.append("--parallel")
+    result = subprocess.run(command, cwd=REPO_ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"{mode} run failed:\n{result.stderr[-2000:]}")
+        return None
+    return _discussion_output(result.stdout)
+
+def main():
+    import config
+
+    parser = argparse.ArgumentParser(description="Check that a recorded discussion replays offline.")
+    parser.add_argument("--rounds", type=int, default=config.RESPONSE_CAP_MIN_SAMPLES + 3)
+    parser.add_argument("--parallel", action="store_true", help="run the discussion with PARALLEL_ROUNDS")
+    parser.add_argument("--child", choices=("record", "replay"), help=argparse.SUPPRESS)
+    parser.add_argument("--cache", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.cache, args.rounds, args.parallel)
+        return 0
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache_path = os.path.join(directory, "responses.sqlite3")
+        recorded = run_mode("record", cache_path, args.rounds, args.parallel)
+        if recorded is None:
+            return 1
+        replayed = run_mode("replay", cache_path, args.rounds, args.parallel)
+    if replayed is None:
+        return 1
+    if not recorded or replayed != recorded:
+        print("The replayed discussion differs from the recording.")
+        return 1
+    print(f"Replayed a {args.rounds}-round discussion offline with the recorded transcript and summary.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+"""
+Offline load test: drives the real async *_chat functions against the local
+provider emulator at high concurrency.
+
+Usage:
+    python benchmarks/load_test.py [rounds] [concurrency]
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import emulator
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    server = emulator.start_emulator(settings=emulator.EmulatorSettings(latency_ms=200, seed=0))
+    emulator.use_emulator(server.url)
+
+    from main import run_parallel_round
+    from models import gpt4o_chat, gemini_chat, grok_chat, deepseek_chat, claude_chat
+    from clients import aclose_clients
+    from transcript import Transcript
+
+    model_functions = [gpt4o_chat, gemini_chat, grok_chat, deepseek_chat, claude_chat]
+
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def one_round(topic):
+            async with semaphore:
+                start = time.perf_counter()
+                await run_parallel_round(topic, Transcript(), model_functions)
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one_round(f"Topic {i}") for i in range(rounds)))
+        elapsed = time.perf_counter() - start
+        await aclose_clients()
+        return elapsed, sorted(latencies)
+
+    elapsed, latencies = asyncio.run(run())
+    calls = rounds * len(model_functions)
+    print(f"{rounds} rounds / {calls} calls in {elapsed:.2f}s ({calls / elapsed:.1f} calls/s)")
+    print(f"round latency p50={latencies[len(latencies) // 2]:.3f}s p95={latencies[int(len(latencies) * 0.95)]:.3f}s")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Per-discussion spending limits for Neural-Chat.
+
+A Budget is created for each discussion and passed to every *_chat call.
+It tracks the input and output tokens, estimated dollars (from
+config.MODEL_PRICES) and wall-clock time a discussion has used. Each call's
+output is capped to what is left, a call is refused once the budget is
+spent, and main.py and batch mode then end the discussion and summarize
+what was said so far.
+
+Part of the budget is held back for the final summary (see
+config.BUDGET_SUMMARY_RESERVE_TOKENS): discussion turns stop when only the
+reserve is left, while summary calls may use it.
+"""
+
+import threading
+import time
+
+import config
+from ratelimit import ProviderError
+from telemetry import estimate_cost
+
+class BudgetExceededError(ProviderError):
+    """
+    Raised instead of making a call once the discussion's budget is spent.
+    """
+
+class Budget:
+    """
+    Token, cost and time limits of one discussion and what has been spent.
+
+    Args:
+        input_tokens: Maximum input tokens, or None for no limit
+        output_tokens: Maximum output tokens, or None for no limit
+        cost: Maximum estimated spend in US dollars, or None for no limit
+        seconds: Wall-clock seconds from now until the deadline, or None
+        reserve_output_tokens: Output tokens held back for the final summary;
+            defaults to config.BUDGET_SUMMARY_RESERVE_TOKENS
+    """
+
+    def __init__(self, input_tokens=None, output_tokens=None, cost=None, seconds=None, reserve_output_tokens=None):
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.cost = cost
+        self.deadline = time.monotonic() + seconds if seconds is not None else None
+        self.reserve_output_tokens = (config.BUDGET_SUMMARY_RESERVE_TOKENS
+                                      if reserve_output_tokens is None else reserve_output_tokens)
+        self.spent_input_tokens = 0
+        self.spent_output_tokens = 0
+        self.spent_cost = 0.0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, **overrides):
+        """
+        Returns a Budget with the config.BUDGET_* limits (and any overrides), or None if there are none.
+        """
+        limits = {
+            "input_tokens": config.BUDGET_INPUT_TOKENS,
+            "output_tokens": config.BUDGET_OUTPUT_TOKENS,
+            "cost": config.BUDGET_COST_USD,
+            "seconds": config.BUDGET_SECONDS,
+        }
+        limits.update((name, value) for name, value in overrides.items() if value is not None)
+        if all(value is None for value in limits.values()):
+            return None
+        return cls(**limits)
+
+    def remaining_seconds(self):
+        """
+        Seconds left until the deadline, or None without one.
+        """
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def _remaining_cost(self, reserve):
+        remaining = self.cost - self.spent_cost
+        if reserve:
+            # Enough for the summary's output at the most expensive configured rate
+            prices = [output for _, output in config.MODEL_PRICES.values()]
+            remaining -= self.reserve_output_tokens * max(prices, default=0.0) / 1_000_000
+        return remaining
+
+    def _remaining_output_tokens(self, reserve):
+        remaining = self.output_tokens - self.spent_output_tokens
+        return remaining - self.reserve_output_tokens if reserve else remaining
+
+    def exhausted_reason(self, reserve=True):
+        """
+        Returns why no further discussion turn may be made, or None if one may.
+
+        Args:
+            reserve: Keep the summary reserve; pass False for summary calls
+        """
+        # A reached deadline stops discussion turns, but the summary call may still run.
+        if reserve and self.deadline is not None and time.monotonic() >= self.deadline:
+            return "deadline reached"
+        if self.input_tokens is not None and self.spent_input_tokens >= self.input_tokens:
+            return "input token budget spent"
+        if self.output_tokens is not None and self._remaining_output_tokens(reserve) < config.BUDGET_MIN_CALL_OUTPUT_TOKENS:
+            return "output token budget spent"
+        if self.cost is not None and self._remaining_cost(reserve) <= 0:
+            return "cost budget spent"
+        return None
+
+    @property
+    def exhausted(self):
+        return self.exhausted_reason() is not None
+
+    def _affordable_output_tokens(self, model_id, input_tokens, reserve):
+        # Output tokens the cost budget still pays for at the model's rate, or None.
+        prices = config.MODEL_PRICES.get(model_id)
+        if self.cost is None or prices is None or prices[1] <= 0:
+            return None
+        affordable = self._remaining_cost(reserve) - input_tokens * prices[0] / 1_000_000
+        return int(affordable * 1_000_000 / prices[1])
+
+    def check(self, provider, reserve=True, model_id=None, input_tokens=0):
+        """
+        Raises BudgetExceededError if the budget does not allow another call.
+
+        With model_id, a call whose output the cost budget could only pay for
+        below config.BUDGET_MIN_CALL_OUTPUT_TOKENS is refused too.
+        """
+        reason = self.exhausted_reason(reserve)
+        if reason is None and model_id is not None:
+            affordable = self._affordable_output_tokens(model_id, input_tokens, reserve)
+            if affordable is not None and affordable < config.BUDGET_MIN_CALL_OUTPUT_TOKENS:
+                reason = "cost budget spent"
+        if reason is not None:
+            raise BudgetExceededError(provider, f"Budget exhausted: {reason}")
+
+    def output_cap(self, model_id, input_tokens, default=None, reserve=True):
+        """
+        Returns the most output tokens a call may request, or default if the budget sets no cap.
+
+        The cap is never raised above what is left; check() refuses calls for
+        which too little is left.
+
+        Args:
+            model_id: Provider model id, for pricing
+            input_tokens: Estimated input tokens of the call
+            default: The call's own cap, if any
+            reserve: Keep the summary reserve; pass False for summary calls
+        """
+        caps = [default] if default is not None else []
+        if self.output_tokens is not None:
+            caps.append(self._remaining_output_tokens(reserve))
+        affordable = self._affordable_output_tokens(model_id, input_tokens, reserve)
+        if affordable is not None:
+            caps.append(affordable)
+        if not caps:
+            return None
+        return max(0, min(caps))
+
+    def charge(self, model_id, input_tokens, output_tokens, cached_input_tokens=0):
+        """
+        Adds a finished call's usage to what has been spent.
+        """
+        cost = estimate_cost(model_id, input_tokens or 0, output_tokens or 0, cached_input_tokens)
+        with self._lock:
+            self.spent_input_tokens += input_tokens or 0
+            self.spent_output_tokens += output_tokens or 0
+            self.spent_cost += cost or 0.0
+            self.calls += 1
+
+    def usage(self):
+        """
+        Returns what has been spent, as a JSON-serialisable dict.
+        """
+        return {
+            "calls": self.calls,
+            "input_tokens": self.spent_input_tokens,
+            "output_tokens": self.spent_output_tokens,
+            "cost_usd": round(self.spent_cost, 6),
+        }
+
+    def describe(self):
+        """
+        Returns a one-line summary of what was spent against the limits.
+        """
+        parts = []
+        for label, spent, limit in (("input tokens", self.spent_input_tokens, self.input_tokens),
+                                    ("output tokens", self.spent_output_tokens, self.output_tokens)):
+            parts.append(f"{spent}" + (f"/{limit}" if limit is not None else "") + f" {label}")
+        parts.append(f"${self.spent_cost:.4f}" + (f"/${self.cost:.2f}" if self.cost is not None else ""))
+        if self.deadline is not None:
+            parts.append(f"{self.remaining_seconds():.1f}s left")
+        return f"{self.calls} calls, " + ", ".join(parts)
+
+def with_output_cap(params, budget, model_id, input_tokens, name="max_tokens", reserve=True):
+    """
+    Returns params with its output token limit (params[name]) lowered to what budget allows.
+
+    params itself is not modified; without a budget it is returned unchanged.
+    """
+    if budget is None:
+        return params
+    cap = budget.output_cap(model_id, input_tokens, params.get(name), reserve)
+    if cap is None:
+        return params
+    return dict(params, **{name: cap})
@@ -0,0 +1,189 @@
+"""
+Content-addressed, disk-backed cache of provider responses for Neural-Chat.
+
+Responses are keyed on a hash of (provider, model id, rendered messages,
+generation params) and stored in a local SQLite file with size-bounded LRU
+eviction. config.RESPONSE_CACHE_MODE selects how provider calls use it:
+
+- "passthrough": the cache is not used at all
+- "record": cached responses are served, misses call the provider and are stored
+- "replay": cached responses are served, misses raise CacheMissError, so whole
+  discussions can be re-run offline and deterministically
+
+The params hashed into a key include the length governor's output cap
+(governor.py). Replies served from the cache are reported to the governor
+like fresh ones, so a replay adapts the caps exactly as the recording did
+and asks for the same keys. A reply whose cap was lowered further by the
+discussion's budget is not stored, since the budget is only charged for
+real calls and would not lower the cap the same way on replay.
+
+A CacheMissError is not turned into an error turn by the chat functions: it
+stops the discussion, since the replay no longer matches the recording.
+While recording or replaying, each round's model order is seeded from the
+topic and round (see main.round_order_seed).
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+import config
+
+PASSTHROUGH = "passthrough"
+RECORD = "record"
+REPLAY = "replay"
+CACHE_MODES = (PASSTHROUGH, RECORD, REPLAY)
+
+class CacheMissError(Exception):
+    """
+    Raised in replay mode when a request has no recorded response.
+    """
+
+class ResponseCache:
+    """
+    SQLite-backed response store with least-recently-used eviction.
+
+    Args:
+        path: SQLite database file
+        max_bytes: Upper bound on the total size of stored responses
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(provider, model_id, messages, params=None):
+        """
+        Returns the content hash identifying a provider request.
+        """
+        payload = json.dumps([provider, model_id, messages, params or {}], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Returns the stored value for key (marking it recently used), or None.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        """
+        Stores a JSON-serialisable value, evicting old entries if over budget.
+        """
+        data = json.dumps(value)
+        size = len(data.encode("utf-8"))
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, data, size, time.time()),
+            )
+            self._total_bytes += size - (old[0] if old else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Drop least recently used entries until the cache fits its budget again.
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall()
+        evicted = []
+        for key, size in rows:
+            if self._total_bytes <= self.max_bytes:
+                break
+            evicted.append((key,))
+            self._total_bytes -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """
+    Returns the process-wide ResponseCache for the current config, or None in passthrough mode.
+    """
+    global _cache
+    mode = config.RESPONSE_CACHE_MODE
+    if mode not in CACHE_MODES:
+        raise ValueError(f"Unknown RESPONSE_CACHE_MODE: {mode}")
+    if mode == PASSTHROUGH:
+        return None
+    with _cache_lock:
+        if _cache is None or _cache.path != config.RESPONSE_CACHE_PATH:
+            if _cache is not None:
+                _cache.close()
+            _cache = ResponseCache(config.RESPONSE_CACHE_PATH, config.RESPONSE_CACHE_MAX_BYTES)
+        _cache.max_bytes = config.RESPONSE_CACHE_MAX_BYTES
+        return _cache
+
+def _lookup(provider, model_id, messages, params):
+    cache = get_response_cache()
+    if cache is None:
+        return None, None, None
+    key = cache.make_key(provider, model_id, messages, params)
+    value = cache.get(key)
+    if value is None and config.RESPONSE_CACHE_MODE == REPLAY:
+        raise CacheMissError(f"No recorded {provider} response for {model_id} (key {key[:12]})")
+    return cache, key, value
+
+def cached_call(provider, model_id, messages, params, call, store=True, on_hit=None):
+    """
+    Returns the cached result for a provider request, or calls call() to produce it.
+
+    Args:
+        provider: Provider identifier, e.g. "openai"
+        model_id: Provider model id
+        messages: Rendered messages or prompt sent to the provider
+        params: Other generation parameters that affect the response
+        call: Zero-argument function making the request and returning a JSON-serialisable result
+        store: Whether a result produced by call() may be stored; pass False
+            when the request actually sent differs from params
+        on_hit: Optional function called with a result served from the cache
+    """
+    cache, key, value = _lookup(provider, model_id, messages, params)
+    if value is not None:
+        if on_hit is not None:
+            on_hit(value)
+        return value
+    result = call()
+    # Failed calls and unusable replies are not stored, so they are retried next time.
+    if cache is not None and store and not result.get("error"):
+        cache.put(key, result)
+    return result
+
+async def cached_call_async(provider, model_id, messages, params, call, store=True, on_hit=None):
+    """
+    Async variant of cached_call; call() must return an awaitable.
+    """
+    cache, key, value = _lookup(provider, model_id, messages, params)
+    if value is not None:
+        if on_hit is not None:
+            on_hit(value)
+        return value
+    result = await call()
+    # Failed calls and unusable replies are not stored, so they are retried next time.
+    if cache is not None and store and not result.get("error"):
+        cache.put(key, result)
+    return result
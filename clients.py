@@ -0,0 +1,212 @@
+"""
+Process-wide pool of provider SDK clients for Neural-Chat.
+
+Clients are created lazily on first use and then shared by every call, so
+HTTP keep-alive connections, TLS sessions and gRPC channels stay warm across
+turns and discussions. Async clients are bound to the event loop that created
+them and are kept per loop.
+"""
+
+import atexit
+import asyncio
+import importlib
+import os
+import platform
+import threading
+import weakref
+
+import config
+from hedging import call_deadline
+from api_keys import (
+    get_openai_api_key,
+    get_gemini_api_key,
+    get_xai_api_key,
+    get_deepseek_api_key,
+    get_anthropic_api_key,
+)
+
+# OpenAI-compatible providers: provider -> (api key getter, config attribute holding the base URL)
+OPENAI_COMPATIBLE_PROVIDERS = {
+    "openai": (get_openai_api_key, "OPENAI_BASE_URL"),
+    "xai": (get_xai_api_key, "XAI_BASE_URL"),
+    "deepseek": (get_deepseek_api_key, "DEEPSEEK_BASE_URL"),
+}
+
+_lock = threading.RLock()
+_clients = {}
+_async_clients = weakref.WeakKeyDictionary()
+_gemini_models = {}
+
+def _http_client(client_class):
+    # Builds the SDK's own default httpx client with pooled connection limits.
+    # The SDKs reject clients from a different httpx package (newer releases
+    # use httpx2), so the limits come from the package the client is built on.
+    httpx = importlib.import_module(client_class.__mro__[1].__module__.split(".")[0])
+    return client_class(limits=httpx.Limits(
+        max_connections=config.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY,
+    ))
+
+def _timeout_options(provider):
+    # The SDK's own request timeout, so a call abandoned at its deadline
+    # (see hedging.py) does not run on.
+    deadline = call_deadline(provider)
+    return {"timeout": deadline} if deadline is not None else {}
+
+def _create_client(provider):
+    if provider in OPENAI_COMPATIBLE_PROVIDERS:
+        from openai import DefaultHttpxClient, OpenAI
+
+        get_key, base_url_setting = OPENAI_COMPATIBLE_PROVIDERS[provider]
+        return OpenAI(
+            api_key=get_key(),
+            base_url=getattr(config, base_url_setting),
+            http_client=_http_client(DefaultHttpxClient),
+            # Retries are handled by ratelimit.py with the provider's limiter.
+            max_retries=0,
+            **_timeout_options(provider),
+        )
+    if provider == "anthropic":
+        import anthropic
+
+        return anthropic.Anthropic(
+            api_key=get_anthropic_api_key(),
+            base_url=config.ANTHROPIC_BASE_URL,
+            http_client=_http_client(anthropic.DefaultHttpxClient),
+            # Retries are handled by ratelimit.py with the provider's limiter.
+            max_retries=0,
+            **_timeout_options(provider),
+        )
+    raise ValueError(f"Unknown provider: {provider}")
+
+def _create_async_client(provider):
+    if provider in OPENAI_COMPATIBLE_PROVIDERS:
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+        get_key, base_url_setting = OPENAI_COMPATIBLE_PROVIDERS[provider]
+        return AsyncOpenAI(
+            api_key=get_key(),
+            base_url=getattr(config, base_url_setting),
+            http_client=_http_client(DefaultAsyncHttpxClient),
+            max_retries=0,
+            **_timeout_options(provider),
+        )
+    if provider == "anthropic":
+        import anthropic
+
+        return anthropic.AsyncAnthropic(
+            api_key=get_anthropic_api_key(),
+            base_url=config.ANTHROPIC_BASE_URL,
+            http_client=_http_client(anthropic.DefaultAsyncHttpxClient),
+            max_retries=0,
+            **_timeout_options(provider),
+        )
+    raise ValueError(f"Unknown provider: {provider}")
+
+def get_client(provider):
+    """
+    Returns the shared blocking client for a provider, creating it on first use.
+
+    Args:
+        provider: One of "openai", "xai", "deepseek" or "anthropic"
+    """
+    client = _clients.get(provider)
+    if client is None:
+        with _lock:
+            client = _clients.get(provider)
+            if client is None:
+                client = _clients[provider] = _create_client(provider)
+    return client
+
+def get_async_client(provider):
+    """
+    Returns the async client for a provider bound to the running event loop.
+
+    Must be called from inside a coroutine. Each event loop gets its own
+    client because async connection pools cannot be shared between loops.
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        loop_clients = _async_clients.setdefault(loop, {})
+        client = loop_clients.get(provider)
+        if client is None:
+            client = loop_clients[provider] = _create_async_client(provider)
+    return client
+
+def _import_genai():
+    # gRPC reads these when it is first imported, so they are set just before
+    # the Gemini SDK loads rather than for every process.
+    os.environ["GRPC_ENABLE_FORK_SUPPORT"] = "false"
+    if platform.system() == "Linux":
+        os.environ["GRPC_POLL_STRATEGY"] = "epoll1"
+    else:
+        # For macOS, use a different polling strategy
+        os.environ["GRPC_POLL_STRATEGY"] = "poll"
+
+    import google.generativeai as genai
+
+    return genai
+
+def get_gemini_model(model_id="gemini-2.0-flash"):
+    """
+    Returns a shared Gemini GenerativeModel, configuring the SDK once per process.
+    """
+    model = _gemini_models.get(model_id)
+    if model is None:
+        with _lock:
+            model = _gemini_models.get(model_id)
+            if model is None:
+                genai = _import_genai()
+
+                if not _gemini_models:
+                    options = {}
+                    if config.GEMINI_API_ENDPOINT:
+                        options["client_options"] = {"api_endpoint": config.GEMINI_API_ENDPOINT}
+                    if config.GEMINI_TRANSPORT:
+                        options["transport"] = config.GEMINI_TRANSPORT
+                    genai.configure(api_key=get_gemini_api_key(), **options)
+                model = _gemini_models[model_id] = genai.GenerativeModel(model_id)
+    return model
+
+async def aclose_clients():
+    """
+    Closes the async clients bound to the running event loop.
+
+    Call this before closing a loop that made provider calls.
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        loop_clients = _async_clients.pop(loop, {})
+    for client in loop_clients.values():
+        try:
+            await client.close()
+        except Exception as e:
+            print(f"Error closing async client: {e}")
+
+def close_clients():
+    """
+    Closes every blocking client and tears down outstanding gRPC state.
+
+    Registered to run at interpreter exit.
+    """
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+        had_gemini = bool(_gemini_models)
+        _gemini_models.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception as e:
+            print(f"Error closing client: {e}")
+
+    if had_gemini:
+        # Force cleanup of any outstanding gRPC connections
+        try:
+            import grpc
+            grpc.experimental.aio.shutdown_asyncio_engine()
+        except (ImportError, AttributeError):
+            pass
+
+atexit.register(close_clients)
@@ -5,4 +5,230 @@ Configuration settings for Neural-Chat
 # Length of model responses in discussion (in words)
 MAX_DISCUSSION_ROUNDS = 6
 
-RESPONSE_LENGTH = 30
\ No newline at end of file
+RESPONSE_LENGTH = 30
+
+# Response-length governor (governor.py): RESPONSE_LENGTH is enforced as an
+# output token cap on every discussion call. The cap starts at
+# RESPONSE_CAP_FACTOR times the target, then follows each model's replies:
+# RESPONSE_CAP_PERCENTILE of its recent lengths times RESPONSE_CAP_MARGIN,
+# kept between RESPONSE_CAP_MIN_FACTOR and RESPONSE_CAP_MAX_FACTOR times the
+# target. None for RESPONSE_CAP_FACTOR leaves replies uncapped.
+RESPONSE_CAP_FACTOR = 2.0
+RESPONSE_CAP_MIN_FACTOR = 1.3
+RESPONSE_CAP_MAX_FACTOR = 3.0
+RESPONSE_CAP_PERCENTILE = 90
+RESPONSE_CAP_MARGIN = 1.2
+# Recent replies per model the cap follows, and how many before it adapts
+RESPONSE_CAP_WINDOW = 50
+RESPONSE_CAP_MIN_SAMPLES = 5
+# A reply cut off by its cap counts as this much longer than the cap
+RESPONSE_CAP_GROWTH = 1.25
+# Output tokens per word of contribution, plus the tokens of the JSON around it
+RESPONSE_TOKENS_PER_WORD = 1.4
+RESPONSE_JSON_OVERHEAD_TOKENS = 20
+
+# When True, every model in a round answers concurrently against the same
+# snapshot of the discussion; results are merged in the round's model order.
+PARALLEL_ROUNDS = False
+
+# Connection pool limits for the shared provider HTTP clients (see clients.py)
+HTTP_MAX_CONNECTIONS = 20
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 10
+# Seconds an idle keep-alive connection is kept open
+HTTP_KEEPALIVE_EXPIRY = 30.0
+
+# Response cache (see cache.py): "passthrough" disables it, "record" serves
+# cached responses and stores new ones, "replay" serves cached responses only
+# and fails on a miss, for offline and deterministic re-runs. In both record
+# and replay mode the model order of each round is fixed by the topic.
+RESPONSE_CACHE_MODE = "passthrough"
+RESPONSE_CACHE_PATH = ".neural_chat_cache.sqlite3"
+# Least recently used responses are evicted beyond this size
+RESPONSE_CACHE_MAX_BYTES = 100 * 1024 * 1024
+
+# Provider endpoints. None uses the SDK default; point these at a local
+# emulator (see emulator.py) to run discussions without network access.
+OPENAI_BASE_URL = None
+XAI_BASE_URL = "https://api.x.ai/v1"
+DEEPSEEK_BASE_URL = "https://api.deepseek.com"
+ANTHROPIC_BASE_URL = None
+GEMINI_API_ENDPOINT = None
+# Gemini transport: None (gRPC) or "rest"; the emulator only speaks "rest"
+GEMINI_TRANSPORT = None
+
+# When True (and PARALLEL_ROUNDS is False), contributions are streamed and
+# printed token by token as each model generates them.
+STREAM_RESPONSES = False
+
+# Token budget for the discussion history sent to each model (see
+# context_window.py). None sends the full history; over budget, the oldest
+# rounds are folded into short local summaries.
+CONTEXT_TOKEN_BUDGET = None
+# Per-model overrides of CONTEXT_TOKEN_BUDGET, e.g. {"Claude": 4000}
+CONTEXT_TOKEN_BUDGETS = {}
+# Most recent rounds that are always sent verbatim
+CONTEXT_KEEP_RECENT_ROUNDS = 2
+# Words kept from each contribution in a round summary
+CONTEXT_SUMMARY_WORDS = 20
+# Share of the budget left free when old rounds are folded, so the folded
+# history keeps the same (provider-cacheable) prefix for the next rounds
+CONTEXT_REFOLD_HEADROOM = 0.25
+
+# Batch mode (batch.py): maximum discussions in flight and maximum
+# in-flight calls to each provider across all of them
+BATCH_CONCURRENCY = 8
+BATCH_PROVIDER_CONCURRENCY = 4
+
+# Worker pool (pool.py): a durable SQLite queue of topics worked off by
+# several processes, each running up to POOL_WORKER_CONCURRENCY discussions
+# with its own clients and up to POOL_PROVIDER_CONCURRENCY calls per provider.
+# None for POOL_WORKERS starts one worker per CPU core.
+POOL_QUEUE_PATH = "neural_chat_queue.sqlite3"
+POOL_WORKERS = None
+POOL_WORKER_CONCURRENCY = BATCH_CONCURRENCY
+POOL_PROVIDER_CONCURRENCY = BATCH_PROVIDER_CONCURRENCY
+# A job whose worker sends no heartbeat for POOL_LEASE_SECONDS goes back to
+# the queue; after POOL_MAX_ATTEMPTS leases it is marked failed
+POOL_LEASE_SECONDS = 120
+POOL_HEARTBEAT_SECONDS = 20
+POOL_MAX_ATTEMPTS = 3
+# Seconds between queue polls of idle workers and the supervisor, and between progress reports
+POOL_POLL_SECONDS = 1.0
+POOL_PROGRESS_SECONDS = 10
+# SQLite journal mode of the queue file. WAL needs every worker on one host;
+# use "DELETE" for a queue shared by several hosts over a filesystem with working locks.
+POOL_QUEUE_JOURNAL_MODE = "WAL"
+
+# Provider rate limits enforced by ratelimit.py. rpm/tpm are requests and
+# tokens per minute (None for no limit); the concurrency limit starts at
+# max_concurrency, halves on every 429 and grows back while calls succeed.
+RATE_LIMIT_DEFAULTS = {"rpm": None, "tpm": None, "max_concurrency": 16, "min_concurrency": 1}
+# Per-provider overrides, e.g. {"openai": {"rpm": 500, "tpm": 30000}}
+RATE_LIMITS = {}
+# Attempts per call (including the first) for rate limits and transient errors
+RETRY_MAX_ATTEMPTS = 4
+# Exponential backoff base and cap in seconds; Retry-After always wins if longer
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 20.0
+
+# Skip (or, with PARALLEL_ROUNDS, cancel) the remaining model calls of a round
+# once enough stop votes are in that the discussion is certain to end:
+# None (off), "final_round" (only in the last allowed round) or "always"
+QUORUM_SHORT_CIRCUIT = None
+
+# Participants that take part in discussions, by display name
+# ("GPT-4o", "Gemini", "Grok", "DeepSeek", "Claude"); None enables all.
+# A disabled provider's SDK is never imported.
+ENABLED_MODELS = None
+
+# Telemetry (telemetry.py): per-call spans with queue/network/parse/retry
+# time, token usage and cost, plus round and discussion latency histograms
+TELEMETRY_ENABLED = False
+# JSON-lines file every span, round and discussion is appended to (None to disable)
+TELEMETRY_JSONL_PATH = "neural_chat_telemetry.jsonl"
+# Prometheus exports: a node-exporter textfile and/or a local /metrics port
+TELEMETRY_PROMETHEUS_TEXTFILE = None
+TELEMETRY_PROMETHEUS_PORT = None
+# US dollars per million (input, output) tokens, for cost estimates
+MODEL_PRICES = {
+    "gpt-4o-2024-08-06": (2.50, 10.00),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "grok-2-latest": (2.00, 10.00),
+    "deepseek-chat": (0.27, 1.10),
+    "claude-3-5-haiku-20241022": (0.80, 4.00),
+}
+# US dollars per million input tokens read from the provider's prompt cache
+# (models missing here pay the full input price)
+CACHED_INPUT_PRICES = {
+    "gpt-4o-2024-08-06": 1.25,
+    "gemini-2.0-flash": 0.025,
+    "deepseek-chat": 0.07,
+    "claude-3-5-haiku-20241022": 0.08,
+}
+
+# Provider prompt caching. OpenAI, xAI, DeepSeek and Gemini cache repeated
+# request prefixes automatically; every request is laid out as system prompt,
+# then the append-only history, then the topic, so the prefix only grows.
+# Anthropic needs explicit breakpoints, set on the system prompt and the end
+# of the history when this is enabled.
+ANTHROPIC_PROMPT_CACHING = True
+
+# Durable session store (sessions.py): every turn, vote and round outcome is
+# committed as it happens so `python main.py --resume <id>` can continue an
+# interrupted discussion without repeating model calls. None disables it.
+SESSION_STORE_PATH = ".neural_chat_sessions.sqlite3"
+# Memory map size used by sessions.scan_turns() when reading large archives
+SESSION_SCAN_MMAP_BYTES = 256 * 1024 * 1024
+
+# Response parsing (parsing.py): replies that cannot be repaired locally are
+# re-sent to the model with a short request to restate them as JSON, this
+# many times, before the reply is kept without a vote
+PARSE_REASK_ATTEMPTS = 1
+# Output token cap for each re-ask request (never above the original call's cap)
+PARSE_REASK_MAX_TOKENS = 512
+# Vote counted for a reply cut off before its vote (see RESPONSE_CAP_*);
+# cut-off replies are kept as they are instead of being re-asked
+TRUNCATED_REPLY_VOTE = True
+
+# Summarization (summarizer.py): each finished round is folded into a running
+# summary in the background, so the final summary is a short request
+RUNNING_SUMMARY_MAX_TOKENS = 400
+FINAL_SUMMARY_MAX_TOKENS = 800
+# Background threads shared by the running summaries of the terminal app
+SUMMARY_WORKERS = 2
+
+# HTTP server mode (server.py): one process hosting many discussions that
+# share provider clients and rate limiters
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8080
+# Discussions running at once; further ones are queued
+SERVER_MAX_ACTIVE = 200
+# In-flight calls per provider across all hosted discussions
+SERVER_PROVIDER_CONCURRENCY = 32
+# Ended discussions kept in memory for GET requests and late event streams
+SERVER_MAX_FINISHED = 1000
+# Seconds between keepalive comments on an idle event stream
+SERVER_SSE_KEEPALIVE = 15
+
+# Novelty-based early stopping (novelty.py, needs NumPy): a round whose
+# contributions mostly repeat earlier rounds (TF-IDF similarity, computed
+# locally) has low novelty. Below NOVELTY_THRESHOLD for NOVELTY_PATIENCE
+# consecutive rounds, the discussion stops even if the vote says to continue.
+# None disables it; around 0.3 catches paraphrased repetition.
+NOVELTY_THRESHOLD = None
+NOVELTY_PATIENCE = 1
+
+# Per-discussion budget (budget.py): limits on input tokens, output tokens,
+# estimated cost (from MODEL_PRICES) and wall-clock seconds. Each call's
+# output is capped to what is left, and once a limit is reached the
+# discussion ends with a summary of what was said. None means no limit.
+BUDGET_INPUT_TOKENS = None
+BUDGET_OUTPUT_TOKENS = None
+BUDGET_COST_USD = None
+BUDGET_SECONDS = None
+# Output tokens held back from discussion turns for the final summary
+BUDGET_SUMMARY_RESERVE_TOKENS = FINAL_SUMMARY_MAX_TOKENS
+# Smallest output cap worth making a call with; below it the budget counts as spent
+BUDGET_MIN_CALL_OUTPUT_TOKENS = 64
+
+# Per-call deadlines (hedging.py): seconds a model call may take, retries
+# included, before it fails so the round can go on. Per provider ("openai",
+# "gemini", "xai", "deepseek", "anthropic"), else the default; None for no deadline.
+CALL_DEADLINE_DEFAULT = 60
+CALL_DEADLINES = {}
+# Hedged requests: once a call has run longer than this percentile of its
+# provider's recent latencies, a duplicate request is sent and the first
+# answer wins. None disables hedging.
+HEDGE_PERCENTILE = 95
+# Recent successful calls per provider the percentile is taken over, and
+# how many must have been seen before calls are hedged
+HEDGE_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+# Never hedge a call sooner than this many seconds after it started
+HEDGE_MIN_DELAY = 1.0
+# Threads running blocking calls under a deadline
+CALL_WORKERS = 16
+# Fallback participants: when a participant's call fails or misses its
+# deadline, the model named here answers in its place, prompted as that
+# participant, e.g. {"Gemini": "GPT-4o"}
+FALLBACK_MODELS = {}
@@ -0,0 +1,160 @@
+"""
+Token-budgeted context windows for Neural-Chat.
+
+Without a budget every participant receives the full discussion history, so
+input tokens grow quadratically with the number of rounds. A ContextWindow
+sits between main.main() and the *_chat functions: when the history sent to
+a participant would exceed that participant's token budget, the oldest
+completed rounds are folded into compact per-round summaries while the most
+recent rounds are kept verbatim. Summaries are produced locally (no model
+calls) and computed once per round.
+
+Folding changes the start of the history, which invalidates the providers'
+prompt caches for that participant. So once rounds have to be folded, enough
+are folded to leave config.CONTEXT_REFOLD_HEADROOM of the budget free, and
+that fold is kept while it still fits: the compacted history then only grows
+at its end for the next few rounds, and its prefix stays cacheable.
+"""
+
+import re
+
+import config
+from transcript import Transcript, Turn
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+def estimate_tokens(text):
+    """
+    Fast local token estimate (about four characters per token).
+    """
+    return (len(text) + 3) // 4
+
+def _entry_text(entry):
+    if isinstance(entry, Turn):
+        return f"{entry.model}: {entry.content}"
+    if isinstance(entry, dict):
+        label = entry.get("model") or entry.get("role") or ""
+        return f"{label}: {entry.get('content', '')}"
+    return str(entry)
+
+def _compact(content, max_words):
+    # Keep the first sentence, capped at max_words.
+    first = _SENTENCE_END.split(content.strip(), 1)[0]
+    words = first.split()
+    if len(words) > max_words:
+        return " ".join(words[:max_words]) + " ..."
+    return first
+
+class ContextWindow:
+    """
+    Fits one discussion's transcript into per-participant token budgets.
+
+    Args:
+        budgets: Mapping of participant name to token budget (None for no
+            limit); defaults to config.CONTEXT_TOKEN_BUDGETS
+        default_budget: Budget for participants missing from budgets;
+            defaults to config.CONTEXT_TOKEN_BUDGET
+        keep_recent_rounds: Number of most recent rounds always kept verbatim
+        summary_words: Maximum words kept from each contribution in a summary
+        refold_headroom: Share of the budget left free when rounds are folded
+    """
+
+    def __init__(self, budgets=None, default_budget=None, keep_recent_rounds=None, summary_words=None, refold_headroom=None):
+        self.budgets = dict(config.CONTEXT_TOKEN_BUDGETS if budgets is None else budgets)
+        self.default_budget = config.CONTEXT_TOKEN_BUDGET if default_budget is None else default_budget
+        self.keep_recent_rounds = config.CONTEXT_KEEP_RECENT_ROUNDS if keep_recent_rounds is None else keep_recent_rounds
+        self.summary_words = config.CONTEXT_SUMMARY_WORDS if summary_words is None else summary_words
+        self.refold_headroom = config.CONTEXT_REFOLD_HEADROOM if refold_headroom is None else refold_headroom
+
+        self._token_prefix = [0]   # cumulative token estimate of transcript entries
+        self._summaries = []       # (summary entry, token estimate) per folded round
+        self._compacted = {}       # participant -> (folded rounds, source length, Transcript)
+
+        self.calls = 0
+        self.compacted_calls = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+
+    @property
+    def tokens_saved(self):
+        return self.tokens_in - self.tokens_out
+
+    def budget_for(self, participant):
+        return self.budgets.get(participant, self.default_budget)
+
+    def _count(self, transcript):
+        for entry in transcript[len(self._token_prefix) - 1:]:
+            self._token_prefix.append(self._token_prefix[-1] + estimate_tokens(_entry_text(entry)))
+
+    def _summary(self, transcript, round_index):
+        while len(self._summaries) <= round_index:
+            index = len(self._summaries)
+            start, end = transcript.round_bounds(index)
+            parts = []
+            for entry in transcript[start:end]:
+                if isinstance(entry, (Turn, dict)) and 'model' in entry:
+                    parts.append(f"{entry['model']}: {_compact(entry.get('content', ''), self.summary_words)}")
+            summary = f"Summary of round {index + 1}: " + " | ".join(parts)
+            self._summaries.append((summary, estimate_tokens(summary)))
+        return self._summaries[round_index]
+
+    def fit(self, transcript, participant):
+        """
+        Returns the context to send to a participant.
+
+        This is the transcript itself when it fits the participant's budget,
+        otherwise a Transcript in which the oldest rounds are replaced by
+        summaries. Compacted transcripts are cached and extended
+        incrementally while the number of folded rounds stays the same.
+        """
+        self._count(transcript)
+        full_tokens = self._token_prefix[len(transcript)]
+        self.calls += 1
+        self.tokens_in += full_tokens
+
+        budget = self.budget_for(participant)
+        foldable = transcript.round_count - max(self.keep_recent_rounds, 1)
+        if budget is None or full_tokens <= budget or foldable <= 0:
+            self.tokens_out += full_tokens
+            return transcript
+
+        def sent_tokens(folded):
+            start = transcript.round_bounds(folded)[0]
+            return sum(self._summary(transcript, i)[1] for i in range(folded)) + full_tokens - self._token_prefix[start]
+
+        cached = self._compacted.get(participant)
+        if cached is not None and cached[0] <= foldable and sent_tokens(cached[0]) <= budget:
+            # The previous fold still fits: keep the history's prefix unchanged.
+            folded = cached[0]
+        else:
+            # Fold the fewest old rounds that bring the history under budget, with headroom.
+            target = budget * (1.0 - self.refold_headroom)
+            folded = foldable
+            summary_tokens = 0
+            for k in range(1, foldable + 1):
+                summary_tokens += self._summary(transcript, k - 1)[1]
+                start = transcript.round_bounds(k)[0]
+                if summary_tokens + full_tokens - self._token_prefix[start] <= target:
+                    folded = k
+                    break
+
+        start = transcript.round_bounds(folded)[0]
+        sent = sent_tokens(folded)
+        if sent >= full_tokens:
+            # Contributions are already shorter than their summaries.
+            self.tokens_out += full_tokens
+            return transcript
+
+        if cached is not None and cached[0] == folded:
+            compacted = cached[2]
+            for entry in transcript[cached[1]:]:
+                compacted.append(entry)
+        else:
+            compacted = Transcript([self._summary(transcript, i)[0] for i in range(folded)])
+            for entry in transcript[start:]:
+                compacted.append(entry)
+        self._compacted[participant] = (folded, len(transcript), compacted)
+
+        self.compacted_calls += 1
+        self.tokens_out += sent
+        return compacted
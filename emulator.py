@@ -0,0 +1,447 @@
+"""
+Local multi-provider API emulator for Neural-Chat.
+
+Serves the subset of the provider wire formats this project uses, so the real
+*_chat functions and main.main() can be driven offline and at high
+concurrency:
+
+- OpenAI chat completions (GPT-4o, Grok, DeepSeek): POST /v1/chat/completions
+- Anthropic messages (Claude): POST /v1/messages
+- Gemini generate_content over REST: POST /v1beta/models/<model>:generateContent
+  (and :streamGenerateContent)
+
+Streaming requests are answered with the provider's server-sent event (or,
+for Gemini without alt=sse, streamed JSON array) format. Every response body
+is a canned JSON {"contribution": ..., "vote": ...}. Latency is drawn from a
+log-normal distribution, and errors and 429 rate limits (with a Retry-After
+header) can be injected at configurable rates. Output token limits
+(max_tokens / maxOutputTokens) are honoured: a longer body is cut off, with
+the provider's "length" finish reason. Provider prompt caching is
+emulated too: usage reports the input tokens of the longest message prefix
+seen in an earlier request (OpenAI-style automatic caching, or Anthropic
+cache_control breakpoints).
+
+Usage:
+    python emulator.py --port 8765 --latency-ms 400 --rate-limit-rate 0.05
+
+Then call use_emulator("http://127.0.0.1:8765") (or set the *_BASE_URL
+settings in config.py by hand) before running discussions.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+
+CANNED_CONTRIBUTIONS = [
+    "I agree with GPT-4o's framing, but Claude's caveat about edge cases deserves more attention.",
+    "Gemini raised a fair point; I would add that the trade-off depends heavily on scale.",
+    "I disagree with Grok here. DeepSeek's earlier example shows the opposite effect.",
+    "Building on what Claude said, we should separate the short-term and long-term impact.",
+    "DeepSeek, could you clarify your assumption? I think it changes the conclusion.",
+]
+
+class EmulatorSettings:
+    """
+    Behaviour of the emulated endpoints.
+
+    Args:
+        latency_ms: Median response latency in milliseconds
+        latency_sigma: Log-normal shape parameter (0 for a fixed latency)
+        error_rate: Probability of answering with a 500 error
+        rate_limit_rate: Probability of answering with a 429 error
+        retry_after: Seconds advertised in the Retry-After header of a 429
+        vote_true_rate: Probability that the canned response votes to continue
+        token_interval_ms: Delay between streamed chunks in milliseconds
+        seed: Seed for the random generator, for repeatable runs
+    """
+
+    def __init__(self, latency_ms=200.0, latency_sigma=0.5, error_rate=0.0,
+                 rate_limit_rate=0.0, retry_after=1.0, vote_true_rate=0.5,
+                 token_interval_ms=10.0, seed=None):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.vote_true_rate = vote_true_rate
+        self.token_interval_ms = token_interval_ms
+        self.prompt_cache = PromptCache()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample_latency(self):
+        with self._lock:
+            return self.latency_ms / 1000.0 * math.exp(self._random.gauss(0.0, self.latency_sigma))
+
+    def sample_outcome(self):
+        """
+        Returns None for success, or the HTTP status code of an injected failure.
+        """
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            return 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 500
+        return None
+
+    def canned_body(self):
+        with self._lock:
+            contribution = self._random.choice(CANNED_CONTRIBUTIONS)
+            vote = self._random.random() < self.vote_true_rate
+        return json.dumps({"contribution": contribution, "vote": vote})
+
+def _estimate_tokens(value):
+    return max(1, len(json.dumps(value)) // 4)
+
+# Smallest prefix (in tokens) each route caches
+PROMPT_CACHE_MIN_TOKENS = {"openai": 1024, "anthropic": 2048}
+
+def _message_text(message):
+    # Role and text of a message, ignoring how its content blocks are marked up
+    content = message.get("content", "") if isinstance(message, dict) else message
+    if isinstance(content, list):
+        content = "".join(block.get("text", "") for block in content if isinstance(block, dict))
+    role = message.get("role", "") if isinstance(message, dict) else ""
+    return f"{role}\n{content}"
+
+def _has_breakpoint(message):
+    content = message.get("content") if isinstance(message, dict) else None
+    return isinstance(content, list) and any(isinstance(block, dict) and block.get("cache_control") for block in content)
+
+class PromptCache:
+    """
+    Emulated provider prompt cache, remembering the message prefixes of earlier requests per model.
+    """
+
+    def __init__(self):
+        self._prefixes = set()
+        self._lock = threading.Lock()
+
+    def lookup(self, route, request):
+        """
+        Returns the input tokens of the request served from the cache, then caches its prefixes.
+
+        OpenAI-style routes cache every prefix automatically; Anthropic only
+        caches prefixes ending at a cache_control breakpoint.
+        """
+        if route not in PROMPT_CACHE_MIN_TOKENS:
+            return 0
+        messages = list(request.get("messages", []))
+        if route == "anthropic" and request.get("system"):
+            messages.insert(0, {"role": "system", "content": request["system"]})
+        digest = hashlib.sha256(str(request.get("model")).encode("utf-8"))
+        tokens = 0
+        prefixes = []
+        for message in messages:
+            digest.update(_message_text(message).encode("utf-8"))
+            tokens += _estimate_tokens(message)
+            cacheable = route != "anthropic" or _has_breakpoint(message)
+            prefixes.append((tokens, digest.hexdigest(), cacheable))
+        with self._lock:
+            cached = max((count for count, key, _ in prefixes if key in self._prefixes), default=0)
+            self._prefixes.update(key for _, key, cacheable in prefixes if cacheable)
+        minimum = PROMPT_CACHE_MIN_TOKENS[route]
+        if cached < minimum:
+            return 0
+        # OpenAI caches in 128-token increments past the minimum.
+        return cached - (cached - minimum) % 128 if route == "openai" else cached
+
+# Request key the handler stores the emulated cache hit under for the response builders
+CACHED_TOKENS_KEY = "_emulator_cached_tokens"
+# Request key marking a body cut off at the request's output token limit
+TRUNCATED_KEY = "_emulator_truncated"
+
+def _output_limit(route, request):
+    # The request's output token limit, if it sets one
+    if route == "gemini":
+        return (request.get("generationConfig") or {}).get("maxOutputTokens")
+    return request.get("max_tokens") or request.get("max_completion_tokens")
+
+def _openai_response(request, text):
+    prompt_tokens = _estimate_tokens(request.get("messages", []))
+    completion_tokens = _estimate_tokens(text)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get("model", "emulated"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": text, "refusal": None},
+            "logprobs": None,
+            "finish_reason": "length" if request.get(TRUNCATED_KEY) else "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": min(request.get(CACHED_TOKENS_KEY, 0), prompt_tokens)},
+        },
+    }
+
+def _anthropic_response(request, text):
+    input_tokens = _estimate_tokens([request.get("system", ""), request.get("messages", [])])
+    cached = min(request.get(CACHED_TOKENS_KEY, 0), input_tokens)
+    return {
+        "id": f"msg_{uuid.uuid4().hex}",
+        "type": "message",
+        "role": "assistant",
+        "model": request.get("model", "emulated"),
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "max_tokens" if request.get(TRUNCATED_KEY) else "end_turn",
+        "stop_sequence": None,
+        "usage": {
+            # Like the real API, input_tokens excludes the tokens read from the cache.
+            "input_tokens": input_tokens - cached,
+            "cache_read_input_tokens": cached,
+            "cache_creation_input_tokens": 0,
+            "output_tokens": _estimate_tokens(text),
+        },
+    }
+
+def _gemini_response(request, text):
+    prompt_tokens = _estimate_tokens(request.get("contents", []))
+    completion_tokens = _estimate_tokens(text)
+    return {
+        "candidates": [{
+            "content": {"role": "model", "parts": [{"text": text}]},
+            "finishReason": "MAX_TOKENS" if request.get(TRUNCATED_KEY) else "STOP",
+            "index": 0,
+        }],
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": completion_tokens,
+            "totalTokenCount": prompt_tokens + completion_tokens,
+        },
+    }
+
+def _error_body(route, status):
+    message = "Rate limit exceeded (emulated)" if status == 429 else "Internal server error (emulated)"
+    if route == "anthropic":
+        kind = "rate_limit_error" if status == 429 else "api_error"
+        return {"type": "error", "error": {"type": kind, "message": message}}
+    if route == "gemini":
+        return {"error": {"code": status, "message": message,
+                          "status": "RESOURCE_EXHAUSTED" if status == 429 else "INTERNAL"}}
+    kind = "rate_limit_exceeded" if status == 429 else "server_error"
+    return {"error": {"message": message, "type": kind, "code": kind}}
+
+def _openai_stream_events(request, chunks):
+    base = {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": request.get("model", "emulated"),
+    }
+    for i, text in enumerate(chunks):
+        delta = {"role": "assistant", "content": text} if i == 0 else {"content": text}
+        yield None, dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": None}])
+    finish_reason = "length" if request.get(TRUNCATED_KEY) else "stop"
+    yield None, dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": finish_reason}])
+    if (request.get("stream_options") or {}).get("include_usage"):
+        usage = _openai_response(request, "".join(chunks))["usage"]
+        yield None, dict(base, choices=[], usage=usage)
+    yield None, "[DONE]"
+
+def _anthropic_stream_events(request, chunks):
+    message = _anthropic_response(request, "")
+    message.update(content=[], stop_reason=None)
+    yield "message_start", {"type": "message_start", "message": message}
+    yield "content_block_start", {"type": "content_block_start", "index": 0,
+                                  "content_block": {"type": "text", "text": ""}}
+    output_tokens = 0
+    for text in chunks:
+        output_tokens += _estimate_tokens(text)
+        yield "content_block_delta", {"type": "content_block_delta", "index": 0,
+                                      "delta": {"type": "text_delta", "text": text}}
+    yield "content_block_stop", {"type": "content_block_stop", "index": 0}
+    stop_reason = "max_tokens" if request.get(TRUNCATED_KEY) else "end_turn"
+    yield "message_delta", {"type": "message_delta", "delta": {"stop_reason": stop_reason, "stop_sequence": None},
+                            "usage": {"output_tokens": output_tokens}}
+    yield "message_stop", {"type": "message_stop"}
+
+def _gemini_stream_events(request, chunks):
+    for text in chunks:
+        yield None, _gemini_response(request, text)
+
+# path pattern -> (route name, response builder, stream event builder)
+ROUTES = [
+    (re.compile(r"^(/v1)?/chat/completions$"), "openai", _openai_response, _openai_stream_events),
+    (re.compile(r"^(/v1)?/messages$"), "anthropic", _anthropic_response, _anthropic_stream_events),
+    (re.compile(r"^/v1(beta)?/models/[^/:]+:generateContent$"), "gemini", _gemini_response, None),
+    (re.compile(r"^/v1(beta)?/models/[^/:]+:streamGenerateContent$"), "gemini", None, _gemini_stream_events),
+]
+
+class EmulatorHandler(BaseHTTPRequestHandler):
+    """
+    Request handler dispatching to the emulated provider routes.
+    """
+
+    protocol_version = "HTTP/1.1"
+    settings = EmulatorSettings()
+
+    def do_POST(self):
+        path, _, query = self.path.partition("?")
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "Invalid JSON body"}})
+            return
+
+        for pattern, route, build_response, build_events in ROUTES:
+            if pattern.match(path):
+                break
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path: {path}"}})
+            return
+
+        time.sleep(self.settings.sample_latency())
+        status = self.settings.sample_outcome()
+        if status is not None:
+            headers = {"Retry-After": str(self.settings.retry_after)} if status == 429 else {}
+            self._send_json(status, _error_body(route, status), headers)
+            return
+
+        request[CACHED_TOKENS_KEY] = self.settings.prompt_cache.lookup(route, request)
+        body = self.settings.canned_body()
+        limit = _output_limit(route, request)
+        if limit is not None and len(body) > limit * 4:
+            body = body[:limit * 4]
+            request[TRUNCATED_KEY] = True
+        if build_response is None or (build_events is not None and request.get("stream")):
+            chunks = [body[i:i + 8] for i in range(0, len(body), 8)]
+            events = build_events(request, chunks)
+            if route == "gemini" and "alt=sse" not in query:
+                self._send_json_array_stream(events)
+            else:
+                self._send_event_stream(events)
+            return
+        self._send_json(200, build_response(request, body))
+
+    def _start_stream(self, content_type):
+        # Streams are sent without a Content-Length and delimited by closing the connection.
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+    def _send_event_stream(self, events):
+        self._start_stream("text/event-stream")
+        interval = self.settings.token_interval_ms / 1000.0
+        for event, data in events:
+            payload = data if isinstance(data, str) else json.dumps(data)
+            message = (f"event: {event}\n" if event else "") + f"data: {payload}\n\n"
+            self.wfile.write(message.encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(interval)
+
+    def _send_json_array_stream(self, events):
+        self._start_stream("application/json")
+        interval = self.settings.token_interval_ms / 1000.0
+        for i, (_, data) in enumerate(events):
+            self.wfile.write((("[" if i == 0 else ",") + json.dumps(data)).encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(interval)
+        self.wfile.write(b"]")
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Keep load tests quiet.
+        pass
+
+def start_emulator(host="127.0.0.1", port=0, settings=None):
+    """
+    Starts the emulator in a background thread.
+
+    Args:
+        host: Interface to bind
+        port: Port to bind (0 picks a free port)
+        settings: EmulatorSettings; defaults are used if omitted
+
+    Returns:
+        The running server; its url attribute is the base URL to use and
+        server.shutdown() stops it.
+    """
+    handler = type("ConfiguredEmulatorHandler", (EmulatorHandler,), {"settings": settings or EmulatorSettings()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.url = f"http://{server.server_address[0]}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def use_emulator(url):
+    """
+    Points every provider at the emulator at url.
+
+    Sets the endpoint settings in config and placeholder API keys for any
+    provider without one. Call this before the first provider call, since
+    clients are created once per process.
+    """
+    config.OPENAI_BASE_URL = f"{url}/v1"
+    config.XAI_BASE_URL = f"{url}/v1"
+    config.DEEPSEEK_BASE_URL = f"{url}/v1"
+    config.ANTHROPIC_BASE_URL = url
+    config.GEMINI_API_ENDPOINT = url
+    config.GEMINI_TRANSPORT = "rest"
+    for name in ("OPENAI_API_KEY", "GEMINI_API_KEY", "XAI_API_KEY", "DEEPSEEK_API_KEY", "ANTHROPIC_API_KEY"):
+        os.environ.setdefault(name, "emulator")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the local Neural-Chat provider emulator.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="median latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="log-normal shape (0 = fixed)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 500 responses")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of 429 responses")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds on 429")
+    parser.add_argument("--vote-true-rate", type=float, default=0.5, help="fraction of votes to continue")
+    parser.add_argument("--token-interval-ms", type=float, default=10.0, help="delay between streamed chunks")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    settings = EmulatorSettings(
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        vote_true_rate=args.vote_true_rate,
+        token_interval_ms=args.token_interval_ms,
+        seed=args.seed,
+    )
+    handler = type("ConfiguredEmulatorHandler", (EmulatorHandler,), {"settings": settings})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    print(f"Neural-Chat emulator listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
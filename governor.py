@@ -0,0 +1,157 @@
+"""
+Response-length governor for Neural-Chat.
+
+config.RESPONSE_LENGTH is a word target given to the models in their system
+prompt, but nothing holds them to it. A model that ignores it makes its own
+turn slower and every later prompt longer. The governor turns the target
+into an output token cap (max_tokens / max_output_tokens) on every
+discussion call.
+
+Each model's cap follows its own recent replies. It is
+config.RESPONSE_CAP_PERCENTILE of their lengths times
+config.RESPONSE_CAP_MARGIN, kept between config.RESPONSE_CAP_MIN_FACTOR and
+config.RESPONSE_CAP_MAX_FACTOR times the target. Models that keep to the
+target get a tight cap. Models that overrun get more room, but never more
+than the maximum. A reply cut off by its cap counts as
+config.RESPONSE_CAP_GROWTH times longer than the cap, so frequent cuts raise
+the cap step by step. parsing.py keeps the complete sentences of a cut-off
+reply.
+
+Replies are measured against the target for every model (see summary_lines()).
+"""
+
+import math
+import threading
+from collections import deque
+
+import config
+
+def words_to_tokens(words):
+    """
+    Returns the output tokens needed for a reply of the given number of words, JSON included.
+    """
+    return math.ceil(words * config.RESPONSE_TOKENS_PER_WORD) + config.RESPONSE_JSON_OVERHEAD_TOKENS
+
+class LengthGovernor:
+    """
+    Output cap and reply lengths of one model.
+
+    Args:
+        target_words: Word target; defaults to config.RESPONSE_LENGTH
+        window: Number of recent replies the cap follows
+    """
+
+    def __init__(self, target_words=None, window=None):
+        self.target_words = target_words or config.RESPONSE_LENGTH
+        self.factor = config.RESPONSE_CAP_FACTOR
+        self.ratios = deque(maxlen=window or config.RESPONSE_CAP_WINDOW)
+        self.replies = 0
+        self.total_words = 0
+        self.overruns = 0
+        self.truncated = 0
+        self._lock = threading.Lock()
+
+    def max_tokens(self):
+        """
+        Returns the current output token cap, or None if the governor is disabled.
+        """
+        if self.factor is None:
+            return None
+        return words_to_tokens(self.target_words * self.factor)
+
+    def observe(self, words, truncated=False):
+        """
+        Records a reply's length in words and adapts the cap.
+
+        Args:
+            words: Words in the reply's contribution
+            truncated: The reply was cut off before it was complete
+        """
+        ratio = words / self.target_words
+        with self._lock:
+            self.replies += 1
+            self.total_words += words
+            # Longer than the limit the system prompt sets
+            if words > int(self.target_words * 1.3):
+                self.overruns += 1
+            if truncated:
+                self.truncated += 1
+                if self.factor is not None:
+                    ratio = max(ratio, self.factor) * config.RESPONSE_CAP_GROWTH
+            self.ratios.append(ratio)
+            if self.factor is None or len(self.ratios) < config.RESPONSE_CAP_MIN_SAMPLES:
+                return
+            ordered = sorted(self.ratios)
+            index = min(len(ordered) - 1, int(len(ordered) * config.RESPONSE_CAP_PERCENTILE / 100))
+            self.factor = min(config.RESPONSE_CAP_MAX_FACTOR,
+                              max(config.RESPONSE_CAP_MIN_FACTOR, ordered[index] * config.RESPONSE_CAP_MARGIN))
+
+    def stats(self):
+        """
+        Returns the reply lengths measured so far against the target, as a dict.
+        """
+        with self._lock:
+            mean_words = self.total_words / self.replies if self.replies else 0.0
+            return {
+                "replies": self.replies,
+                "target_words": self.target_words,
+                "mean_words": round(mean_words, 1),
+                "mean_ratio": round(mean_words / self.target_words, 2),
+                "overruns": self.overruns,
+                "truncated": self.truncated,
+                "max_tokens": self.max_tokens(),
+            }
+
+_governors = {}
+_governors_lock = threading.Lock()
+
+def get_governor(model_name):
+    """
+    Returns the process-wide length governor of a model.
+    """
+    with _governors_lock:
+        governor = _governors.get(model_name)
+        if governor is None:
+            governor = _governors[model_name] = LengthGovernor()
+        return governor
+
+def with_length_cap(params, model_name, name="max_tokens"):
+    """
+    Returns params with its output token limit (params[name]) lowered to the model's current cap.
+
+    params itself is not modified.
+    """
+    cap = get_governor(model_name).max_tokens()
+    if cap is None:
+        return params
+    current = params.get(name)
+    return dict(params, **{name: cap if current is None else min(current, cap)})
+
+def observe(model_name, result):
+    """
+    Records the length of a parsed reply ({"contribution", ...}, with "truncated" if it was cut off).
+    """
+    contribution = result.get("contribution") or ""
+    get_governor(model_name).observe(len(contribution.split()), bool(result.get("truncated")))
+
+def length_stats():
+    """
+    Returns {model name: stats()} for every model that has replied.
+    """
+    with _governors_lock:
+        governors = dict(_governors)
+    return {model_name: governor.stats() for model_name, governor in governors.items() if governor.replies}
+
+def summary_lines():
+    """
+    Returns one line per model comparing its reply lengths with the target.
+    """
+    lines = []
+    for model_name, stats in sorted(length_stats().items()):
+        line = (f"{model_name}: {stats['mean_words']:.0f} words on average against a target of "
+                f"{stats['target_words']} ({stats['mean_ratio']:.2f}x) over {stats['replies']} replies, "
+                f"{stats['overruns']} over {int(stats['target_words'] * 1.3)} words, {stats['truncated']} cut off")
+        if stats["max_tokens"] is not None:
+            line += f"; cap {stats['max_tokens']} tokens"
+        lines.append(line)
+    return lines
@@ -0,0 +1,221 @@
+"""
+Per-call deadlines and hedged requests for Neural-Chat.
+
+Every model call runs under a deadline (config.CALL_DEADLINES, falling back
+to config.CALL_DEADLINE_DEFAULT): a call still running when it passes fails
+with DeadlineExceededError instead of holding up the round. A discussion
+whose budget has a time limit (see budget.py) shortens the deadline to the
+time it has left.
+
+The latency of each provider's successful calls is tracked, and once a call
+has run longer than the provider's usual tail latency
+(config.HEDGE_PERCENTILE over the recent calls) a duplicate request is sent.
+Whichever answers first is used and the other is cancelled. Streamed calls
+are never hedged, since their text is already on its way to the user.
+
+Blocking calls run in worker threads so the deadline can be enforced; a
+thread that loses cannot be interrupted and finishes its current request in
+the background (the SDK timeouts set in clients.py bound how long that
+takes). It is marked as abandoned, so rate_limited() makes no further
+attempts for it and its reply is not charged to the budget or reported to
+the length governor.
+"""
+
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import config
+from ratelimit import ProviderError, watch_abandon
+
+class DeadlineExceededError(ProviderError):
+    """
+    The call did not finish before its deadline.
+    """
+
+def call_deadline(provider, budget=None):
+    """
+    Seconds a call to the provider may take in total, or None for no deadline.
+
+    Args:
+        provider: Provider identifier
+        budget: Optional Budget of the discussion; a call may not run past its deadline
+    """
+    deadline = config.CALL_DEADLINES.get(provider, config.CALL_DEADLINE_DEFAULT)
+    remaining = budget.remaining_seconds() if budget is not None else None
+    if remaining is None:
+        return deadline
+    return remaining if deadline is None else min(deadline, remaining)
+
+class LatencyTracker:
+    """
+    Latencies of a provider's recent successful calls.
+
+    Args:
+        window: Number of recent calls kept
+    """
+
+    def __init__(self, window=None):
+        self.latencies = deque(maxlen=window or config.HEDGE_WINDOW)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.latencies.append(seconds)
+
+    def hedge_delay(self):
+        """
+        Seconds after which a call is hedged, or None while too few calls have been seen.
+        """
+        with self._lock:
+            if config.HEDGE_PERCENTILE is None or len(self.latencies) < config.HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * config.HEDGE_PERCENTILE / 100))
+        return max(config.HEDGE_MIN_DELAY, ordered[index])
+
+_trackers = {}
+_trackers_lock = threading.Lock()
+
+def get_tracker(provider):
+    """
+    Returns the process-wide latency tracker for a provider.
+    """
+    with _trackers_lock:
+        tracker = _trackers.get(provider)
+        if tracker is None:
+            tracker = _trackers[provider] = LatencyTracker()
+        return tracker
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=config.CALL_WORKERS, thread_name_prefix="model-call")
+        return _executor
+
+def _timed(tracker, call, abandon=None):
+    if abandon is not None:
+        watch_abandon(abandon)
+    start = time.monotonic()
+    result = call()
+    if tracker is not None:
+        tracker.record(time.monotonic() - start)
+    return result
+
+async def _timed_async(tracker, call):
+    start = time.monotonic()
+    result = await call()
+    if tracker is not None:
+        tracker.record(time.monotonic() - start)
+    return result
+
+def _next_timeout(start, deadline, hedge_delay):
+    # Seconds until the deadline or the point at which to hedge, whichever
+    # comes first; None if there is neither.
+    elapsed = time.monotonic() - start
+    timeouts = [limit - elapsed for limit in (deadline, hedge_delay) if limit is not None]
+    return max(0.0, min(timeouts)) if timeouts else None
+
+def hedged(provider, call, hedge=True, budget=None):
+    """
+    Wraps a blocking zero-argument provider call with the provider's deadline and hedging.
+
+    Args:
+        provider: Provider identifier
+        call: Zero-argument function making the request, normally the one
+            returned by rate_limited()
+        hedge: Send a duplicate request once the call is slower than usual;
+            pass False for streamed calls and others whose latency is not
+            comparable (they are not recorded in the provider's latencies)
+        budget: Optional Budget whose remaining time also bounds the call
+
+    Returns:
+        A zero-argument function that raises DeadlineExceededError when
+        the deadline passes, or the call's own error
+    """
+    def run():
+        deadline = call_deadline(provider, budget)
+        tracker = get_tracker(provider) if hedge else None
+        hedge_delay = tracker.hedge_delay() if hedge else None
+        if deadline is None and hedge_delay is None:
+            return _timed(tracker, call)
+
+        start = time.monotonic()
+        executor = _get_executor()
+        # Each attempt runs in a copy of this context, so telemetry spans and
+        # usage stay with the call that made them, and has its own event
+        # that is set once the attempt is abandoned.
+        abandon = {}
+
+        def submit():
+            event = threading.Event()
+            future = executor.submit(contextvars.copy_context().run, _timed, tracker, call, event)
+            abandon[future] = event
+            return future
+
+        def abandon_pending():
+            for loser in pending:
+                loser.cancel()
+                abandon[loser].set()
+
+        pending = {submit()}
+        error = None
+        try:
+            while pending:
+                done, pending = wait(pending, _next_timeout(start, deadline, hedge_delay), FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        return future.result()
+                    error = future.exception()
+                if deadline is not None and time.monotonic() - start >= deadline:
+                    raise DeadlineExceededError(provider, f"No response within {deadline:g}s")
+                if pending and hedge_delay is not None and time.monotonic() - start >= hedge_delay:
+                    pending.add(submit())
+                    hedge_delay = None
+            raise error
+        finally:
+            abandon_pending()
+
+    return run
+
+def hedged_async(provider, call, hedge=True, budget=None):
+    """
+    Async variant of hedged; call() must return an awaitable.
+
+    Losing and timed-out attempts are cancelled.
+    """
+    async def run():
+        deadline = call_deadline(provider, budget)
+        tracker = get_tracker(provider) if hedge else None
+        hedge_delay = tracker.hedge_delay() if hedge else None
+        if deadline is None and hedge_delay is None:
+            return await _timed_async(tracker, call)
+
+        start = time.monotonic()
+        pending = {asyncio.ensure_future(_timed_async(tracker, call))}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=_next_timeout(start, deadline, hedge_delay), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+                if deadline is not None and time.monotonic() - start >= deadline:
+                    raise DeadlineExceededError(provider, f"No response within {deadline:g}s")
+                if pending and hedge_delay is not None and time.monotonic() - start >= hedge_delay:
+                    pending.add(asyncio.ensure_future(_timed_async(tracker, call)))
+                    hedge_delay = None
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    return run
@@ -1,16 +1,28 @@
 import api_keys
 import config
 from config import MAX_DISCUSSION_ROUNDS
-import atexit
+import argparse
+import asyncio
 import random
+import time
 from models import (
-    gpt4o_chat,
-    gemini_chat,
-    grok_chat,
-    deepseek_chat,
-    claude_chat,
-    summarize_discussion
+    get_enabled_chat_functions,
+    chat_with_fallback,
+    chat_with_fallback_async,
+    CHAT_FUNCTIONS,
+    CHAT_MODEL_NAMES
 )
+from clients import aclose_clients
+from cache import PASSTHROUGH
+import telemetry
+from parsing import parse_stats, REASKED, FAILED
+from sessions import get_session_store, SessionNotFoundError
+from transcript import Transcript, RoundVotes
+from context_window import ContextWindow
+from summarizer import RunningSummary
+from novelty import NoveltyDetector
+from budget import Budget
+import governor
 
 def get_result_values(result):
     """
@@ -28,24 +40,13 @@ def get_result_values(result):
         vote = result.get("vote", False)
     return model, contribution, vote
 
-def cleanup():
-    """Clean up resources when the program exits."""
-    # Force cleanup of any outstanding gRPC connections
-    try:
-        import grpc
-        grpc.experimental.aio.shutdown_asyncio_engine()
-    except (ImportError, AttributeError):
-        pass
-
-# Register the cleanup function to run at exit
-atexit.register(cleanup)
-
-def randomize_model_order(model_functions):
+def randomize_model_order(model_functions, seed=None):
     """
     Randomizes the order of model functions for each discussion round.
     
     Args:
         model_functions: List of model chat functions
+        seed: Optional seed making the order reproducible (see round_order_seed)
         
     Returns:
         Randomized list of model functions
@@ -53,85 +54,393 @@ def randomize_model_order(model_functions):
     # Create a copy of the original list to avoid modifying it
     shuffled_models = model_functions.copy()
     # Shuffle the list in place
-    random.shuffle(shuffled_models)
+    (random if seed is None else random.Random(seed)).shuffle(shuffled_models)
     return shuffled_models
 
-def main():
-    # Initialize an empty list to store the discussion context.
-    discussion_context = []
+def round_order_seed(topic, round_index):
+    """
+    Returns the seed of a round's model order, or None for a random order.
+
+    While responses are recorded or replayed (config.RESPONSE_CACHE_MODE), the
+    order only depends on the topic and the round, so a replay sends every
+    model the same requests as the recording did.
+    """
+    if config.RESPONSE_CACHE_MODE == PASSTHROUGH:
+        return None
+    return f"{topic}\n{round_index}"
+
+async def run_parallel_round(topic, discussion_context, model_functions, context_window=None, short_circuit=False, budget=None):
+    """
+    Runs one discussion round with every model called concurrently.
+
+    All models see the same snapshot of the discussion context, so the round
+    takes roughly as long as the slowest model instead of the sum of all of them.
+
+    Args:
+        topic: The discussion topic
+        discussion_context: The discussion so far (not modified)
+        model_functions: Ordered list of blocking model chat functions
+        context_window: Optional ContextWindow fitting the context to each model's token budget
+        short_circuit: Cancel the calls still running once the round is
+            certain to end the discussion (see stop_is_decided)
+        budget: Optional Budget every call is charged to and capped by
+
+    Returns:
+        List of results in the same order as model_functions, with None for cancelled calls
+    """
+    # Results are only appended once every call has returned, so the shared
+    # transcript is a stable snapshot for the whole round.
+    calls = [
+        asyncio.ensure_future(chat_with_fallback_async(model_fn, topic, context_messages=fit_context(context_window, discussion_context, model_fn), budget=budget))
+        for model_fn in model_functions
+    ]
+    if not short_circuit:
+        return await asyncio.gather(*calls)
+
+    round_votes = RoundVotes()
+    pending = set(calls)
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            result = task.result()
+            if not result.get("error"):
+                round_votes.append(result.get("vote", False))
+        if pending and stop_is_decided(round_votes, len(pending)):
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            break
+    return [None if task.cancelled() else task.result() for task in calls]
+
+def short_circuit_enabled(current_round):
+    """
+    Returns whether config.QUORUM_SHORT_CIRCUIT applies to the given (0-based) round.
+    """
+    if config.QUORUM_SHORT_CIRCUIT == "always":
+        return True
+    if config.QUORUM_SHORT_CIRCUIT == "final_round":
+        return current_round == config.MAX_DISCUSSION_ROUNDS - 1
+    return False
+
+def stop_is_decided(round_votes, remaining_calls):
+    """
+    Returns True once the remaining calls can no longer give "further discussion" a majority.
+
+    Args:
+        round_votes: RoundVotes cast so far in the round
+        remaining_calls: Number of models that have not answered yet
+    """
+    return round_votes.true_votes + remaining_calls <= round_votes.false_votes
+
+def fit_context(context_window, discussion_context, model_fn):
+    """
+    Returns the context to send to a model, compacted to its token budget if a window is given.
+    """
+    if context_window is None:
+        return discussion_context
+    return context_window.fit(discussion_context, CHAT_MODEL_NAMES[model_fn])
+
+def print_token(text):
+    """
+    Prints a streamed piece of a contribution as soon as it arrives.
+
+    None withdraws the text printed so far, which a terminal cannot erase,
+    so the replacement starts on a new line.
+    """
+    if text is None:
+        print()
+        return
+    print(text, end="", flush=True)
+
+def record_result(result, model_fn, discussion_context, round_votes, streamed=False):
+    """
+    Displays a model's result and appends it to the discussion context and round votes.
+
+    If the contribution was already streamed to the terminal, only the vote is printed.
+    Results of failed calls (marked with an "error" key) do not cast a vote.
+    """
+    # Ensure we get valid responses
+    if isinstance(result, dict):
+        model_name = result.get("model", "Unknown Model")
+        contribution = result.get("contribution", "No contribution provided")
+        vote = result.get("vote", False)
+    else:
+        # Fallback for non-dictionary results
+        model_name = getattr(result, "model", model_fn.__name__.replace("_chat", "").capitalize())
+        contribution = getattr(result, "contribution", "No contribution provided")
+        vote = getattr(result, "vote", False)
+
+    # Display the model's contribution and vote
+    if not streamed:
+        answered_by = f" (answered by {result['fallback']})" if isinstance(result, dict) and result.get("fallback") else ""
+        print(f"\n{model_name} contributed{answered_by}:\n{contribution}")
+    if isinstance(result, dict) and result.get("error"):
+        print("No vote (the call failed)")
+    else:
+        print(f"Vote for further discussion: {vote}")
+        round_votes.append(vote)
+
+    # Append to discussion context with model identity
+    discussion_context.add(model_name, contribution, isinstance(result, dict) and bool(result.get("error")))
+
+def print_transcript(discussion_context):
+    print("\n--- Final Discussion Transcript ---")
+    for idx, entry in enumerate(discussion_context, 1):
+        print(f"{idx}. {entry}")
+
+def main(resume_id=None, budget=None):
+    """
+    Runs one discussion in the terminal.
+
+    Args:
+        resume_id: Id of a stored discussion to continue where it stopped
+            instead of asking for a new topic
+        budget: Budget limiting the discussion's tokens, cost and time;
+            defaults to the config.BUDGET_* limits (none by default)
+    """
+    # Start the configured metrics exporters (no-op unless telemetry is enabled).
+    telemetry.start()
 
-    # Ask the user for the initial topic/message/question.
-    topic = input("Enter the discussion topic/message/question: ")
+    # Initialize an empty transcript to store the discussion context.
+    discussion_context = Transcript()
+    # Keeps the history sent to each model within its configured token budget.
+    context_window = ContextWindow()
+    # Scores how much each round adds, to stop discussions that repeat themselves.
+    novelty = NoveltyDetector()
+    # Every turn is written to the session store as it happens (None if disabled).
+    store = get_session_store()
+    session_id = None
 
     current_round = 0
     continue_discussion = True
+    # Round that was interrupted part-way, to be finished before starting new ones
+    resumed_round = None
+
+    if resume_id is not None:
+        if store is None:
+            print("Resuming requires SESSION_STORE_PATH to be set in config.py.")
+            return
+        try:
+            session = store.load(resume_id)
+        except SessionNotFoundError as e:
+            print(e)
+            return
+        session_id = session.id
+        topic = session.topic
+        print(f"Resuming discussion {session_id}: {topic}")
+
+        # Rebuild the transcript from the completed rounds without calling any model.
+        for record in session.rounds:
+            if record.outcome is None:
+                resumed_round = record
+                break
+            discussion_context.start_round()
+            for turn in record.turns:
+                discussion_context.add(turn["model"], turn["contribution"], bool(turn.get("error")))
+            novelty.should_stop(discussion_context, current_round)
+            continue_discussion = record.outcome["continue"]
+            current_round += 1
+
+        if session.finished:
+            print_transcript(discussion_context)
+            print("\n--- Final Summary ---")
+            print(session.summary)
+            return
+    else:
+        # Ask the user for the initial topic/message/question.
+        topic = input("Enter the discussion topic/message/question: ")
+        if store is not None:
+            session_id = store.create(topic)
+            print(f"Discussion ID: {session_id} (resume with: python main.py --resume {session_id})")
+
+    # Token, cost and time limits for this discussion (None when unlimited)
+    if budget is None:
+        budget = Budget.from_config()
+
+    # Finished rounds are summarized in the background while the discussion goes on.
+    running_summary = RunningSummary(topic, budget)
+    if len(discussion_context):
+        running_summary.update(discussion_context)
+
+    def record(result, model_fn, streamed=False):
+        record_result(result, model_fn, discussion_context, round_votes, streamed)
+        if store is not None:
+            store.add_turn(session_id, current_round, result)
+
+    discussion_start = time.perf_counter()
+
+    # Parallel rounds share one event loop so async clients keep their connections warm.
+    loop = asyncio.new_event_loop() if config.PARALLEL_ROUNDS else None
+
+    # Model calls made and their total latency, used to estimate the time saved by skipped calls.
+    calls_made = 0
+    call_seconds = 0.0
+    calls_skipped = 0
+    seconds_saved = 0.0
 
     while continue_discussion and current_round < config.MAX_DISCUSSION_ROUNDS:
         print(f"\n--- Discussion Round {current_round + 1} ---")
-        round_votes = []
-
-        # Get a new randomized order for this round
-        current_round_models = randomize_model_order([
-            gpt4o_chat,
-            gemini_chat,
-            grok_chat,
-            deepseek_chat,
-            claude_chat
-        ])
-
-        # Iterate through each model.
-        for i, model_fn in enumerate(current_round_models):
-            # Call the model with the topic and the full discussion context
-            is_first_turn = current_round == 0 and i == 0
-            
-            # Pass the first model indicator to ensure proper prompting
-            result = model_fn(topic, context_messages=discussion_context)
-            
-            # Ensure we get valid responses
-            if isinstance(result, dict):
-                model_name = result.get("model", "Unknown Model")
-                contribution = result.get("contribution", "No contribution provided")
-                vote = result.get("vote", False)
-            else:
-                # Fallback for non-dictionary results
-                model_name = getattr(result, "model", model_fn.__name__.replace("_chat", "").capitalize())
-                contribution = getattr(result, "contribution", "No contribution provided") 
-                vote = getattr(result, "vote", False)
-
-            # Display the model's contribution and vote
-            print(f"\n{model_name} contributed:\n{contribution}")
-            print(f"Vote for further discussion: {vote}")
-
-            # Append to discussion context with model identity
-            discussion_context.append({"model": model_name, "content": contribution})
-            round_votes.append(vote)
+        round_votes = RoundVotes()
+        discussion_context.start_round()
+        round_start = time.perf_counter()
+        calls_before_round = calls_made
+
+        if resumed_round is not None:
+            # Finish the interrupted round in its recorded order, replaying the turns already received.
+            answered = set()
+            for turn in resumed_round.turns:
+                record_result(turn, CHAT_FUNCTIONS.get(turn["model"]), discussion_context, round_votes)
+                answered.add(turn["model"])
+            current_round_models = [
+                CHAT_FUNCTIONS[name] for name in resumed_round.models
+                if name in CHAT_FUNCTIONS and name not in answered
+            ]
+            resumed_round = None
+        else:
+            # Get a new randomized order of the enabled models for this round
+            current_round_models = randomize_model_order(get_enabled_chat_functions(), round_order_seed(topic, current_round))
+            if store is not None:
+                store.start_round(session_id, current_round, [CHAT_MODEL_NAMES[model_fn] for model_fn in current_round_models])
+
+        # Skip calls that cannot change the vote outcome (opt-in)
+        short_circuit = short_circuit_enabled(current_round)
+
+        if config.PARALLEL_ROUNDS and budget is not None and budget.exhausted:
+            print(f"\nSkipping {len(current_round_models)} model call(s): {budget.exhausted_reason()}.")
+        elif config.PARALLEL_ROUNDS:
+            # Every model answers the same snapshot of the discussion at once.
+            results = loop.run_until_complete(run_parallel_round(topic, discussion_context, current_round_models, context_window, short_circuit, budget))
+            round_seconds = time.perf_counter() - round_start
+            for model_fn, result in zip(current_round_models, results):
+                if result is not None:
+                    record(result, model_fn)
+            cancelled = results.count(None)
+            if cancelled:
+                # Without cancelling, the round would have lasted about as long as an average round.
+                average = call_seconds / calls_made if calls_made else round_seconds
+                calls_skipped += cancelled
+                seconds_saved += max(0.0, average - round_seconds)
+                print(f"\nCancelled {cancelled} remaining model call(s): the round's outcome is decided.")
+            # In parallel mode each call is charged the round's wall time.
+            calls_made += len(current_round_models) - cancelled
+            call_seconds += round_seconds * (len(current_round_models) - cancelled)
+        else:
+            # Iterate through each model.
+            for i, model_fn in enumerate(current_round_models):
+                remaining = len(current_round_models) - i
+                if budget is not None and budget.exhausted:
+                    print(f"\nSkipping {remaining} remaining model call(s): {budget.exhausted_reason()}.")
+                    break
+                if short_circuit and stop_is_decided(round_votes, remaining):
+                    calls_skipped += remaining
+                    seconds_saved += remaining * call_seconds / max(calls_made, 1)
+                    print(f"\nSkipping {remaining} remaining model call(s): the round's outcome is decided.")
+                    break
+
+                # Call the model with the topic and the discussion context that fits its budget
+                is_first_turn = current_round == 0 and i == 0
+                context_messages = fit_context(context_window, discussion_context, model_fn)
+                call_start = time.perf_counter()
+
+                if config.STREAM_RESPONSES:
+                    # Print the contribution token by token while it is generated.
+                    print(f"\n{CHAT_MODEL_NAMES[model_fn]} contributed:")
+                    result = chat_with_fallback(model_fn, topic, context_messages=context_messages, stream=True, on_token=print_token, budget=budget)
+                    print()
+                    record(result, model_fn, streamed=True)
+                else:
+                    # Pass the first model indicator to ensure proper prompting
+                    result = chat_with_fallback(model_fn, topic, context_messages=context_messages, budget=budget)
+                    record(result, model_fn)
+
+                calls_made += 1
+                call_seconds += time.perf_counter() - call_start
+
+        telemetry.record_round(time.perf_counter() - round_start, current_round, calls_made - calls_before_round)
 
         # Count votes: True means further discussion.
-        true_votes = sum(1 for vote in round_votes if vote)
-        false_votes = len(round_votes) - true_votes
+        true_votes = round_votes.true_votes
+        false_votes = round_votes.false_votes
 
         print(f"\nRound {current_round + 1} votes -> Further discussion: {true_votes}, Stop: {false_votes}")
 
-        # Continue discussion if more models voted for further discussion.
-        if true_votes > false_votes:
+        # Continue discussion if more models voted for further discussion,
+        # unless the discussion has stopped adding anything new (opt-in).
+        converged = novelty.should_stop(discussion_context, current_round)
+        budget_spent = budget.exhausted_reason() if budget is not None else None
+        if true_votes > false_votes and budget_spent:
+            print(f"Ending discussion: {budget_spent}. The summary covers the discussion so far.\n")
+            continue_discussion = False
+        elif true_votes > false_votes and converged:
+            print(f"Ending discussion: round novelty {novelty.scores[-1]:.2f} is below the threshold of {novelty.threshold}.\n")
+            continue_discussion = False
+            novelty.record_stop(discussion_context, current_round + 1, len(get_enabled_chat_functions()))
+        elif true_votes > false_votes:
             print("Proceeding to the next discussion round...\n")
             continue_discussion = True
+            if current_round + 1 < config.MAX_DISCUSSION_ROUNDS:
+                running_summary.update(discussion_context)
         else:
             print("Ending discussion based on votes.\n")
             continue_discussion = False
 
+        if store is not None:
+            store.end_round(session_id, current_round, true_votes, false_votes, continue_discussion)
+
         current_round += 1
 
+    if loop is not None:
+        loop.run_until_complete(aclose_clients())
+        loop.close()
+
+    telemetry.record_discussion(time.perf_counter() - discussion_start, current_round)
+    if config.TELEMETRY_ENABLED:
+        print("\nProvider latency (slowest first):")
+        for line in telemetry.summary_lines():
+            print(line)
+
+    if calls_skipped:
+        print(f"\nQuorum short-circuit skipped {calls_skipped} model call(s), saving ~{seconds_saved:.1f}s.")
+
+    if context_window.compacted_calls:
+        print(f"\nContext compaction saved ~{context_window.tokens_saved} input tokens "
+              f"across {context_window.compacted_calls} of {context_window.calls} calls.")
+
+    if novelty.rounds_saved:
+        print(f"\nNovelty stop saved up to {novelty.rounds_saved} round(s), ~{novelty.tokens_saved} tokens.")
+
+    for model_name, counts in parse_stats().items():
+        if counts[REASKED] or counts[FAILED]:
+            print(f"{model_name}: {counts[REASKED]} replies fixed by re-asking, {counts[FAILED]} unusable (no vote).")
+
+    length_lines = governor.summary_lines()
+    if length_lines:
+        print("\nResponse length:")
+        for line in length_lines:
+            print(line)
+
     # After the discussion ends, output the full discussion transcript.
-    print("\n--- Final Discussion Transcript ---")
-    for idx, entry in enumerate(discussion_context, 1):
-        print(f"{idx}. {entry}")
+    print_transcript(discussion_context)
 
-    # Summarize the discussion using the summarize_discussion function.
-    final_summary = summarize_discussion(discussion_context)
+    # Finish the summary from the running summary and the last round.
+    final_summary = running_summary.final(discussion_context)
     print("\n--- Final Summary ---")
     print(final_summary)
+    if budget is not None:
+        print(f"\nBudget: {budget.describe()}")
+
+    if store is not None:
+        store.finish(session_id, final_summary)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run a multi-model discussion.")
+    parser.add_argument("--resume", metavar="DISCUSSION_ID", help="continue a stored discussion where it stopped")
+    parser.add_argument("--list", action="store_true", help="list recent stored discussions and exit")
+    args = parser.parse_args()
+    if args.list:
+        store = get_session_store()
+        for session_id, topic, created, status in (store.list_sessions() if store else []):
+            print(f"{session_id}  {time.strftime('%Y-%m-%d %H:%M', time.localtime(created))}  {status:8}  {topic}")
+    else:
+        main(args.resume)
\ No newline at end of file
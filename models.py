@@ -1,498 +1,878 @@
-import os
-import json
-import google.generativeai as genai
+import asyncio
+import threading
 import warnings
-import platform
+from functools import partial
 
 # Suppress the urllib3 OpenSSL warning
 warnings.filterwarnings("ignore", category=UserWarning, module="urllib3")
 
-# Set OS-specific environment variables for gRPC
-os.environ["GRPC_ENABLE_FORK_SUPPORT"] = "false"
-if platform.system() == "Linux":
-    os.environ["GRPC_POLL_STRATEGY"] = "epoll1"
-else:
-    # For macOS, use a different polling strategy
-    os.environ["GRPC_POLL_STRATEGY"] = "poll"
-
-from api_keys import (
-    get_openai_api_key,
-    get_gemini_api_key,
-    get_xai_api_key,
-    get_deepseek_api_key,
-    get_anthropic_api_key,
+# Provider SDKs (and gRPC for Gemini) are imported by clients.py when a
+# model is first called, not here.
+import config
+from clients import get_client, get_async_client, get_gemini_model
+from cache import cached_call, cached_call_async, CacheMissError
+from ratelimit import rate_limited, rate_limited_async, estimate_request_tokens
+from budget import with_output_cap
+from governor import with_length_cap
+from hedging import hedged, hedged_async, call_deadline
+from telemetry import record_usage
+from parsing import parse_or_reask, aparse_or_reask, record_cached
+from streaming import (
+    ContributionStream,
+    openai_text_deltas,
+    openai_text_deltas_async,
+    gemini_text_deltas,
+    gemini_text_deltas_async,
 )
-from config import RESPONSE_LENGTH
-
-def get_default_system_prompt(model_name=None, response_length=RESPONSE_LENGTH):
-    participant_models = ["GPT-4o", "Gemini", "DeepSeek", "Grok", "Claude"]
-    
-    prompt = (
-        "You are a discussion model participating in a multi-model dialogue. "
-        f"Your identity is {model_name}. " if model_name else "You are a discussion model. "
-        "Provide your contribution and a vote (true if more discussion is required, false otherwise) "
-        "in JSON format with keys 'contribution' and 'vote'.\n\n"
-        "IMPORTANT GUIDELINES:\n"
-        "1. Keep your responses concise and to the point.\n"
-        "2. Be critical and analytical - it's perfectly fine to disagree with other models.\n"
-        "3. When responding to other models, refer to them by name (e.g., 'GPT-4o mentioned...' or 'I disagree with Gemini because...').\n"
-        "4. Focus on quality insights rather than length.\n"
-        "5. Always respond to previous models' contributions if they exist. Build upon or challenge their ideas.\n"
-        f"6. RESPONSE LENGTH: Target around {response_length} words. Your response MUST NOT exceed {int(response_length * 1.3)} words. Shorter, more focused responses are preferred.\n"
-        "7. Unless you are the first to respond, you MUST refer to at least one previous response from another model.\n"
-        "8. You can ask questions to other models to encourage further discussion.\n"
-        "9. You can challenge or critique other models' reasoning if you find flaws in their arguments.\n"
-        "10. Do NOT focus too much on repeating what has already been discussed. Instead, add new insights, information,  or perspectives, or dig deeper into the topic.\n"
-        "    Brief summaries when agreeing with or critiquing others are acceptable, but avoid lengthy rehashing of previous points.\n"
-        "    Focus on moving the discussion forward with new contributions rather than just echoing what's already been said.\n\n"
-        f"You are participating in a dialogue with the following models(including yourself({model_name})): {', '.join(participant_models)}."
-    )
-    return prompt
+from transcript import as_transcript, CHAT_FORMAT, ANTHROPIC_FORMAT, TEXT_FORMAT
+from prompts import (
+    get_system_prompt,
+    get_gemini_prompt_header,
+    OPENAI_RESPONSE_FORMAT,
+    GEMINI_RESPONSE_SCHEMA,
+    REPAIR_PROMPT,
+    SUMMARIZER_SYSTEM_PROMPT,
+    get_final_summary_prompt,
+)
+
+# Ask OpenAI-compatible streams to end with a usage chunk, for telemetry.
+STREAM_USAGE_OPTIONS = {"include_usage": True}
+
+def _repair_messages(messages, raw):
+    # The original request, the unusable reply and a request to restate it.
+    return messages + [{"role": "assistant", "content": raw}, {"role": "user", "content": REPAIR_PROMPT}]
+
+def _reask_params(params, name="max_tokens"):
+    # The call's params with the output cap lowered to config.PARSE_REASK_MAX_TOKENS,
+    # so a re-ask never gets more room than the call it repairs.
+    cap = params.get(name)
+    return dict(params, **{name: config.PARSE_REASK_MAX_TOKENS if cap is None else min(cap, config.PARSE_REASK_MAX_TOKENS)})
+
+def _chat_reask(client, model_id, messages, params):
+    """
+    Returns a function asking an OpenAI-compatible model to restate an unparseable reply as JSON.
+    """
+    params = _reask_params(params)
+
+    def reask(raw):
+        completion = client.chat.completions.create(
+            model=model_id,
+            messages=_repair_messages(messages, raw),
+            **params,
+        )
+        record_usage(completion.usage, accumulate=True)
+        return completion.choices[0].message.content
+    return reask
+
+def _chat_reask_async(client, model_id, messages, params):
+    """
+    Async variant of _chat_reask.
+    """
+    params = _reask_params(params)
+
+    async def reask(raw):
+        completion = await client.chat.completions.create(
+            model=model_id,
+            messages=_repair_messages(messages, raw),
+            **params,
+        )
+        record_usage(completion.usage, accumulate=True)
+        return completion.choices[0].message.content
+    return reask
 
 ##############################
 # GPT-4o (OpenAI) Integration
 ##############################
-def gpt4o_chat(discussion_topic, context_messages=None):
+GPT4O_MODEL_NAME = "GPT-4o"
+GPT4O_MODEL_ID = "gpt-4o-2024-08-06"
+
+def _gpt4o_messages(discussion_topic, context_messages=None, participant=None):
     """
-    Calls the GPT-4o API with structured output.
+    Builds the GPT-4o message list with an identity-aware system prompt.
     """
-    from pydantic import BaseModel
-    from openai import OpenAI
-    
-    MODEL_NAME = "GPT-4o"
-
-    class GPT4OResponse(BaseModel):
-        contribution: str
-        vote: bool
-
-    # Build message list with identity-aware system prompt
-    system_prompt = get_default_system_prompt(MODEL_NAME) + """
-    IMPORTANT REMINDER: You MUST refer to at least one previous model by their exact name (e.g., "Gemini mentioned..." or "I disagree with Claude's point about..."). 
-    Use conversational language as if you are directly speaking to the other models in a group chat. 
-    If there are no previous responses, you can start the discussion with your own perspective.
-    
-    IMPORTANT: Pay attention to which previous messages were YOUR OWN contributions. When you see messages marked as 
-    "YOUR PREVIOUS RESPONSE", be sure to maintain consistency with your earlier statements and build upon them.
-    """
-    
+    MODEL_NAME = participant or GPT4O_MODEL_NAME
+
+    system_prompt = get_system_prompt(MODEL_NAME)
+
     messages = [{"role": "system", "content": system_prompt}]
-    
-    # Format context messages correctly with model identities
+
+    # Previously rendered context, marking this model's own responses
     if context_messages:
-        formatted_context = []
-        for msg in context_messages:
-            if isinstance(msg, dict) and 'role' in msg and 'content' in msg:
-                # Keep existing formatted messages
-                formatted_context.append(msg)
-            elif isinstance(msg, dict) and 'model' in msg and 'content' in msg:
-                # Handle messages with model identity and mark the model's own previous responses
-                if msg['model'] == MODEL_NAME:
-                    formatted_context.append({
-                        "role": "assistant", 
-                        "content": f"YOUR PREVIOUS RESPONSE: {msg['content']}"
-                    })
-                else:
-                    formatted_context.append({
-                        "role": "assistant", 
-                        "content": f"{msg['model']}: {msg['content']}"
-                    })
-            elif isinstance(msg, str):
-                # Convert plain string messages
-                formatted_context.append({"role": "assistant", "content": msg})
-        messages.extend(formatted_context)
-    
+        messages.extend(as_transcript(context_messages).render(MODEL_NAME, CHAT_FORMAT))
+
     messages.append({"role": "user", "content": f"Discuss the following topic: {discussion_topic}"})
-    
-    client = OpenAI(api_key=get_openai_api_key())
-    
-    completion = client.beta.chat.completions.parse(
-        model="gpt-4o-2024-08-06",
-        messages=messages,
-        response_format=GPT4OResponse,
-    )
-    return {"model": MODEL_NAME, "contribution": completion.choices[0].message.parsed.contribution, "vote": completion.choices[0].message.parsed.vote}
+    return messages
+
+def _gpt4o_error(e):
+    print(f"GPT-4o API error: {e}. Returning fallback response.")
+    return {"model": GPT4O_MODEL_NAME, "contribution": "I encountered an error when processing your request.", "vote": False, "error": str(e)}
+
+def gpt4o_chat(discussion_topic, context_messages=None, stream=False, on_token=None, budget=None, participant=None):
+    """
+    Calls the GPT-4o API with structured output.
+
+    With stream=True the response is streamed and each newly decoded piece of
+    the contribution is passed to on_token as it arrives. participant makes
+    the model speak as another participant, when it answers as that
+    participant's fallback (see chat_with_fallback).
+    """
+    messages = _gpt4o_messages(discussion_topic, context_messages, participant)
+    params = {"response_format": OPENAI_RESPONSE_FORMAT}
+    request_tokens = estimate_request_tokens(messages)
+    key_params = with_length_cap(params, GPT4O_MODEL_NAME)
+    call_params = with_output_cap(key_params, budget, GPT4O_MODEL_ID, request_tokens)
+    collector = ContributionStream(on_token)
+
+    def call():
+        client = get_client("openai")
+        reask = _chat_reask(client, GPT4O_MODEL_ID, messages, call_params)
+        if stream:
+            chunks = client.chat.completions.create(model=GPT4O_MODEL_ID, messages=messages, stream=True, stream_options=STREAM_USAGE_OPTIONS, **call_params)
+            return parse_or_reask(GPT4O_MODEL_NAME, collector.consume(openai_text_deltas(chunks)), reask)
+        completion = client.chat.completions.create(
+            model=GPT4O_MODEL_ID,
+            messages=messages,
+            **call_params,
+        )
+        record_usage(completion.usage)
+        return parse_or_reask(GPT4O_MODEL_NAME, completion.choices[0].message.content, reask)
+
+    limited = hedged("openai", rate_limited("openai", GPT4O_MODEL_ID, call, request_tokens, collector, budget), not stream, budget)
+    try:
+        if budget is not None:
+            budget.check("openai", model_id=GPT4O_MODEL_ID, input_tokens=request_tokens)
+        return collector.finish(cached_call("openai", GPT4O_MODEL_ID, messages, key_params, limited, call_params == key_params, partial(record_cached, GPT4O_MODEL_NAME)))
+    except CacheMissError:
+        raise
+    except Exception as e:
+        return collector.finish(_gpt4o_error(e))
+
+async def gpt4o_chat_async(discussion_topic, context_messages=None, stream=False, on_token=None, budget=None, participant=None):
+    """
+    Async variant of gpt4o_chat using the OpenAI async client.
+    """
+    messages = _gpt4o_messages(discussion_topic, context_messages, participant)
+    params = {"response_format": OPENAI_RESPONSE_FORMAT}
+    request_tokens = estimate_request_tokens(messages)
+    key_params = with_length_cap(params, GPT4O_MODEL_NAME)
+    call_params = with_output_cap(key_params, budget, GPT4O_MODEL_ID, request_tokens)
+    collector = ContributionStream(on_token)
+
+    async def call():
+        client = get_async_client("openai")
+        reask = _chat_reask_async(client, GPT4O_MODEL_ID, messages, call_params)
+        if stream:
+            chunks = await client.chat.completions.create(model=GPT4O_MODEL_ID, messages=messages, stream=True, stream_options=STREAM_USAGE_OPTIONS, **call_params)
+            return await aparse_or_reask(GPT4O_MODEL_NAME, await collector.aconsume(openai_text_deltas_async(chunks)), reask)
+        completion = await client.chat.completions.create(
+            model=GPT4O_MODEL_ID,
+            messages=messages,
+            **call_params,
+        )
+        record_usage(completion.usage)
+        return await aparse_or_reask(GPT4O_MODEL_NAME, completion.choices[0].message.content, reask)
+
+    limited = hedged_async("openai", rate_limited_async("openai", GPT4O_MODEL_ID, call, request_tokens, collector, budget), not stream, budget)
+    try:
+        if budget is not None:
+            budget.check("openai", model_id=GPT4O_MODEL_ID, input_tokens=request_tokens)
+        return collector.finish(await cached_call_async("openai", GPT4O_MODEL_ID, messages, key_params, limited, call_params == key_params, partial(record_cached, GPT4O_MODEL_NAME)))
+    except CacheMissError:
+        raise
+    except Exception as e:
+        return collector.finish(_gpt4o_error(e))
 
 ##############################
 # Gemini 2.0 Flash Integration
 ##############################
-def gemini_chat(discussion_topic, context_messages=None):
+GEMINI_MODEL_NAME = "Gemini"
+GEMINI_MODEL_ID = "gemini-2.0-flash"
+GEMINI_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": GEMINI_RESPONSE_SCHEMA,
+}
+
+def _gemini_prompt(discussion_topic, context_messages=None, participant=None):
     """
-    Calls the Gemini API for structured output, strictly following the official documentation.
+    Constructs the prompt by combining instructions, context, and new discussion topic.
     """
-    import google.generativeai as genai
-    from pydantic import BaseModel
-    import json
+    MODEL_NAME = participant or GEMINI_MODEL_NAME
+
+    prompt = get_gemini_prompt_header(MODEL_NAME)
+    if context_messages:
+        prompt += as_transcript(context_messages).render(MODEL_NAME, TEXT_FORMAT)
+    prompt += f"\nUser: Discuss the following topic: {discussion_topic}"
+    return prompt
+
+def _gemini_request_options():
+    # The SDK's own request timeout, so a call abandoned at its deadline does not run on.
+    deadline = call_deadline("gemini")
+    return {"timeout": deadline} if deadline is not None else None
+
+def _gemini_repair_prompt(prompt, raw):
+    return f"{prompt}\nYOUR PREVIOUS RESPONSE: {raw}\nUser: {REPAIR_PROMPT}"
+
+def _gemini_reask(model, prompt, generation_config=GEMINI_GENERATION_CONFIG):
+    """
+    Returns a function asking Gemini to restate an unparseable reply as JSON.
+    """
+    generation_config = _reask_params(generation_config, "max_output_tokens")
+
+    def reask(raw):
+        response = model.generate_content(_gemini_repair_prompt(prompt, raw), generation_config=generation_config, request_options=_gemini_request_options())
+        record_usage(response.usage_metadata, accumulate=True)
+        return response.text
+    return reask
+
+def _gemini_reask_async(model, prompt, generation_config=GEMINI_GENERATION_CONFIG):
+    """
+    Async variant of _gemini_reask.
+    """
+    generation_config = _reask_params(generation_config, "max_output_tokens")
+
+    async def reask(raw):
+        response = await model.generate_content_async(_gemini_repair_prompt(prompt, raw), generation_config=generation_config, request_options=_gemini_request_options())
+        record_usage(response.usage_metadata, accumulate=True)
+        return response.text
+    return reask
+
+def _gemini_error(e):
     import traceback
-    
-    MODEL_NAME = "Gemini"
 
-    class GeminiResponse(BaseModel):
-        contribution: str
-        vote: bool
+    print(f"Gemini API error: {e}")
+    print(traceback.format_exc())
+    return {"model": GEMINI_MODEL_NAME, "contribution": "I encountered an error processing your request. This could be due to a connectivity issue or a problem with the Gemini API.", "vote": False, "error": str(e)}
+
+def _on_loop(loop, on_token):
+    # on_token for a collector fed from a worker thread: pieces arriving off
+    # the loop's thread are scheduled on the loop, in order.
+    loop_thread = threading.get_ident()
+
+    def forward(text):
+        if threading.get_ident() == loop_thread:
+            on_token(text)
+        else:
+            loop.call_soon_threadsafe(on_token, text)
+    return forward
+
+def _gemini_generate(prompt, stream, collector, generation_config=GEMINI_GENERATION_CONFIG):
+    # Shared model instance, configured with the API key on first use.
+    model = get_gemini_model(GEMINI_MODEL_ID)
+    reask = _gemini_reask(model, prompt, generation_config)
+
+    # Generate content with the given prompt and generation configuration.
+    if stream:
+        chunks = model.generate_content(prompt, generation_config=generation_config, stream=True, request_options=_gemini_request_options())
+        return parse_or_reask(GEMINI_MODEL_NAME, collector.consume(gemini_text_deltas(chunks)), reask)
+    response = model.generate_content(prompt, generation_config=generation_config, request_options=_gemini_request_options())
+    record_usage(response.usage_metadata)
+    return parse_or_reask(GEMINI_MODEL_NAME, response.text, reask)
+
+def gemini_chat(discussion_topic, context_messages=None, stream=False, on_token=None, budget=None, participant=None):
+    """
+    Calls the Gemini API for structured output, strictly following the official documentation.
+    """
+    prompt = _gemini_prompt(discussion_topic, context_messages, participant)
+    request_tokens = estimate_request_tokens(prompt)
+    key_config = with_length_cap(GEMINI_GENERATION_CONFIG, GEMINI_MODEL_NAME, "max_output_tokens")
+    generation_config = with_output_cap(key_config, budget, GEMINI_MODEL_ID, request_tokens, "max_output_tokens")
+    collector = ContributionStream(on_token)
+
+    def call():
+        return _gemini_generate(prompt, stream, collector, generation_config)
 
+    limited = hedged("gemini", rate_limited("gemini", GEMINI_MODEL_ID, call, request_tokens, collector, budget), not stream, budget)
     try:
-        # Configure the Gemini API using your API key.
-        genai.configure(api_key=get_gemini_api_key())
-
-        # Construct the prompt by combining instructions, context, and new discussion topic.
-        prompt = (
-            f"You are {MODEL_NAME} participating in a multi-model dialogue. "
-            "Provide your contribution to the discussion and a vote "
-            "(true if more discussion is needed, false otherwise) in JSON format with keys 'contribution' and 'vote'.\n\n"
-            "IMPORTANT: When you see messages marked as 'YOUR PREVIOUS RESPONSE', "
-            "these are statements you made earlier in the conversation. Be consistent with your earlier points and build upon them."
-        )
-        if context_messages:
-            for msg in context_messages:
-                if isinstance(msg, dict) and 'model' in msg and 'content' in msg:
-                    if msg['model'] == MODEL_NAME:
-                        prompt += f"\nYOUR PREVIOUS RESPONSE: {msg['content']}"
-                    else:
-                        prompt += f"\n{msg['model']}: {msg['content']}"
-                elif isinstance(msg, dict) and 'role' in msg and 'content' in msg:
-                    prompt += f"\n{msg.get('role').capitalize()}: {msg.get('content')}"
-                elif isinstance(msg, str):
-                    prompt += f"\n{msg}"
-        prompt += f"\nUser: Discuss the following topic: {discussion_topic}"
-
-        # Instantiate a model instance using the correct class.
-        model = genai.GenerativeModel("gemini-2.0-flash")
-
-        # Generate content with the given prompt and generation configuration.
-        response = model.generate_content(
-            prompt,
-            generation_config={
-                "response_mime_type": "application/json",
-                "response_schema": GeminiResponse,
-            }
-        )
+        if budget is not None:
+            budget.check("gemini", model_id=GEMINI_MODEL_ID, input_tokens=request_tokens)
+        return collector.finish(cached_call("gemini", GEMINI_MODEL_ID, prompt, key_config, limited, generation_config == key_config, partial(record_cached, GEMINI_MODEL_NAME)))
+    except CacheMissError:
+        raise
+    except Exception as e:
+        return collector.finish(_gemini_error(e))
 
-        # Manually parse the response JSON from response.text.
-        parsed = json.loads(response.text)
-        gemini_response = GeminiResponse(**parsed)
-        return {"model": MODEL_NAME, "contribution": gemini_response.contribution, "vote": gemini_response.vote}
-    
+async def gemini_chat_async(discussion_topic, context_messages=None, stream=False, on_token=None, budget=None, participant=None):
+    """
+    Async variant of gemini_chat using generate_content_async.
+    """
+    prompt = _gemini_prompt(discussion_topic, context_messages, participant)
+    request_tokens = estimate_request_tokens(prompt)
+    key_config = with_length_cap(GEMINI_GENERATION_CONFIG, GEMINI_MODEL_NAME, "max_output_tokens")
+    generation_config = with_output_cap(key_config, budget, GEMINI_MODEL_ID, request_tokens, "max_output_tokens")
+    collector = ContributionStream(on_token)
+
+    async def call():
+        if config.GEMINI_TRANSPORT == "rest":
+            # The SDK has no async REST transport; run the blocking call in a
+            # worker thread, handing streamed pieces back to the event loop.
+            if collector.on_token is not None:
+                collector.on_token = _on_loop(asyncio.get_running_loop(), on_token)
+            return await asyncio.to_thread(_gemini_generate, prompt, stream, collector, generation_config)
+        model = get_gemini_model(GEMINI_MODEL_ID)
+        reask = _gemini_reask_async(model, prompt, generation_config)
+        if stream:
+            chunks = await model.generate_content_async(prompt, generation_config=generation_config, stream=True, request_options=_gemini_request_options())
+            return await aparse_or_reask(GEMINI_MODEL_NAME, await collector.aconsume(gemini_text_deltas_async(chunks)), reask)
+        response = await model.generate_content_async(prompt, generation_config=generation_config, request_options=_gemini_request_options())
+        record_usage(response.usage_metadata)
+        return await aparse_or_reask(GEMINI_MODEL_NAME, response.text, reask)
+
+    limited = hedged_async("gemini", rate_limited_async("gemini", GEMINI_MODEL_ID, call, request_tokens, collector, budget), not stream, budget)
+    try:
+        if budget is not None:
+            budget.check("gemini", model_id=GEMINI_MODEL_ID, input_tokens=request_tokens)
+        return collector.finish(await cached_call_async("gemini", GEMINI_MODEL_ID, prompt, key_config, limited, generation_config == key_config, partial(record_cached, GEMINI_MODEL_NAME)))
+    except CacheMissError:
+        raise
     except Exception as e:
-        print(f"Gemini API error: {e}")
-        print(traceback.format_exc())
-        return {"model": MODEL_NAME, "contribution": "I encountered an error processing your request. This could be due to a connectivity issue or a problem with the Gemini API.", "vote": False}
+        return collector.finish(_gemini_error(e))
 
 ##############################
 # Grok Integration (xAI)
 ##############################
-def grok_chat(discussion_topic, context_messages=None):
+GROK_MODEL_NAME = "Grok"
+GROK_MODEL_ID = "grok-2-latest"
+
+def _grok_messages(discussion_topic, context_messages=None, participant=None):
     """
-    Calls the Grok-2-latest API with structured output.
-    
-    Returns a GrokResponse instance with keys 'contribution' and 'vote'.
-    """
-    from pydantic import BaseModel
-    from openai import OpenAI
-    import json
-    
-    MODEL_NAME = "Grok"
-
-    class GrokResponse(BaseModel):
-        contribution: str
-        vote: bool
-
-    # Build proper message format with clearer instructions about the vote field
-    system_prompt = get_default_system_prompt(MODEL_NAME) + """
-    IMPORTANT: Your response must be in valid JSON format with exactly these two fields:
-    1. 'contribution': Your thoughts on the topic
-    2. 'vote': A boolean value (true/false) indicating ONLY whether further discussion is needed
-       - true = more discussion is needed
-       - false = discussion can conclude
-    
-    CRITICAL INSTRUCTION: You MUST refer to other models by their exact names (e.g., "GPT-4o", "Claude", "Gemini", etc.) 
-    when responding to their points. Use conversational language as if you're talking directly to them in a chat.
-    
-    IMPORTANT: Pay attention to which previous messages were YOUR OWN contributions. When you see messages marked as 
-    "YOUR PREVIOUS RESPONSE", be sure to maintain consistency with your earlier statements and build upon them.
-    
-    Example response:
-    {
-        "contribution": "I see what GPT-4o is saying about X, but I think Claude's perspective on Y makes more sense because...",
-        "vote": true
-    }
-    """
-    
+    Builds the Grok message list with clearer instructions about the vote field.
+    """
+    MODEL_NAME = participant or GROK_MODEL_NAME
+
+    system_prompt = get_system_prompt(MODEL_NAME)
+
     messages = [{"role": "system", "content": system_prompt}]
-    
-    # Format context messages correctly with model identities
+
+    # Previously rendered context, marking this model's own responses
     if context_messages:
-        formatted_context = []
-        for msg in context_messages:
-            if isinstance(msg, dict) and 'role' in msg and 'content' in msg:
-                formatted_context.append(msg)
-            elif isinstance(msg, dict) and 'model' in msg and 'content' in msg:
-                # Include model identity and mark the model's own previous responses
-                if msg['model'] == MODEL_NAME:
-                    formatted_context.append({
-                        "role": "assistant", 
-                        "content": f"YOUR PREVIOUS RESPONSE: {msg['content']}"
-                    })
-                else:
-                    formatted_context.append({
-                        "role": "assistant", 
-                        "content": f"{msg['model']}: {msg['content']}"
-                    })
-            elif isinstance(msg, str):
-                formatted_context.append({"role": "assistant", "content": msg})
-        messages.extend(formatted_context)
-    
+        messages.extend(as_transcript(context_messages).render(MODEL_NAME, CHAT_FORMAT))
+
     messages.append({"role": "user", "content": f"Discuss the following topic and respond in JSON format with 'contribution' and 'vote' fields (vote must be true or false): {discussion_topic}"})
-    
-    client = OpenAI(
-        api_key=get_xai_api_key(),
-        base_url="https://api.x.ai/v1",
-    )
-    
-    try:
+    return messages
+
+def _grok_error(e):
+    print(f"Grok API error: {e}. Returning fallback response.")
+    return {"model": GROK_MODEL_NAME,
+           "contribution": "I encountered an error processing this request.",
+           "vote": False,
+           "error": str(e)}
+
+def grok_chat(discussion_topic, context_messages=None, stream=False, on_token=None, budget=None, participant=None):
+    """
+    Calls the Grok-2-latest API with structured output.
+
+    Returns a dict with 'model', 'contribution' and 'vote'; a failed call
+    or unusable reply also carries an 'error' key and casts no vote.
+    """
+    messages = _grok_messages(discussion_topic, context_messages, participant)
+    params = {"response_format": {"type": "json_object"}}
+    request_tokens = estimate_request_tokens(messages)
+    key_params = with_length_cap(params, GROK_MODEL_NAME)
+    call_params = with_output_cap(key_params, budget, GROK_MODEL_ID, request_tokens)
+    collector = ContributionStream(on_token)
+
+    def call():
+        client = get_client("xai")
+        reask = _chat_reask(client, GROK_MODEL_ID, messages, call_params)
+        if stream:
+            chunks = client.chat.completions.create(model=GROK_MODEL_ID, messages=messages, stream=True, stream_options=STREAM_USAGE_OPTIONS, **call_params)
+            return parse_or_reask(GROK_MODEL_NAME, collector.consume(openai_text_deltas(chunks)), reask)
         # Try traditional completion first for Grok
         completion = client.chat.completions.create(
-            model="grok-2-latest",
+            model=GROK_MODEL_ID,
+            messages=messages,
+            **call_params,
+        )
+        record_usage(completion.usage)
+        return parse_or_reask(GROK_MODEL_NAME, completion.choices[0].message.content, reask)
+
+    limited = hedged("xai", rate_limited("xai", GROK_MODEL_ID, call, request_tokens, collector, budget), not stream, budget)
+    try:
+        if budget is not None:
+            budget.check("xai", model_id=GROK_MODEL_ID, input_tokens=request_tokens)
+        return collector.finish(cached_call("xai", GROK_MODEL_ID, messages, key_params, limited, call_params == key_params, partial(record_cached, GROK_MODEL_NAME)))
+    except CacheMissError:
+        raise
+    except Exception as e:
+        return collector.finish(_grok_error(e))
+
+async def grok_chat_async(discussion_topic, context_messages=None, stream=False, on_token=None, budget=None, participant=None):
+    """
+    Async variant of grok_chat using the OpenAI async client against the xAI endpoint.
+    """
+    messages = _grok_messages(discussion_topic, context_messages, participant)
+    params = {"response_format": {"type": "json_object"}}
+    request_tokens = estimate_request_tokens(messages)
+    key_params = with_length_cap(params, GROK_MODEL_NAME)
+    call_params = with_output_cap(key_params, budget, GROK_MODEL_ID, request_tokens)
+    collector = ContributionStream(on_token)
+
+    async def call():
+        client = get_async_client("xai")
+        reask = _chat_reask_async(client, GROK_MODEL_ID, messages, call_params)
+        if stream:
+            chunks = await client.chat.completions.create(model=GROK_MODEL_ID, messages=messages, stream=True, stream_options=STREAM_USAGE_OPTIONS, **call_params)
+            return await aparse_or_reask(GROK_MODEL_NAME, await collector.aconsume(openai_text_deltas_async(chunks)), reask)
+        completion = await client.chat.completions.create(
+            model=GROK_MODEL_ID,
             messages=messages,
-            response_format={"type": "json_object"}
+            **call_params,
         )
-        
-        try:
-            response_text = completion.choices[0].message.content.strip()
-            # Fix the case where response is just "Grok"
-            if response_text == "Grok" or not response_text:
-                return {"model": MODEL_NAME, 
-                        "contribution": "I need more information to provide a meaningful response.", 
-                        "vote": True}
-                
-            response_json = json.loads(response_text)
-            # Parse the vote, ensuring it's a proper boolean
-            vote_value = response_json.get("vote")
-            if isinstance(vote_value, bool):
-                parsed_vote = vote_value
-            elif isinstance(vote_value, str):
-                # Try to interpret string values as booleans
-                parsed_vote = vote_value.lower() in ['true', 'yes', '1', 't', 'y']
-            else:
-                parsed_vote = True  # Default to True if we can't parse it
-                
-            return {"model": MODEL_NAME, 
-                   "contribution": response_json.get("contribution", response_text), 
-                   "vote": parsed_vote}
-        except Exception as json_err:
-            print(f"JSON parsing error: {json_err}. Using raw content.")
-            return {"model": MODEL_NAME, 
-                   "contribution": completion.choices[0].message.content or "No meaningful response received.", 
-                   "vote": False}
-                   
+        record_usage(completion.usage)
+        return await aparse_or_reask(GROK_MODEL_NAME, completion.choices[0].message.content, reask)
+
+    limited = hedged_async("xai", rate_limited_async("xai", GROK_MODEL_ID, call, request_tokens, collector, budget), not stream, budget)
+    try:
+        if budget is not None:
+            budget.check("xai", model_id=GROK_MODEL_ID, input_tokens=request_tokens)
+        return collector.finish(await cached_call_async("xai", GROK_MODEL_ID, messages, key_params, limited, call_params == key_params, partial(record_cached, GROK_MODEL_NAME)))
+    except CacheMissError:
+        raise
     except Exception as e:
-        print(f"Grok API error: {e}. Returning fallback response.")
-        return {"model": MODEL_NAME, 
-               "contribution": "I encountered an error processing this request.", 
-               "vote": False}
+        return collector.finish(_grok_error(e))
 
 ##############################
 # DeepSeek Integration
 ##############################
-def deepseek_chat(discussion_topic, context_messages=None, stream=False):
-    """
-    Calls the DeepSeek API for chat completions with structured output.
+DEEPSEEK_MODEL_NAME = "DeepSeek"
+DEEPSEEK_MODEL_ID = "deepseek-chat"
+
+def _deepseek_messages(discussion_topic, context_messages=None, participant=None):
     """
-    from pydantic import BaseModel
-    from openai import OpenAI
-    import re
-    
-    MODEL_NAME = "DeepSeek"
-
-    # Make the instructions more explicit about boolean values and addressing other models
-    system_prompt = get_default_system_prompt(MODEL_NAME) + """
-    Respond in JSON format with 'contribution' and 'vote' fields. The 'vote' field MUST be a boolean value (true or false, not 'Yes' or 'No').
-    
-    CRITICAL INSTRUCTION: You MUST refer to at least one previous model by their exact name (GPT-4o, Gemini, Grok, or Claude) when responding. 
-    Use conversational language as if you're directly talking to them in a group chat.
-    
-    IMPORTANT: Pay attention to which previous messages were YOUR OWN contributions. When you see messages marked as 
-    "YOUR PREVIOUS RESPONSE", be sure to maintain consistency with your earlier statements and build upon them.
-    
-    Example:
-    {"contribution": "I agree with what GPT-4o said about X, but Claude's point about Y makes me think...", "vote": true}
+    Builds the DeepSeek message list, explicit about boolean values and addressing other models.
     """
+    MODEL_NAME = participant or DEEPSEEK_MODEL_NAME
+
+    system_prompt = get_system_prompt(MODEL_NAME)
 
     messages = [{"role": "system", "content": system_prompt}]
-    
-    # Format context messages correctly with model identities
+
+    # Previously rendered context, marking this model's own responses
     if context_messages:
-        formatted_context = []
-        for msg in context_messages:
-            if isinstance(msg, dict) and 'role' in msg and 'content' in msg:
-                formatted_context.append(msg)
-            elif isinstance(msg, dict) and 'model' in msg and 'content' in msg:
-                # Include model identity and mark the model's own previous responses
-                if msg['model'] == MODEL_NAME:
-                    formatted_context.append({
-                        "role": "assistant", 
-                        "content": f"YOUR PREVIOUS RESPONSE: {msg['content']}"
-                    })
-                else:
-                    formatted_context.append({
-                        "role": "assistant", 
-                        "content": f"{msg['model']}: {msg['content']}"
-                    })
-            elif isinstance(msg, str):
-                formatted_context.append({"role": "assistant", "content": msg})
-        messages.extend(formatted_context)
-        
+        messages.extend(as_transcript(context_messages).render(MODEL_NAME, CHAT_FORMAT))
+
     # Explicitly mention boolean values in the user message
     messages.append({"role": "user", "content": f"Discuss the following topic and provide your answer in JSON format. The 'vote' field MUST be a boolean value (true or false, not 'Yes' or 'No'): {discussion_topic}"})
+    return messages
 
-    client = OpenAI(
-        api_key=get_deepseek_api_key(),
-        base_url="https://api.deepseek.com",
-    )
-    
-    try:
+def _deepseek_error(e):
+    print(f"DeepSeek API error: {e}. Returning fallback response.")
+    return {"model": DEEPSEEK_MODEL_NAME, "contribution": "I encountered an error when processing your request.", "vote": False, "error": str(e)}
+
+def deepseek_chat(discussion_topic, context_messages=None, stream=False, on_token=None, budget=None, participant=None):
+    """
+    Calls the DeepSeek API for chat completions with structured output.
+    """
+    messages = _deepseek_messages(discussion_topic, context_messages, participant)
+    params = {}
+    request_tokens = estimate_request_tokens(messages)
+    key_params = with_length_cap(params, DEEPSEEK_MODEL_NAME)
+    call_params = with_output_cap(key_params, budget, DEEPSEEK_MODEL_ID, request_tokens)
+    collector = ContributionStream(on_token)
+
+    def call():
+        client = get_client("deepseek")
+        reask = _chat_reask(client, DEEPSEEK_MODEL_ID, messages, call_params)
+        if stream:
+            chunks = client.chat.completions.create(model=DEEPSEEK_MODEL_ID, messages=messages, stream=True, stream_options=STREAM_USAGE_OPTIONS, **call_params)
+            return parse_or_reask(DEEPSEEK_MODEL_NAME, collector.consume(openai_text_deltas(chunks)), reask)
         # First try without response_format to avoid the error
         completion = client.chat.completions.create(
-            model="deepseek-chat",
+            model=DEEPSEEK_MODEL_ID,
+            messages=messages,
+            **call_params,
+        )
+        record_usage(completion.usage)
+        return parse_or_reask(DEEPSEEK_MODEL_NAME, completion.choices[0].message.content, reask)
+
+    limited = hedged("deepseek", rate_limited("deepseek", DEEPSEEK_MODEL_ID, call, request_tokens, collector, budget), not stream, budget)
+    try:
+        if budget is not None:
+            budget.check("deepseek", model_id=DEEPSEEK_MODEL_ID, input_tokens=request_tokens)
+        return collector.finish(cached_call("deepseek", DEEPSEEK_MODEL_ID, messages, key_params, limited, call_params == key_params, partial(record_cached, DEEPSEEK_MODEL_NAME)))
+    except CacheMissError:
+        raise
+    except Exception as e:
+        return collector.finish(_deepseek_error(e))
+
+async def deepseek_chat_async(discussion_topic, context_messages=None, stream=False, on_token=None, budget=None, participant=None):
+    """
+    Async variant of deepseek_chat using the OpenAI async client against the DeepSeek endpoint.
+    """
+    messages = _deepseek_messages(discussion_topic, context_messages, participant)
+    params = {}
+    request_tokens = estimate_request_tokens(messages)
+    key_params = with_length_cap(params, DEEPSEEK_MODEL_NAME)
+    call_params = with_output_cap(key_params, budget, DEEPSEEK_MODEL_ID, request_tokens)
+    collector = ContributionStream(on_token)
+
+    async def call():
+        client = get_async_client("deepseek")
+        reask = _chat_reask_async(client, DEEPSEEK_MODEL_ID, messages, call_params)
+        if stream:
+            chunks = await client.chat.completions.create(model=DEEPSEEK_MODEL_ID, messages=messages, stream=True, stream_options=STREAM_USAGE_OPTIONS, **call_params)
+            return await aparse_or_reask(DEEPSEEK_MODEL_NAME, await collector.aconsume(openai_text_deltas_async(chunks)), reask)
+        completion = await client.chat.completions.create(
+            model=DEEPSEEK_MODEL_ID,
             messages=messages,
-            stream=stream
+            **call_params,
         )
-        
-        content = completion.choices[0].message.content
-        try:
-            # Check if the content is inside JSON code block
-            if "```json" in content:
-                # Extract JSON from code block
-                json_match = re.search(r'```json\s*(.*?)\s*```', content, re.DOTALL)
-                if json_match:
-                    content = json_match.group(1)
-            
-            parsed_output = json.loads(content)
-            
-            # Convert string votes to boolean values
-            vote = parsed_output.get("vote", False)
-            if isinstance(vote, str):
-                # Convert string votes like "Yes", "No", "True", "False" to boolean values
-                normalized_vote = vote.lower()
-                if normalized_vote in ["true", "yes", "y", "1"]:
-                    vote = True
-                else:
-                    vote = False
-            
-            return {"model": MODEL_NAME, "contribution": parsed_output.get("contribution", ""), "vote": vote}
-        except json.JSONDecodeError:
-            # If not valid JSON, check for vote:true or vote:false in the text
-            if '"vote": true' in content or '"vote":true' in content:
-                vote = True
-            else:
-                vote = False
-            return {"model": MODEL_NAME, "contribution": content, "vote": vote}
+        record_usage(completion.usage)
+        return await aparse_or_reask(DEEPSEEK_MODEL_NAME, completion.choices[0].message.content, reask)
+
+    limited = hedged_async("deepseek", rate_limited_async("deepseek", DEEPSEEK_MODEL_ID, call, request_tokens, collector, budget), not stream, budget)
+    try:
+        if budget is not None:
+            budget.check("deepseek", model_id=DEEPSEEK_MODEL_ID, input_tokens=request_tokens)
+        return collector.finish(await cached_call_async("deepseek", DEEPSEEK_MODEL_ID, messages, key_params, limited, call_params == key_params, partial(record_cached, DEEPSEEK_MODEL_NAME)))
+    except CacheMissError:
+        raise
     except Exception as e:
-        print(f"DeepSeek API error: {e}. Returning fallback response.")
-        return {"model": MODEL_NAME, "contribution": "I encountered an error when processing your request.", "vote": False}
+        return collector.finish(_deepseek_error(e))
 
 ##############################
 # Claude (Anthropic) Integration
 ##############################
-def claude_chat(discussion_topic, context_messages=None, system_prompt=None):
+CLAUDE_MODEL_NAME = "Claude"
+CLAUDE_MODEL_ID = "claude-3-5-haiku-20241022"
+# Output cap the Anthropic API requires; a budget may lower it per call
+CLAUDE_MAX_TOKENS = 2048
+# Prompt cache breakpoint (five-minute cache)
+CLAUDE_CACHE_CONTROL = {"type": "ephemeral"}
+
+def _claude_request(discussion_topic, context_messages=None, system_prompt=None, participant=None):
     """
-    Calls the Anthropic Claude API with structured output.
+    Builds the (system, messages) pair for the Anthropic messages API.
     """
-    import anthropic
-    
-    MODEL_NAME = "Claude"
+    MODEL_NAME = participant or CLAUDE_MODEL_NAME
+
+    default_system = get_system_prompt(MODEL_NAME)
 
-    default_system = get_default_system_prompt(MODEL_NAME) + """
-    CRITICAL INSTRUCTION: You MUST refer to at least one previous model by their exact name (GPT-4o, Gemini, Grok, or DeepSeek) when responding.
-    Use conversational language as if you're directly talking to them in a group chat. For example: "I see GPT-4o's point about X, but I think..."
-    
-    IMPORTANT: Pay attention to which previous messages were YOUR OWN contributions. When you see messages marked as 
-    "YOUR PREVIOUS RESPONSE", be sure to maintain consistency with your earlier statements and build upon them.
-    """
-    
     system = system_prompt if system_prompt is not None else default_system
 
-    # Format context messages correctly
+    # Previously rendered context, marking this model's own responses
     formatted_messages = []
     if context_messages:
-        for msg in context_messages:
-            if isinstance(msg, dict) and 'role' in msg and 'content' in msg:
-                if msg['role'] in ['user', 'assistant']:
-                    formatted_messages.append(msg)
-                else:
-                    formatted_messages.append({"role": "assistant", "content": msg['content']})
-            elif isinstance(msg, dict) and 'model' in msg and 'content' in msg:
-                # Include model identity and mark the model's own previous responses
-                if msg['model'] == MODEL_NAME:
-                    formatted_messages.append({
-                        "role": "assistant", 
-                        "content": f"YOUR PREVIOUS RESPONSE: {msg['content']}"
-                    })
-                else:
-                    formatted_messages.append({
-                        "role": "assistant", 
-                        "content": f"{msg['model']}: {msg['content']}"
-                    })
-            elif isinstance(msg, str):
-                formatted_messages.append({"role": "assistant", "content": msg})
-    
+        formatted_messages.extend(as_transcript(context_messages).render(MODEL_NAME, ANTHROPIC_FORMAT))
+
+    if config.ANTHROPIC_PROMPT_CACHING:
+        system, formatted_messages = _claude_cache_breakpoints(system, formatted_messages)
+
     formatted_messages.append({"role": "user", "content": f"Discuss the following topic: {discussion_topic}"})
+    return system, formatted_messages
 
-    client = anthropic.Anthropic(api_key=get_anthropic_api_key())
-    
-    try:
+def _claude_cache_breakpoints(system, history):
+    """
+    Marks the system prompt and the end of the history as Anthropic prompt cache breakpoints.
+
+    The history only grows between turns, so the next call's prefix up to
+    this breakpoint is read from the cache instead of being processed again.
+    The shared rendered history is not modified; its last message is copied.
+    """
+    system = [{"type": "text", "text": system, "cache_control": CLAUDE_CACHE_CONTROL}]
+    if history and isinstance(history[-1].get("content"), str):
+        last = history[-1]
+        history = history[:-1] + [{
+            "role": last["role"],
+            "content": [{"type": "text", "text": last["content"], "cache_control": CLAUDE_CACHE_CONTROL}],
+        }]
+    return system, history
+
+def _claude_reask(client, formatted_messages, params):
+    """
+    Returns a function asking Claude to restate an unparseable reply as JSON.
+    """
+    params = _reask_params(params)
+
+    def reask(raw):
+        response = client.messages.create(model=CLAUDE_MODEL_ID, messages=_repair_messages(formatted_messages, raw), **params)
+        record_usage(response.usage, accumulate=True)
+        return response.content[0].text
+    return reask
+
+def _claude_reask_async(client, formatted_messages, params):
+    """
+    Async variant of _claude_reask.
+    """
+    params = _reask_params(params)
+
+    async def reask(raw):
+        response = await client.messages.create(model=CLAUDE_MODEL_ID, messages=_repair_messages(formatted_messages, raw), **params)
+        record_usage(response.usage, accumulate=True)
+        return response.content[0].text
+    return reask
+
+def _claude_error(e):
+    print(f"Claude API error: {e}. Returning fallback response.")
+    return {"model": CLAUDE_MODEL_NAME, "contribution": "I encountered an error when processing your request.", "vote": False, "error": str(e)}
+
+def claude_chat(discussion_topic, context_messages=None, system_prompt=None, stream=False, on_token=None, budget=None, participant=None):
+    """
+    Calls the Anthropic Claude API with structured output.
+    """
+    system, formatted_messages = _claude_request(discussion_topic, context_messages, system_prompt, participant)
+    params = {"max_tokens": CLAUDE_MAX_TOKENS, "system": system}
+    request_tokens = estimate_request_tokens(formatted_messages)
+    key_params = with_length_cap(params, CLAUDE_MODEL_NAME)
+    call_params = with_output_cap(key_params, budget, CLAUDE_MODEL_ID, request_tokens)
+    collector = ContributionStream(on_token)
+
+    def call():
+        client = get_client("anthropic")
+        reask = _claude_reask(client, formatted_messages, call_params)
+        if stream:
+            with client.messages.stream(model=CLAUDE_MODEL_ID, messages=formatted_messages, **call_params) as response:
+                text = collector.consume(response.text_stream)
+                record_usage(response.get_final_message().usage)
+                return parse_or_reask(CLAUDE_MODEL_NAME, text, reask)
         response = client.messages.create(
-            model="claude-3-5-haiku-20241022",
-            max_tokens=2048,
-            system=system,
-            messages=formatted_messages
+            model=CLAUDE_MODEL_ID,
+            messages=formatted_messages,
+            **call_params,
         )
-        
+        record_usage(response.usage)
         # Fix the JSON parsing issue
-        content = response.content[0].text if isinstance(response.content, list) else response.content
-        
-        try:
-            parsed = json.loads(content)
-            return {"model": MODEL_NAME, "contribution": parsed.get("contribution", ""), "vote": parsed.get("vote", False)}
-        except json.JSONDecodeError:
-            # If not valid JSON, use the raw content
-            return {"model": MODEL_NAME, "contribution": content, "vote": False}
+        return parse_or_reask(CLAUDE_MODEL_NAME, response.content[0].text if isinstance(response.content, list) else response.content, reask)
+
+    limited = hedged("anthropic", rate_limited("anthropic", CLAUDE_MODEL_ID, call, request_tokens, collector, budget), not stream, budget)
+    try:
+        if budget is not None:
+            budget.check("anthropic", model_id=CLAUDE_MODEL_ID, input_tokens=request_tokens)
+        return collector.finish(cached_call("anthropic", CLAUDE_MODEL_ID, formatted_messages, key_params, limited, call_params == key_params, partial(record_cached, CLAUDE_MODEL_NAME)))
+    except CacheMissError:
+        raise
+    except Exception as e:
+        return collector.finish(_claude_error(e))
+
+async def claude_chat_async(discussion_topic, context_messages=None, system_prompt=None, stream=False, on_token=None, budget=None, participant=None):
+    """
+    Async variant of claude_chat using the Anthropic async client.
+    """
+    system, formatted_messages = _claude_request(discussion_topic, context_messages, system_prompt, participant)
+    params = {"max_tokens": CLAUDE_MAX_TOKENS, "system": system}
+    request_tokens = estimate_request_tokens(formatted_messages)
+    key_params = with_length_cap(params, CLAUDE_MODEL_NAME)
+    call_params = with_output_cap(key_params, budget, CLAUDE_MODEL_ID, request_tokens)
+    collector = ContributionStream(on_token)
+
+    async def call():
+        client = get_async_client("anthropic")
+        reask = _claude_reask_async(client, formatted_messages, call_params)
+        if stream:
+            async with client.messages.stream(model=CLAUDE_MODEL_ID, messages=formatted_messages, **call_params) as response:
+                text = await collector.aconsume(response.text_stream)
+                record_usage((await response.get_final_message()).usage)
+                return await aparse_or_reask(CLAUDE_MODEL_NAME, text, reask)
+        response = await client.messages.create(
+            model=CLAUDE_MODEL_ID,
+            messages=formatted_messages,
+            **call_params,
+        )
+        record_usage(response.usage)
+        return await aparse_or_reask(CLAUDE_MODEL_NAME, response.content[0].text if isinstance(response.content, list) else response.content, reask)
+
+    limited = hedged_async("anthropic", rate_limited_async("anthropic", CLAUDE_MODEL_ID, call, request_tokens, collector, budget), not stream, budget)
+    try:
+        if budget is not None:
+            budget.check("anthropic", model_id=CLAUDE_MODEL_ID, input_tokens=request_tokens)
+        return collector.finish(await cached_call_async("anthropic", CLAUDE_MODEL_ID, formatted_messages, key_params, limited, call_params == key_params, partial(record_cached, CLAUDE_MODEL_NAME)))
+    except CacheMissError:
+        raise
     except Exception as e:
-        print(f"Claude API error: {e}. Returning fallback response.")
-        return {"model": MODEL_NAME, "contribution": "I encountered an error when processing your request.", "vote": False}
+        return collector.finish(_claude_error(e))
+
+# Display name of the participant behind each chat function.
+CHAT_MODEL_NAMES = {
+    gpt4o_chat: GPT4O_MODEL_NAME,
+    gemini_chat: GEMINI_MODEL_NAME,
+    grok_chat: GROK_MODEL_NAME,
+    deepseek_chat: DEEPSEEK_MODEL_NAME,
+    claude_chat: CLAUDE_MODEL_NAME,
+}
+
+# Registry of participants by display name, in discussion order.
+CHAT_FUNCTIONS = {name: chat_fn for chat_fn, name in CHAT_MODEL_NAMES.items()}
+
+def get_enabled_chat_functions():
+    """
+    Returns the chat functions of the participants enabled in config.ENABLED_MODELS.
+
+    Disabled participants are never called, so their SDKs are never imported.
+    """
+    if config.ENABLED_MODELS is None:
+        return list(CHAT_FUNCTIONS.values())
+    unknown = set(config.ENABLED_MODELS) - set(CHAT_FUNCTIONS)
+    if unknown:
+        raise ValueError(f"Unknown models in ENABLED_MODELS: {', '.join(sorted(unknown))}")
+    return [chat_fn for name, chat_fn in CHAT_FUNCTIONS.items() if name in config.ENABLED_MODELS]
+
+# Maps each blocking chat function to its asyncio counterpart.
+ASYNC_CHAT_FUNCTIONS = {
+    gpt4o_chat: gpt4o_chat_async,
+    gemini_chat: gemini_chat_async,
+    grok_chat: grok_chat_async,
+    deepseek_chat: deepseek_chat_async,
+    claude_chat: claude_chat_async,
+}
+
+# Provider serving each chat function, as in config.RATE_LIMITS.
+CHAT_PROVIDERS = {
+    gpt4o_chat: "openai",
+    gemini_chat: "gemini",
+    grok_chat: "xai",
+    deepseek_chat: "deepseek",
+    claude_chat: "anthropic",
+}
+
+async def _chat_async(chat_fn, provider_limits, discussion_topic, **kwargs):
+    # Calls chat_fn's async counterpart, holding a slot of its provider's semaphore if limits are given.
+    if provider_limits is None:
+        return await ASYNC_CHAT_FUNCTIONS[chat_fn](discussion_topic, **kwargs)
+    async with provider_limits[CHAT_PROVIDERS[chat_fn]]:
+        return await ASYNC_CHAT_FUNCTIONS[chat_fn](discussion_topic, **kwargs)
+
+def _fallback_function(chat_fn):
+    # Chat function answering for chat_fn's participant when it fails, if one is configured
+    name = CHAT_MODEL_NAMES[chat_fn]
+    fallback = config.FALLBACK_MODELS.get(name)
+    if fallback is None or fallback == name:
+        return None
+    if fallback not in CHAT_FUNCTIONS:
+        raise ValueError(f"Unknown fallback model for {name}: {fallback}")
+    return CHAT_FUNCTIONS[fallback]
+
+def _withdraw_streamed(kwargs):
+    # The failed call's streamed text (or error message) is replaced by the fallback's answer.
+    on_token = kwargs.get("on_token")
+    if kwargs.get("stream") and on_token is not None:
+        on_token(None)
+
+def _fallback_result(result, fallback_result, name, fallback_fn):
+    if fallback_result.get("error"):
+        return result
+    return dict(fallback_result, model=name, fallback=CHAT_MODEL_NAMES[fallback_fn])
+
+def chat_with_fallback(chat_fn, discussion_topic, **kwargs):
+    """
+    Calls chat_fn, letting its participant's fallback (config.FALLBACK_MODELS) answer if the call fails.
+
+    A call fails with an error result, which includes missing its deadline.
+    The fallback model, on another provider, is prompted as the participant
+    and its answer is returned under the participant's name, with
+    "fallback" set to the model that gave it. If the fallback fails too,
+    the original error result is returned. When streaming, on_token(None)
+    withdraws the failed call's text before the fallback streams its own.
+
+    Args:
+        chat_fn: Blocking chat function of the participant
+        discussion_topic: The discussion topic
+        **kwargs: Further arguments for the chat functions
+    """
+    result = chat_fn(discussion_topic, **kwargs)
+    fallback_fn = _fallback_function(chat_fn)
+    if not result.get("error") or fallback_fn is None:
+        return result
+    name = CHAT_MODEL_NAMES[chat_fn]
+    _withdraw_streamed(kwargs)
+    print(f"{CHAT_MODEL_NAMES[fallback_fn]} is answering for {name}.")
+    return _fallback_result(result, fallback_fn(discussion_topic, participant=name, **kwargs), name, fallback_fn)
+
+async def chat_with_fallback_async(chat_fn, discussion_topic, provider_limits=None, **kwargs):
+    """
+    Async variant of chat_with_fallback; chat_fn is still the blocking function, as in ASYNC_CHAT_FUNCTIONS.
+
+    provider_limits optionally maps provider identifiers (see CHAT_PROVIDERS)
+    to asyncio.Semaphores; each call holds a slot of the provider that
+    serves it, so a fallback counts against its own provider.
+    """
+    result = await _chat_async(chat_fn, provider_limits, discussion_topic, **kwargs)
+    fallback_fn = _fallback_function(chat_fn)
+    if not result.get("error") or fallback_fn is None:
+        return result
+    name = CHAT_MODEL_NAMES[chat_fn]
+    _withdraw_streamed(kwargs)
+    print(f"{CHAT_MODEL_NAMES[fallback_fn]} is answering for {name}.")
+    fallback_result = await _chat_async(fallback_fn, provider_limits, discussion_topic, participant=name, **kwargs)
+    return _fallback_result(result, fallback_result, name, fallback_fn)
+
+##############################
+# Summarization (GPT-4o)
+##############################
+
+def _summary_messages(prompt):
+    return [{"role": "system", "content": SUMMARIZER_SYSTEM_PROMPT}, {"role": "user", "content": prompt}]
+
+def _summary_error(e):
+    print(f"Summary API error: {e}.")
+    return None
+
+def summary_chat(prompt, max_tokens, budget=None, reserve=False):
+    """
+    Calls GPT-4o with the summarizer system prompt and returns the plain-text reply, or None on error.
+
+    Args:
+        prompt: The summarization request
+        max_tokens: Output token cap
+        budget: Optional Budget of the discussion being summarized
+        reserve: Leave the budget's summary reserve untouched (for running
+            updates); the final summary may use it
+    """
+    messages = _summary_messages(prompt)
+    params = {"max_tokens": max_tokens}
+    request_tokens = estimate_request_tokens(messages)
+    call_params = with_output_cap(params, budget, GPT4O_MODEL_ID, request_tokens, reserve=reserve)
+
+    def call():
+        completion = get_client("openai").chat.completions.create(model=GPT4O_MODEL_ID, messages=messages, **call_params)
+        record_usage(completion.usage)
+        return {"model": GPT4O_MODEL_NAME, "contribution": completion.choices[0].message.content}
+
+    limited = hedged("openai", rate_limited("openai", GPT4O_MODEL_ID, call, request_tokens, budget=budget), hedge=False)
+    try:
+        if budget is not None:
+            budget.check("openai", reserve, GPT4O_MODEL_ID, request_tokens)
+        return cached_call("openai", GPT4O_MODEL_ID, messages, params, limited, call_params == params)["contribution"]
+    except CacheMissError:
+        raise
+    except Exception as e:
+        return _summary_error(e)
+
+async def summary_chat_async(prompt, max_tokens, budget=None, reserve=False):
+    """
+    Async variant of summary_chat.
+    """
+    messages = _summary_messages(prompt)
+    params = {"max_tokens": max_tokens}
+    request_tokens = estimate_request_tokens(messages)
+    call_params = with_output_cap(params, budget, GPT4O_MODEL_ID, request_tokens, reserve=reserve)
+
+    async def call():
+        completion = await get_async_client("openai").chat.completions.create(model=GPT4O_MODEL_ID, messages=messages, **call_params)
+        record_usage(completion.usage)
+        return {"model": GPT4O_MODEL_NAME, "contribution": completion.choices[0].message.content}
+
+    limited = hedged_async("openai", rate_limited_async("openai", GPT4O_MODEL_ID, call, request_tokens, budget=budget), hedge=False)
+    try:
+        if budget is not None:
+            budget.check("openai", reserve, GPT4O_MODEL_ID, request_tokens)
+        return (await cached_call_async("openai", GPT4O_MODEL_ID, messages, params, limited, call_params == params))["contribution"]
+    except CacheMissError:
+        raise
+    except Exception as e:
+        return _summary_error(e)
 
 def summarize_discussion(discussion_context, discussion_topic=None):
     """
-    Summarize the discussion context into a final answer.
-    The function takes a list of discussion contributions and returns a summary string.
-    
+    Summarize the discussion context into a final answer in a single call.
+
+    Discussions run from main.py and batch.py are summarized incrementally by
+    summarizer.RunningSummary instead; this is the one-shot equivalent.
+
     Args:
-        discussion_context: List of discussion contributions
+        discussion_context: Transcript or list of discussion contributions
         discussion_topic: Original topic provided by the user (optional)
     """
-    # Convert dictionary items to strings before joining
-    formatted_context = []
-    for item in discussion_context:
-        if isinstance(item, dict):
-            # Format dictionary items appropriately
-            if 'model' in item and 'contribution' in item:
-                formatted_context.append(f"{item['model']}: {item['contribution']}")
-            elif 'content' in item:
-                role = item.get('role', '')
-                formatted_context.append(f"{role.capitalize() if role else ''}{': ' if role else ''}{item['content']}")
-        elif isinstance(item, str):
-            formatted_context.append(item)
-    
-    combined_context = "\n".join(formatted_context)
-    
-    # Add the original discussion topic to the summary prompt if provided
-    topic_context = f"Original discussion topic: {discussion_topic}\n\n" if discussion_topic else ""
-    
-    summary_prompt = (
-        "You are a summarization assistant. "
-        f"{topic_context}"
-        "Given the following discussion transcript, "
-        "please provide a concise final summary that directly addresses the original topic:\n\n" + combined_context
-    )
-    
-    summary_result = gpt4o_chat(summary_prompt, context_messages=[])
-    return summary_result.get("contribution", "No summary available.")
+    # One "Model: contribution" line per entry
+    transcript_text = as_transcript(discussion_context).render(None, TEXT_FORMAT).strip()
+    summary = summary_chat(get_final_summary_prompt(discussion_topic, None, transcript_text), config.FINAL_SUMMARY_MAX_TOKENS)
+    return summary or "No summary available."
@@ -0,0 +1,142 @@
+"""
+Local convergence detection for Neural-Chat discussions.
+
+Models often keep voting to continue while restating each other. A
+NoveltyDetector scores how much each finished round adds to the discussion:
+every contribution becomes a hashed TF-IDF vector of its words and word
+pairs, and a round's novelty is one minus the average cosine similarity of
+its contributions to their closest match in earlier rounds. Everything is
+computed locally with NumPy; no model is called. Turns of failed calls
+(error and fallback messages such as "No meaningful response received.")
+are left out, so repeated failures do not read as repetition.
+
+When novelty falls below config.NOVELTY_THRESHOLD for
+config.NOVELTY_PATIENCE consecutive rounds, the discussion is stopped even
+if the vote says to continue.
+"""
+
+import re
+import zlib
+
+import config
+from context_window import estimate_tokens
+from transcript import Turn
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+# Number of hashed features per vector
+FEATURES = 1 << 14
+
+def _features(text):
+    # Hashed ids of the words and adjacent word pairs of a contribution.
+    words = _WORD.findall(text.lower())
+    terms = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    return [zlib.crc32(term.encode("utf-8")) % FEATURES for term in terms]
+
+def _entry_content(entry):
+    if isinstance(entry, Turn):
+        return str(entry.content)
+    if isinstance(entry, dict):
+        return str(entry.get("content", ""))
+    return str(entry)
+
+class NoveltyDetector:
+    """
+    Scores the novelty of each round of one discussion.
+
+    Args:
+        threshold: Novelty below which a round counts as repetitive;
+            defaults to config.NOVELTY_THRESHOLD (None disables stopping)
+        patience: Consecutive repetitive rounds needed to stop; defaults to
+            config.NOVELTY_PATIENCE
+
+    Attributes:
+        scores: Novelty of every scored round, in order (the first round is 1.0)
+        rounds_saved: Rounds left before MAX_DISCUSSION_ROUNDS when the detector stopped the discussion
+        tokens_saved: Estimated tokens those rounds would have used
+    """
+
+    def __init__(self, threshold=None, patience=None):
+        self.threshold = config.NOVELTY_THRESHOLD if threshold is None else threshold
+        self.patience = config.NOVELTY_PATIENCE if patience is None else patience
+        self.scores = []
+        self.rounds_saved = 0
+        self.tokens_saved = 0
+        self._documents = []  # array of hashed features per contribution
+        self._low_rounds = 0
+
+    @property
+    def enabled(self):
+        return self.threshold is not None
+
+    def score_round(self, contributions):
+        """
+        Adds a round's contributions and returns its novelty against the earlier rounds.
+
+        Args:
+            contributions: Texts of the round's contributions
+
+        Returns:
+            Novelty in [0, 1]; 1.0 for the first round or an empty round
+        """
+        import numpy as np
+
+        first = len(self._documents)
+        self._documents.extend(np.array(_features(text), dtype=np.int64) for text in contributions)
+        if first == 0 or first == len(self._documents):
+            self.scores.append(1.0)
+            return 1.0
+
+        # Term counts of every contribution so far, one row per contribution,
+        # over the features that actually occur.
+        lengths = np.fromiter((len(doc) for doc in self._documents), dtype=np.int64, count=len(self._documents))
+        rows = np.repeat(np.arange(len(self._documents)), lengths)
+        features = np.concatenate(self._documents)
+        vocabulary, columns = np.unique(features, return_inverse=True)
+        size = len(self._documents) * len(vocabulary)
+        counts = np.bincount(rows * len(vocabulary) + columns, minlength=size).reshape(len(self._documents), len(vocabulary))
+
+        # Sublinear TF times smoothed IDF, L2-normalised per row.
+        present = counts > 0
+        idf = np.log((1.0 + len(self._documents)) / (1.0 + present.sum(axis=0))) + 1.0
+        weights = np.where(present, 1.0 + np.log(np.maximum(counts, 1.0)), 0.0) * idf
+        norms = np.linalg.norm(weights, axis=1, keepdims=True)
+        weights /= np.maximum(norms, 1e-12)
+
+        similarity = weights[first:] @ weights[:first].T
+        novelty = float(1.0 - similarity.max(axis=1).mean())
+        novelty = min(1.0, max(0.0, novelty))
+        self.scores.append(novelty)
+        return novelty
+
+    def should_stop(self, transcript, round_index):
+        """
+        Scores a finished round of transcript and reports whether the discussion has converged.
+
+        Args:
+            transcript: Transcript whose rounds are marked with start_round()
+            round_index: Index of the round that just ended
+
+        Returns:
+            True if the last config.NOVELTY_PATIENCE rounds were all below the
+            threshold; always False when the detector is disabled
+        """
+        if not self.enabled:
+            return False
+        start, end = transcript.round_bounds(round_index)
+        novelty = self.score_round([_entry_content(transcript[i]) for i in range(start, end) if not getattr(transcript[i], "failed", False)])
+        self._low_rounds = self._low_rounds + 1 if novelty < self.threshold else 0
+        return self._low_rounds >= self.patience
+
+    def record_stop(self, transcript, rounds_run, models_per_round):
+        """
+        Estimates what stopping after rounds_run rounds saved.
+
+        Each skipped round would have sent the whole transcript to every
+        model and produced about as much text as the last round did.
+        """
+        self.rounds_saved = max(0, config.MAX_DISCUSSION_ROUNDS - rounds_run)
+        start, end = transcript.round_bounds(transcript.round_count - 1)
+        history_tokens = sum(estimate_tokens(_entry_content(entry)) for entry in transcript)
+        round_tokens = sum(estimate_tokens(_entry_content(transcript[i])) for i in range(start, end))
+        self.tokens_saved = self.rounds_saved * (models_per_round * history_tokens + round_tokens)
@@ -0,0 +1,305 @@
+"""
+Tolerant parsing of {"contribution": ..., "vote": ...} responses for every provider.
+
+Models do not always return clean JSON: replies come wrapped in ```json
+fences, followed by commentary, cut off mid-string, written with single
+quotes, or with votes such as "Yes". parse_contribution() repairs all of
+these locally. Only when that fails does parse_or_reask() ask the model
+once more, with a short bounded request, to restate its answer as JSON.
+
+A reply that still cannot be used keeps whatever text was recovered as the
+contribution but casts no vote (it is marked with an "error" key), so a
+formatting problem never turns into a stop vote.
+
+A reply cut off before its end (usually by the output token cap, see
+governor.py) is marked with "truncated": True, and a contribution cut off
+mid-sentence keeps its complete sentences. It is never re-asked: if the cut
+came before the vote, config.TRUNCATED_REPLY_VOTE is counted instead. Every parsed reply's length is reported to its model's
+length governor.
+"""
+
+import ast
+import json
+import re
+import threading
+
+import config
+import governor
+import telemetry
+from ratelimit import abandoned
+from streaming import ContributionStreamParser
+
+_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)\s*```", re.DOTALL)
+_SENTENCE_END = re.compile(r"[.!?](?=\s|$)")
+
+# Keys some models use instead of "contribution"
+_CONTRIBUTION_KEYS = ("contribution", "content", "response", "answer", "text")
+
+_TRUE_VOTES = frozenset(("true", "yes", "y", "1", "t"))
+_FALSE_VOTES = frozenset(("false", "no", "n", "0", "f"))
+
+# Parse outcomes counted per model
+PARSED = "ok"          # the reply was valid JSON
+REPAIRED = "repaired"  # fixed locally
+REASKED = "reasked"    # fixed by asking the model again
+FAILED = "failed"      # unusable; no vote cast
+CACHED = "cached"      # served from the response cache (see cache.py)
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+def normalize_vote(value):
+    """
+    Returns a vote as a bool, or None if it is missing or not recognisable.
+    """
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return bool(value)
+    if isinstance(value, str):
+        normalized = value.strip().strip('"\'').lower()
+        if normalized in _TRUE_VOTES:
+            return True
+        if normalized in _FALSE_VOTES:
+            return False
+    return None
+
+def _object_span(text):
+    # Returns the first balanced {...} in text, honouring quoted strings.
+    start = text.find("{")
+    if start < 0:
+        return None
+    depth = 0
+    quote = None
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if quote is not None:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == quote:
+                quote = None
+        elif ch in "\"'":
+            quote = ch
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+def _pythonize(text):
+    # Rewrites JSON literals outside strings so ast.literal_eval accepts
+    # single-quoted, Python-style objects.
+    out = []
+    quote = None
+    escaped = False
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if quote is not None:
+            out.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == quote:
+                quote = None
+            i += 1
+            continue
+        if ch in "\"'":
+            quote = ch
+        for literal, replacement in (("true", "True"), ("false", "False"), ("null", "None")):
+            if (text.startswith(literal, i) and not text[i + len(literal):i + len(literal) + 1].isalnum()
+                    and not (i and text[i - 1].isalnum())):
+                out.append(replacement)
+                i += len(literal)
+                break
+        else:
+            out.append(ch)
+            i += 1
+    return "".join(out)
+
+def _load_object(candidate):
+    try:
+        value = json.loads(candidate)
+    except ValueError:
+        try:
+            value = ast.literal_eval(_pythonize(candidate))
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            return None
+    return value if isinstance(value, dict) else None
+
+def _complete_sentences(text):
+    # The text up to its last complete sentence, or the text marked as cut
+    # off if that would drop more than half of it.
+    text = text.rstrip()
+    ends = [match.end() for match in _SENTENCE_END.finditer(text)]
+    if ends and ends[-1] == len(text):
+        return text
+    if ends and ends[-1] >= len(text) // 2:
+        return text[:ends[-1]]
+    return text + " ..."
+
+def _from_object(model_name, value):
+    for key in _CONTRIBUTION_KEYS:
+        contribution = value.get(key)
+        if isinstance(contribution, str) and contribution.strip():
+            return {"model": model_name, "contribution": contribution, "vote": normalize_vote(value.get("vote"))}
+    return None
+
+@telemetry.timed_parse
+def parse_contribution(model_name, text):
+    """
+    Parses a reply locally, without calling any model.
+
+    Returns:
+        (result, outcome): result is {"model", "contribution", "vote"} with
+        vote None when no vote could be read, or None if no contribution
+        was found; outcome is PARSED, REPAIRED or FAILED
+    """
+    if not text or not text.strip():
+        return None, FAILED
+    text = text.strip()
+
+    # Fast path: the whole reply is a JSON object.
+    try:
+        value = json.loads(text)
+    except ValueError:
+        value = None
+    if isinstance(value, dict):
+        result = _from_object(model_name, value)
+        if result is not None:
+            return result, PARSED
+
+    # Fenced, surrounded by text, or single-quoted.
+    fence = _FENCE.search(text)
+    span = _object_span(text)
+    for candidate in (fence.group(1) if fence else None, span):
+        if candidate:
+            value = _load_object(candidate)
+            if value is not None:
+                result = _from_object(model_name, value)
+                if result is not None:
+                    return result, REPAIRED
+
+    # Truncated JSON: keep the complete part of the contribution string.
+    parser = ContributionStreamParser()
+    parser.feed(text)
+    if parser.contribution.strip():
+        result = {"model": model_name, "contribution": parser.contribution, "vote": parser.vote}
+        if not parser.complete:
+            result["contribution"] = _complete_sentences(parser.contribution)
+        if span is None:
+            # The object was never closed: the reply was cut off.
+            result["truncated"] = True
+        return result, REPAIRED
+
+    return None, FAILED
+
+def _record(model_name, outcome, result, first=None):
+    # Counts the outcome and reports the reply's length; first is the
+    # original reply when result came from a re-ask.
+    with _stats_lock:
+        counts = _stats.setdefault(model_name, {PARSED: 0, REPAIRED: 0, REASKED: 0, FAILED: 0, CACHED: 0})
+        counts[outcome] += 1
+    telemetry.record_parse(model_name, outcome)
+    if first is not None and first.get("truncated"):
+        result["truncated"] = True
+    if not abandoned():
+        # The reply of a hedge that lost or a call past its deadline is
+        # dropped, so it does not steer the output cap either.
+        governor.observe(model_name, result)
+    return result
+
+def record_cached(model_name, result):
+    """
+    Counts a reply served from the response cache and reports its length, as for a parsed reply.
+    """
+    _record(model_name, CACHED, result)
+
+def _unusable(model_name, text, result):
+    contribution = result["contribution"] if result else (text or "").strip()
+    return {
+        "model": model_name,
+        "contribution": contribution or "No meaningful response received.",
+        "vote": False,
+        "error": "unparseable response",
+    }
+
+def _parse_locally(model_name, text):
+    # parse_contribution(), with the default vote for a reply cut off before its vote.
+    result, outcome = parse_contribution(model_name, text)
+    if result is not None and result["vote"] is None and result.get("truncated"):
+        result["vote"] = config.TRUNCATED_REPLY_VOTE
+    return result, outcome
+
+def parse_or_reask(model_name, text, reask=None):
+    """
+    Parses a reply, asking the model to restate it as JSON if local repair fails.
+
+    Args:
+        model_name: Participant display name
+        text: Raw reply text
+        reask: Optional function taking the raw reply and returning a new
+            reply; called at most config.PARSE_REASK_ATTEMPTS times
+
+    Returns:
+        {"model", "contribution", "vote"}; an unusable reply also carries an "error" key
+    """
+    result, outcome = _parse_locally(model_name, text)
+    if result is not None and result["vote"] is not None:
+        return _record(model_name, outcome, result)
+
+    attempts = config.PARSE_REASK_ATTEMPTS if reask is not None and not abandoned() else 0
+    for _ in range(attempts):
+        try:
+            retry, _ = parse_contribution(model_name, reask(text))
+        except Exception as e:
+            print(f"{model_name} re-ask failed: {e}")
+            break
+        if retry is not None and retry["vote"] is not None:
+            return _record(model_name, REASKED, retry, result)
+
+    return _record(model_name, FAILED, _unusable(model_name, text, result), result)
+
+async def aparse_or_reask(model_name, text, reask=None):
+    """
+    Async variant of parse_or_reask; reask() must return an awaitable.
+    """
+    result, outcome = _parse_locally(model_name, text)
+    if result is not None and result["vote"] is not None:
+        return _record(model_name, outcome, result)
+
+    attempts = config.PARSE_REASK_ATTEMPTS if reask is not None and not abandoned() else 0
+    for _ in range(attempts):
+        try:
+            retry, _ = parse_contribution(model_name, await reask(text))
+        except Exception as e:
+            print(f"{model_name} re-ask failed: {e}")
+            break
+        if retry is not None and retry["vote"] is not None:
+            return _record(model_name, REASKED, retry, result)
+
+    return _record(model_name, FAILED, _unusable(model_name, text, result), result)
+
+def parse_stats():
+    """
+    Returns {model name: {outcome: count}} for the replies parsed so far.
+    """
+    with _stats_lock:
+        return {model_name: dict(counts) for model_name, counts in _stats.items()}
+
+def failure_rate(model_name=None):
+    """
+    Returns the share of replies that needed a re-ask or were unusable.
+    """
+    stats = parse_stats()
+    counts = [stats[model_name]] if model_name is not None else list(stats.values())
+    total = sum(sum(c.values()) for c in counts)
+    if not total:
+        return 0.0
+    return sum(c[REASKED] + c[FAILED] for c in counts) / total
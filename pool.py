@@ -0,0 +1,587 @@
+"""
+Multi-process worker pool for large Neural-Chat discussion sweeps.
+
+Topics are put into a durable SQLite job queue, then worked off by several
+worker processes. Each worker runs up to POOL_WORKER_CONCURRENCY discussions
+at once on its own event loop, with its own provider clients, so parsing and
+formatting use every core instead of sharing one GIL, and a crashing worker
+only loses the discussions it was running.
+
+Crash recovery works through leases. A worker leases a job before running
+it, and sends a heartbeat for its leased jobs every POOL_HEARTBEAT_SECONDS.
+A job whose lease runs out (its worker died or hangs) goes back to the
+queue for another worker. After POOL_MAX_ATTEMPTS leases it is marked
+failed. The supervising process restarts workers that exit unexpectedly,
+and hands back the dead worker's jobs straight away instead of waiting for
+their leases to run out. While the sweep runs, it reports progress and
+throughput for all workers, taken from the queue.
+
+The queue file outlives the run: re-running picks up where it stopped, and
+finished records stay in the queue until they are exported. Several hosts
+can work off one queue file on a filesystem with working locks. In that
+case set POOL_QUEUE_JOURNAL_MODE to "DELETE", because WAL only works
+within one host.
+
+Rate limits (config.RATE_LIMITS) and provider concurrency apply per
+process, so divide them by the number of workers.
+
+Usage:
+    python pool.py run [topics.jsonl] [-o results.jsonl] [--workers N] [--concurrency N]
+    python pool.py enqueue topics.jsonl
+    python pool.py status
+    python pool.py export -o results.jsonl
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+
+import config
+
+# Job states in the queue
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+class JobQueue:
+    """
+    Durable SQLite queue of discussion topics.
+
+    Every method commits before returning. A queue object belongs to one
+    process; each worker opens its own.
+
+    Args:
+        path: SQLite database file, created if missing
+        journal_mode: SQLite journal mode; defaults to config.POOL_QUEUE_JOURNAL_MODE
+    """
+
+    def __init__(self, path, journal_mode=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._conn.execute(f"PRAGMA journal_mode={journal_mode or config.POOL_QUEUE_JOURNAL_MODE}")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, topic TEXT NOT NULL, status TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, worker TEXT, lease_expires REAL, "
+            "result TEXT, error TEXT, created REAL NOT NULL, started REAL, finished REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+
+    def _transaction(self, work):
+        # Runs work() in a write transaction taken up front, so concurrent
+        # workers never lease the same job.
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work()
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def enqueue(self, topics):
+        """
+        Adds (id, topic) pairs; ids already in the queue are skipped.
+
+        Returns:
+            Number of jobs added
+        """
+        now = time.time()
+
+        def work():
+            added = 0
+            for job_id, topic in topics:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO jobs (id, topic, status, created) VALUES (?, ?, ?, ?)",
+                    (str(job_id), topic, QUEUED, now),
+                )
+                added += cursor.rowcount
+            return added
+        return self._transaction(work)
+
+    def lease(self, worker, lease_seconds=None, max_attempts=None):
+        """
+        Leases the oldest queued job to a worker.
+
+        Expired leases are handed back first: their jobs are queued again, or
+        marked failed once they have been leased max_attempts times.
+
+        Returns:
+            (id, topic), or None if no job is queued
+        """
+        lease_seconds = lease_seconds or config.POOL_LEASE_SECONDS
+        max_attempts = max_attempts or config.POOL_MAX_ATTEMPTS
+
+        def work():
+            now = time.time()
+            self._conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                "error = 'lease of ' || worker || ' expired', worker = NULL, lease_expires = NULL "
+                "WHERE status = ? AND lease_expires < ?",
+                (max_attempts, FAILED, QUEUED, LEASED, now),
+            )
+            row = self._conn.execute(
+                "SELECT id, topic FROM jobs WHERE status = ? ORDER BY created, rowid LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1, lease_expires = ?, started = ? WHERE id = ?",
+                (LEASED, worker, now + lease_seconds, now, row[0]),
+            )
+            return row
+        return self._transaction(work)
+
+    def heartbeat(self, job_ids, worker, lease_seconds=None):
+        """
+        Extends the leases a worker still holds on the given jobs.
+
+        Returns:
+            Number of leases extended; jobs whose lease was lost are not counted
+        """
+        expires = time.time() + (lease_seconds or config.POOL_LEASE_SECONDS)
+        with self._lock:
+            cursor = self._conn.executemany(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker = ? AND status = ?",
+                [(expires, job_id, worker, LEASED) for job_id in job_ids],
+            )
+            return cursor.rowcount
+
+    def complete(self, job_id, worker, record):
+        """
+        Stores a finished discussion's record.
+
+        Returns:
+            False if the worker no longer held the lease (the job was handed
+            to another worker), in which case nothing is stored
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = NULL, lease_expires = NULL, finished = ? "
+                "WHERE id = ? AND worker = ? AND status = ?",
+                (DONE, json.dumps(record, ensure_ascii=False), time.time(), job_id, worker, LEASED),
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, job_id, worker, error, max_attempts=None):
+        """
+        Records a failed attempt; the job is queued again until it has been tried max_attempts times.
+        """
+        max_attempts = max_attempts or config.POOL_MAX_ATTEMPTS
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, error = ?, "
+                "worker = NULL, lease_expires = NULL, finished = ? WHERE id = ? AND worker = ? AND status = ?",
+                (max_attempts, FAILED, QUEUED, error, time.time(), job_id, worker, LEASED),
+            )
+
+    def release_worker(self, worker, max_attempts=None):
+        """
+        Queues again every job leased by a worker that is known to have stopped.
+
+        As with expired leases, a job already leased max_attempts times is
+        marked failed instead, so a topic that crashes its worker every time
+        is not retried forever.
+
+        Returns:
+            Number of jobs released (queued again or failed)
+        """
+        max_attempts = max_attempts or config.POOL_MAX_ATTEMPTS
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                "error = 'worker ' || worker || ' stopped', worker = NULL, lease_expires = NULL "
+                "WHERE status = ? AND worker = ?",
+                (max_attempts, FAILED, QUEUED, LEASED, worker),
+            )
+            return cursor.rowcount
+
+    def requeue_failed(self):
+        """
+        Queues every failed job again with a fresh attempt count.
+
+        Returns:
+            Number of jobs queued
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = 0 WHERE status = ?", (QUEUED, FAILED)
+            )
+            return cursor.rowcount
+
+    def counts(self):
+        """
+        Returns the number of jobs in each state, as {"queued": ..., "leased": ..., "done": ..., "failed": ...}.
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {QUEUED: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        counts.update(rows)
+        return counts
+
+    def done_since(self, since):
+        """
+        Returns the number of jobs finished since the given time.time() value.
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND finished >= ?", (DONE, since)
+            ).fetchone()[0]
+
+    def mean_seconds(self):
+        """
+        Returns the average time from lease to finish of the finished jobs, or None before the first.
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT AVG(finished - started) FROM jobs WHERE status = ?", (DONE,)
+            ).fetchone()[0]
+
+    def results(self):
+        """
+        Yields (id, record) for every finished job, in the order they finished.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, result FROM jobs WHERE status = ? ORDER BY finished", (DONE,)
+            ).fetchall()
+        for job_id, result in rows:
+            yield job_id, json.loads(result)
+
+    def failures(self):
+        """
+        Returns (id, error) for every job that failed for good.
+        """
+        with self._lock:
+            return self._conn.execute("SELECT id, error FROM jobs WHERE status = ? ORDER BY id", (FAILED,)).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def worker_name(pid=None):
+    """
+    Returns the name a worker process leases jobs under (host:pid).
+    """
+    return f"{socket.gethostname()}:{pid or os.getpid()}"
+
+##############################
+# Worker process
+##############################
+
+async def run_worker(queue, worker, concurrency=None, provider_concurrency=None, parallel_rounds=None):
+    """
+    Leases and runs discussions until no job is queued or leased by anyone.
+
+    While other workers still hold leases, an idle worker keeps polling, so
+    it can take over their jobs if their leases run out.
+
+    Args:
+        queue: JobQueue of this process
+        worker: Name the jobs are leased under
+        concurrency: Maximum discussions in flight; defaults to config.POOL_WORKER_CONCURRENCY
+        provider_concurrency: Maximum in-flight calls per provider; defaults
+            to config.POOL_PROVIDER_CONCURRENCY
+        parallel_rounds: See batch.run_discussion
+
+    Returns:
+        Number of discussions that failed in this worker
+    """
+    from batch import run_discussion, new_provider_limits
+    from clients import aclose_clients
+    import governor
+
+    concurrency = concurrency or config.POOL_WORKER_CONCURRENCY
+    provider_concurrency = provider_concurrency or config.POOL_PROVIDER_CONCURRENCY
+    provider_limits = new_provider_limits(provider_concurrency)
+    leased = set()
+    failures = 0
+
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(config.POOL_HEARTBEAT_SECONDS)
+            if leased:
+                queue.heartbeat(list(leased), worker)
+
+    async def one(job_id, topic):
+        nonlocal failures
+        try:
+            record = await run_discussion(topic, provider_limits, parallel_rounds)
+        except Exception as e:
+            failures += 1
+            print(f"[{worker}] Discussion {job_id} failed: {e}", file=sys.stderr)
+            queue.fail(job_id, worker, str(e))
+        else:
+            if not queue.complete(job_id, worker, record):
+                print(f"[{worker}] Discussion {job_id} finished after its lease was lost; result dropped", file=sys.stderr)
+        finally:
+            leased.discard(job_id)
+
+    heartbeats = asyncio.ensure_future(heartbeat())
+    pending = set()
+    try:
+        while True:
+            while len(pending) < concurrency:
+                job = queue.lease(worker)
+                if job is None:
+                    break
+                leased.add(job[0])
+                pending.add(asyncio.ensure_future(one(*job)))
+            if pending:
+                _, pending = await asyncio.wait(pending, timeout=config.POOL_POLL_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+                continue
+            counts = queue.counts()
+            if not counts[QUEUED] and not counts[LEASED]:
+                break
+            await asyncio.sleep(config.POOL_POLL_SECONDS)
+    finally:
+        heartbeats.cancel()
+        for task in pending:
+            task.cancel()
+        await aclose_clients()
+    for line in governor.summary_lines():
+        print(f"[{worker}] Response length: {line}", file=sys.stderr)
+    return failures
+
+def _config_snapshot():
+    # Settings changed at runtime (e.g. by emulator.use_emulator()) are not
+    # seen by spawned workers, which import config afresh; they get a copy.
+    return {name: value for name, value in vars(config).items() if name.isupper()}
+
+def _worker_main(settings, queue_path, concurrency, provider_concurrency, parallel_rounds):
+    # Entry point of a worker process. One metrics port or textfile cannot
+    # be shared by the workers, so they only append to the telemetry JSONL file.
+    for name, value in settings.items():
+        setattr(config, name, value)
+    import telemetry
+
+    config.TELEMETRY_PROMETHEUS_PORT = None
+    config.TELEMETRY_PROMETHEUS_TEXTFILE = None
+    telemetry.start()
+    queue = JobQueue(queue_path)
+    try:
+        asyncio.run(run_worker(queue, worker_name(), concurrency, provider_concurrency, parallel_rounds))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        queue.close()
+
+##############################
+# Supervisor
+##############################
+
+def _format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+def progress_line(counts, elapsed, done_at_start, recent_rate, mean_seconds):
+    """
+    Returns a one-line progress report of the whole queue.
+
+    Args:
+        counts: JobQueue.counts()
+        elapsed: Seconds since the run started
+        done_at_start: Jobs already done when the run started
+        recent_rate: Discussions per minute over the last report interval
+        mean_seconds: JobQueue.mean_seconds()
+    """
+    total = sum(counts.values())
+    rate = (counts[DONE] - done_at_start) * 60 / elapsed if elapsed > 0 else 0.0
+    parts = [
+        f"{counts[DONE]}/{total} done",
+        f"{counts[FAILED]} failed",
+        f"{counts[LEASED]} running",
+        f"{counts[QUEUED]} queued",
+        f"{rate:.1f}/min overall, {recent_rate:.1f}/min recently",
+    ]
+    if mean_seconds is not None:
+        parts.append(f"{mean_seconds:.1f}s per discussion")
+    remaining = counts[QUEUED] + counts[LEASED]
+    if remaining and rate > 0:
+        parts.append(f"ETA {_format_duration(remaining * 60 / rate)}")
+    return ", ".join(parts)
+
+def run_pool(queue_path, workers=None, concurrency=None, provider_concurrency=None, parallel_rounds=None):
+    """
+    Starts the worker processes and supervises them until the queue is worked off.
+
+    Workers that exit while jobs remain are restarted after their leased jobs
+    are handed back, unless workers keep failing without any discussion
+    finishing in between (e.g. a bad setting), in which case the run stops.
+    Progress is printed to stderr every config.POOL_PROGRESS_SECONDS.
+
+    Args:
+        queue_path: SQLite queue file
+        workers: Number of worker processes; defaults to config.POOL_WORKERS,
+            or one per CPU core
+        concurrency, provider_concurrency, parallel_rounds: Passed to each
+            worker, see run_worker
+
+    Returns:
+        Number of jobs that failed for good
+    """
+    workers = workers or config.POOL_WORKERS or os.cpu_count() or 1
+    queue = JobQueue(queue_path)
+    # Spawned workers start without the parent's clients, locks and threads.
+    context = multiprocessing.get_context("spawn")
+    args = (_config_snapshot(), queue_path, concurrency, provider_concurrency, parallel_rounds)
+    processes = []
+    restarts = 0
+    # Worker failures since a discussion last finished
+    failures_without_progress = 0
+
+    def start_worker():
+        process = context.Process(target=_worker_main, args=args, daemon=True)
+        process.start()
+        return process
+
+    start = time.time()
+    done_at_start = queue.counts()[DONE]
+    last_report, last_done = start, done_at_start
+    print(f"Starting {workers} workers on {queue_path}", file=sys.stderr)
+    try:
+        processes = [start_worker() for _ in range(workers)]
+        while True:
+            time.sleep(config.POOL_POLL_SECONDS)
+            counts = queue.counts()
+            remaining = counts[QUEUED] + counts[LEASED]
+            if counts[DONE] > last_done:
+                failures_without_progress = 0
+            for process in [process for process in processes if not process.is_alive()]:
+                processes.remove(process)
+                if process.exitcode == 0:
+                    continue
+                released = queue.release_worker(worker_name(process.pid))
+                print(f"Worker {process.pid} exited with code {process.exitcode}; {released} of its discussions released", file=sys.stderr)
+                remaining += released
+                failures_without_progress += 1
+                if failures_without_progress > workers * config.POOL_MAX_ATTEMPTS:
+                    raise RuntimeError(f"Workers keep failing ({failures_without_progress} in a row); see the errors above")
+                if remaining:
+                    processes.append(start_worker())
+                    restarts += 1
+            now = time.time()
+            # Report at every interval, and once more when the last job is done
+            if now - last_report >= config.POOL_PROGRESS_SECONDS or (not remaining and counts[DONE] > last_done):
+                counts = queue.counts()
+                recent_rate = (counts[DONE] - last_done) * 60 / (now - last_report)
+                print(progress_line(counts, now - start, done_at_start, recent_rate, queue.mean_seconds()), file=sys.stderr)
+                last_report, last_done = now, counts[DONE]
+            if not remaining and not processes:
+                break
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+    failed = queue.counts()[FAILED]
+    summary = f"Finished in {_format_duration(time.time() - start)}"
+    if restarts:
+        summary += f" ({restarts} worker restarts)"
+    print(summary, file=sys.stderr)
+    queue.close()
+    return failed
+
+def export_results(queue, output):
+    """
+    Writes every finished discussion to output as batch.py JSONL records.
+
+    Returns:
+        Number of records written
+    """
+    written = 0
+    for job_id, record in queue.results():
+        output.write(json.dumps({"id": job_id, **record}, ensure_ascii=False) + "\n")
+        written += 1
+    return written
+
+def _write_export(queue, path):
+    if path == "-":
+        written = export_results(queue, sys.stdout)
+    else:
+        with open(path, "w", encoding="utf-8") as output:
+            written = export_results(queue, output)
+    print(f"Exported {written} records to {path}", file=sys.stderr)
+
+def _enqueue_file(queue, path):
+    from batch import read_topics
+
+    if path == "-":
+        added = queue.enqueue(read_topics(sys.stdin))
+    else:
+        with open(path, encoding="utf-8") as f:
+            added = queue.enqueue(read_topics(f))
+    print(f"Queued {added} new discussions", file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run Neural-Chat discussion sweeps on a pool of worker processes.")
+    parser.add_argument("--queue", default=config.POOL_QUEUE_PATH, help="SQLite job queue file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Work off the queue with worker processes")
+    run_parser.add_argument("input", nargs="?", help="JSONL file of topics to queue first ('-' for stdin)")
+    run_parser.add_argument("-o", "--output", help="JSONL file the finished records are exported to ('-' for stdout)")
+    run_parser.add_argument("--workers", type=int, default=config.POOL_WORKERS, help="Worker processes (default: one per CPU core)")
+    run_parser.add_argument("--concurrency", type=int, default=config.POOL_WORKER_CONCURRENCY, help="Maximum discussions in flight per worker")
+    run_parser.add_argument("--provider-concurrency", type=int, default=config.POOL_PROVIDER_CONCURRENCY, help="Maximum in-flight calls per provider per worker")
+    run_parser.add_argument("--parallel-rounds", action="store_true", default=config.PARALLEL_ROUNDS, help="Call every model of a round at once")
+    run_parser.add_argument("--retry-failed", action="store_true", help="Queue discussions that failed in earlier runs again")
+
+    enqueue_parser = commands.add_parser("enqueue", help="Add topics to the queue")
+    enqueue_parser.add_argument("input", help="JSONL file of topics ('-' for stdin)")
+
+    commands.add_parser("status", help="Print the state of the queue")
+
+    export_parser = commands.add_parser("export", help="Write the finished records as JSONL")
+    export_parser.add_argument("-o", "--output", default="-", help="JSONL file ('-' for stdout)")
+
+    args = parser.parse_args(argv)
+    queue = JobQueue(args.queue)
+
+    if args.command == "enqueue":
+        _enqueue_file(queue, args.input)
+        return 0
+    if args.command == "status":
+        counts = queue.counts()
+        print(", ".join(f"{count} {status}" for status, count in counts.items()))
+        for job_id, error in queue.failures():
+            print(f"  {job_id} failed: {error}")
+        return 0
+    if args.command == "export":
+        _write_export(queue, args.output)
+        return 0
+
+    if args.input:
+        _enqueue_file(queue, args.input)
+    if args.retry_failed:
+        print(f"Queued {queue.requeue_failed()} failed discussions again", file=sys.stderr)
+    try:
+        failed = run_pool(args.queue, args.workers, args.concurrency, args.provider_concurrency, args.parallel_rounds)
+    except KeyboardInterrupt:
+        print("Interrupted; run again to continue where the sweep stopped.", file=sys.stderr)
+        return 130
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+    if args.output:
+        _write_export(queue, args.output)
+    for job_id, error in queue.failures():
+        print(f"Discussion {job_id} failed: {error}", file=sys.stderr)
+    queue.close()
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,398 @@
+"""
+Per-provider rate limiting and retries for Neural-Chat.
+
+Every provider call goes through the ProviderLimiter for its provider, which
+keeps token buckets for requests per minute and tokens per minute and an
+adaptive concurrency limit: the limit grows by one slot per window of
+successful calls and halves on every 429 (AIMD). Failed calls are classified
+into typed errors; rate limits and transient failures are retried with
+jittered exponential backoff that never undercuts the provider's Retry-After.
+
+A call the caller has given up on (a hedge that lost, or a call past its
+deadline; see hedging.py) stops before its next attempt or backoff sleep,
+and whatever it still finishes is neither charged to the budget nor counted
+towards the concurrency limit.
+"""
+
+import asyncio
+import contextvars
+import email.utils
+import random
+import threading
+import time
+
+import config
+import telemetry
+
+# How often a caller waiting for a free concurrency slot checks again (seconds)
+_SLOT_POLL_INTERVAL = 0.02
+
+class ProviderError(Exception):
+    """
+    A failed provider call. Not retried unless it is a subclass below.
+
+    Attributes:
+        provider: Provider identifier, e.g. "openai"
+        status: HTTP status code, if the provider returned one
+        retry_after: Seconds the provider asked us to wait, if any
+    """
+
+    retryable = False
+
+    def __init__(self, provider, message, status=None, retry_after=None):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        self.status = status
+        self.retry_after = retry_after
+
+class RateLimitError(ProviderError):
+    """The provider rejected the call with 429 (or an equivalent quota error)."""
+
+    retryable = True
+
+class TransientError(ProviderError):
+    """A timeout, connection failure or 5xx that is worth retrying."""
+
+    retryable = True
+
+class CallAbandonedError(ProviderError):
+    """The caller stopped waiting for the call, so it was not (re)tried."""
+
+# Event set once the caller has given up on the calls made in this context;
+# hedging.py sets one for each attempt it starts.
+_abandon_event = contextvars.ContextVar("abandon_event", default=None)
+
+def watch_abandon(event):
+    """
+    Treats the calls made in the current context as abandoned once event is set.
+    """
+    _abandon_event.set(event)
+
+def abandoned():
+    """
+    True if the caller has given up on the call made in the current context.
+    """
+    event = _abandon_event.get()
+    return event is not None and event.is_set()
+
+def _sleep_unless_abandoned(delay):
+    # Backoff sleep that ends early when the call is abandoned.
+    event = _abandon_event.get()
+    if event is None:
+        time.sleep(delay)
+    else:
+        event.wait(delay)
+
+def _retry_after(exc):
+    # OpenAI and Anthropic expose the httpx response; header values may be
+    # seconds, milliseconds (retry-after-ms) or an HTTP date.
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def classify_error(provider, exc):
+    """
+    Maps an SDK exception to ProviderError, RateLimitError or TransientError.
+    """
+    if isinstance(exc, ProviderError):
+        return exc
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        # google.api_core exceptions carry the HTTP status in .code
+        code = getattr(exc, "code", None)
+        status = code if isinstance(code, int) else None
+    retry_after = _retry_after(exc)
+    message = str(exc) or exc.__class__.__name__
+
+    if status == 429:
+        return RateLimitError(provider, message, status, retry_after)
+    if status in (408, 409) or (status is not None and status >= 500):
+        return TransientError(provider, message, status, retry_after)
+    if status is None and (
+        isinstance(exc, (TimeoutError, ConnectionError))
+        or exc.__class__.__name__.endswith(("ConnectionError", "TimeoutError", "Timeout"))
+    ):
+        return TransientError(provider, message, None, retry_after)
+    return ProviderError(provider, message, status, retry_after)
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Full-jitter exponential backoff for the given retry attempt (1-based),
+    never shorter than the provider's Retry-After.
+    """
+    delay = random.uniform(0, min(config.RETRY_MAX_DELAY, config.RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+class _TokenBucket:
+    __slots__ = ("rate", "capacity", "level", "updated")
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, amount, now):
+        # Take amount now, going into debt if needed; returns how long the
+        # caller must wait for the debt to be repaid.
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        self.level -= min(amount, self.capacity)
+        return 0.0 if self.level >= 0 else -self.level / self.rate
+
+class ProviderLimiter:
+    """
+    Rate limits and adaptive concurrency for one provider, shared by threads and event loops.
+
+    Args:
+        provider: Provider identifier
+        rpm: Requests per minute, or None for no limit
+        tpm: Tokens per minute, or None for no limit
+        max_concurrency: Upper bound (and starting value) of the concurrency limit
+        min_concurrency: Lower bound the limit never halves below
+    """
+
+    def __init__(self, provider, rpm=None, tpm=None, max_concurrency=16, min_concurrency=1):
+        self.provider = provider
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._requests = _TokenBucket(rpm) if rpm else None
+        self._tokens = _TokenBucket(tpm) if tpm else None
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens):
+        with self._lock:
+            now = time.monotonic()
+            wait = 0.0
+            if self._requests is not None:
+                wait = max(wait, self._requests.reserve(1, now))
+            if self._tokens is not None and tokens:
+                wait = max(wait, self._tokens.reserve(tokens, now))
+            return wait
+
+    def _try_enter(self):
+        # Returns 0 once a slot is taken, otherwise how long to wait before retrying.
+        with self._lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            if self.in_flight >= int(self.limit):
+                return _SLOT_POLL_INTERVAL
+            self.in_flight += 1
+            return 0.0
+
+    def acquire(self, tokens=0):
+        """
+        Blocks until a call estimated at the given number of tokens may start.
+        """
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        while True:
+            wait = self._try_enter()
+            if wait == 0:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens=0):
+        """
+        Async variant of acquire.
+        """
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        while True:
+            wait = self._try_enter()
+            if wait == 0:
+                return
+            await asyncio.sleep(wait)
+
+    def release(self, error=None):
+        """
+        Frees the slot taken by acquire() and adapts the concurrency limit to the outcome.
+        """
+        with self._lock:
+            self.in_flight -= 1
+            if isinstance(error, RateLimitError):
+                self.limit = max(float(self.min_concurrency), self.limit / 2)
+                if error.retry_after:
+                    self.paused_until = max(self.paused_until, time.monotonic() + error.retry_after)
+            elif error is None:
+                self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(provider):
+    """
+    Returns the process-wide limiter for a provider, configured from config.RATE_LIMITS.
+    """
+    limiter = _limiters.get(provider)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(provider)
+            if limiter is None:
+                settings = dict(config.RATE_LIMIT_DEFAULTS)
+                settings.update(config.RATE_LIMITS.get(provider, {}))
+                limiter = _limiters[provider] = ProviderLimiter(provider, **settings)
+    return limiter
+
+def estimate_request_tokens(request):
+    """
+    Rough token cost of a request (about four characters per token) plus the expected reply.
+    """
+    if isinstance(request, str):
+        chars = len(request)
+    else:
+        chars = sum(len(str(message.get("content", ""))) for message in request)
+    return chars // 4 + config.RESPONSE_LENGTH * 2
+
+def rate_limited(provider, model_id, call, tokens=0, collector=None, budget=None):
+    """
+    Wraps a blocking zero-argument provider call with rate limiting and retries.
+
+    Args:
+        provider: Provider identifier
+        model_id: Provider model id, used for telemetry
+        call: Zero-argument function making the request
+        tokens: Estimated token cost of the request
+        collector: ContributionStream of a streamed call; once it has shown
+            text to the user the call is no longer retried
+        budget: Optional Budget charged with the call's token usage and cost
+
+    Returns:
+        A zero-argument function that raises ProviderError when the call
+        ultimately fails
+    """
+    def limited():
+        limiter = get_limiter(provider)
+        span = telemetry.start_span(provider, model_id, always=budget is not None)
+        context_token = telemetry.activate(span) if span is not None else None
+        result = error = None
+        try:
+            attempt = 0
+            while True:
+                if abandoned():
+                    error = CallAbandonedError(provider, "abandoned before the call was made")
+                    raise error
+                queued = time.perf_counter()
+                limiter.acquire(tokens)
+                started = time.perf_counter()
+                try:
+                    if abandoned():
+                        raise CallAbandonedError(provider, "abandoned while waiting for a slot")
+                    result = call()
+                    finished = time.perf_counter()
+                except Exception as e:
+                    finished = time.perf_counter()
+                    error = classify_error(provider, e)
+                    limiter.release(error)
+                    attempt += 1
+                    if not error.retryable or attempt >= config.RETRY_MAX_ATTEMPTS or (collector is not None and collector.emitted) or abandoned():
+                        raise error from e
+                    delay = backoff_delay(attempt, error.retry_after)
+                    if span is not None:
+                        span.retry_seconds += delay
+                    _sleep_unless_abandoned(delay)
+                    continue
+                except BaseException as e:
+                    # Cancelled or interrupted: free the slot without adapting the limit.
+                    finished = time.perf_counter()
+                    error = e
+                    limiter.release(e)
+                    raise
+                finally:
+                    if span is not None:
+                        span.attempts += 1
+                        span.queue_seconds += started - queued
+                        span.call_seconds += finished - started
+                if abandoned():
+                    # Nobody is waiting for the result: drop it without
+                    # growing the limit or charging the budget.
+                    result = None
+                    error = CallAbandonedError(provider, "finished after the caller gave up")
+                    limiter.release(error)
+                    raise error
+                error = None
+                limiter.release()
+                return result
+        finally:
+            if span is not None:
+                telemetry.deactivate(context_token)
+                telemetry.finish_span(span, error, tokens, result)
+                if budget is not None and result is not None:
+                    budget.charge(model_id, span.input_tokens, span.output_tokens, span.cached_input_tokens)
+
+    return limited
+
+def rate_limited_async(provider, model_id, call, tokens=0, collector=None, budget=None):
+    """
+    Async variant of rate_limited; call() must return an awaitable.
+
+    An abandoned async call is cancelled instead (see hedged_async).
+    """
+    async def limited():
+        limiter = get_limiter(provider)
+        span = telemetry.start_span(provider, model_id, always=budget is not None)
+        context_token = telemetry.activate(span) if span is not None else None
+        result = error = None
+        try:
+            attempt = 0
+            while True:
+                queued = time.perf_counter()
+                await limiter.acquire_async(tokens)
+                started = time.perf_counter()
+                try:
+                    result = await call()
+                    finished = time.perf_counter()
+                except Exception as e:
+                    finished = time.perf_counter()
+                    error = classify_error(provider, e)
+                    limiter.release(error)
+                    attempt += 1
+                    if not error.retryable or attempt >= config.RETRY_MAX_ATTEMPTS or (collector is not None and collector.emitted):
+                        raise error from e
+                    delay = backoff_delay(attempt, error.retry_after)
+                    if span is not None:
+                        span.retry_seconds += delay
+                    await asyncio.sleep(delay)
+                    continue
+                except BaseException as e:
+                    # Cancelled or interrupted: free the slot without adapting the limit.
+                    finished = time.perf_counter()
+                    error = e
+                    limiter.release(e)
+                    raise
+                finally:
+                    if span is not None:
+                        span.attempts += 1
+                        span.queue_seconds += started - queued
+                        span.call_seconds += finished - started
+                error = None
+                limiter.release()
+                return result
+        finally:
+            if span is not None:
+                telemetry.deactivate(context_token)
+                telemetry.finish_span(span, error, tokens, result)
+                if budget is not None and result is not None:
+                    budget.charge(model_id, span.input_tokens, span.output_tokens, span.cached_input_tokens)
+
+    return limited
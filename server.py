@@ -0,0 +1,397 @@
+"""
+Asyncio HTTP server hosting many concurrent Neural-Chat discussions.
+
+One process serves every discussion on a single event loop. All discussions
+share the provider client pools (clients.py), the per-provider rate limiters
+(ratelimit.py) and a per-provider cap on in-flight calls, so adding
+discussions never multiplies connections or bursts past a provider's limits.
+
+Routes (JSON bodies and responses):
+
+    POST   /discussions              {"topic": ..., "stream": false, "parallel_rounds": ...,
+                                      "budget": {"input_tokens": ..., "output_tokens": ...,
+                                                 "cost": ..., "seconds": ...}}
+                                     -> 201 {"id": ..., "status": "queued"}
+    GET    /discussions              -> recent discussions and their status
+    GET    /discussions/<id>         -> status, events so far and (once finished) the record
+    GET    /discussions/<id>/events  -> Server-Sent Events stream of the discussion
+    DELETE /discussions/<id>         -> cancels a queued or running discussion
+    GET    /metrics                  -> Prometheus metrics (when telemetry is enabled)
+
+"budget" limits are optional and override the config.BUDGET_* defaults; the
+deadline counts from when the discussion starts running, not from when it
+was queued.
+
+The event stream replays every event from the start (or after the id sent
+in a Last-Event-ID header or ?after=<id>), then follows the discussion live:
+"queued", "started", "round_start", "token" and "token_reset" (streamed
+discussions only; "token_reset" withdraws the model's tokens sent so far),
+"turn", "round_end", "summary" and finally one of "finished", "cancelled"
+or "failed", after which the stream ends.
+
+Usage:
+    python server.py [--host HOST] [--port PORT] [--max-active N] [--provider-concurrency N]
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import uuid
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+import config
+from batch import run_discussion, new_provider_limits
+from budget import Budget
+from clients import aclose_clients
+import telemetry
+
+# Largest request body accepted
+MAX_BODY_BYTES = 64 * 1024
+
+# Events after which a discussion's stream ends
+TERMINAL_EVENTS = ("finished", "cancelled", "failed")
+
+# Limits a POST body may set under "budget"
+BUDGET_LIMITS = {"input_tokens", "output_tokens", "cost", "seconds"}
+
+_REASONS = {
+    200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found",
+    405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large",
+}
+
+class HTTPError(Exception):
+    """
+    Raised by a route to answer with an error status and message.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class Discussion:
+    """
+    One hosted discussion and the log of its events.
+
+    Attributes:
+        events: (id, event, data) tuples in the order they happened; the id
+            is the position in this list
+        record: run_discussion()'s result once finished, else None
+    """
+
+    __slots__ = ("id", "topic", "created", "status", "events", "record", "task", "_changed")
+
+    def __init__(self, topic):
+        self.id = uuid.uuid4().hex[:12]
+        self.topic = topic
+        self.created = time.time()
+        self.status = "queued"
+        self.events = []
+        self.record = None
+        self.task = None
+        self._changed = asyncio.get_running_loop().create_future()
+
+    def emit(self, event, data):
+        """
+        Appends an event and wakes every stream following the discussion.
+        """
+        self.events.append((len(self.events), event, data))
+        self._changed.set_result(None)
+        self._changed = asyncio.get_running_loop().create_future()
+
+    async def wait_for_events(self, seen, timeout):
+        """
+        Waits until there are more than seen events, or timeout seconds pass.
+        """
+        if len(self.events) > seen:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(self._changed), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    @property
+    def done(self):
+        return self.status in TERMINAL_EVENTS
+
+    def describe(self):
+        return {"id": self.id, "topic": self.topic, "created": self.created, "status": self.status}
+
+class DiscussionServer:
+    """
+    Runs hosted discussions and answers HTTP requests about them.
+
+    Args:
+        max_active: Discussions running at once; later ones wait in "queued"
+        provider_concurrency: In-flight calls per provider across all
+            discussions, counted against the provider that serves each call
+        parallel_rounds: Default for discussions that do not choose
+    """
+
+    def __init__(self, max_active=None, provider_concurrency=None, parallel_rounds=None):
+        self.active = asyncio.Semaphore(max_active or config.SERVER_MAX_ACTIVE)
+        provider_concurrency = provider_concurrency or config.SERVER_PROVIDER_CONCURRENCY
+        self.provider_limits = new_provider_limits(provider_concurrency)
+        self.parallel_rounds = config.PARALLEL_ROUNDS if parallel_rounds is None else parallel_rounds
+        self.discussions = OrderedDict()
+
+    def start(self, topic, stream=False, parallel_rounds=None, budget_limits=None):
+        """
+        Queues a new discussion and returns it.
+
+        budget_limits are keyword arguments for Budget.from_config.
+        """
+        discussion = Discussion(topic)
+        self.discussions[discussion.id] = discussion
+        discussion.emit("queued", discussion.describe())
+        if parallel_rounds is None:
+            parallel_rounds = self.parallel_rounds
+        discussion.task = asyncio.ensure_future(self._run(discussion, stream, parallel_rounds, budget_limits or {}))
+        discussion.task.add_done_callback(lambda task: self._cancelled_before_start(discussion))
+        self._prune()
+        return discussion
+
+    async def _run(self, discussion, stream, parallel_rounds, budget_limits):
+        try:
+            async with self.active:
+                discussion.status = "running"
+                discussion.emit("started", {})
+                discussion.record = await run_discussion(
+                    discussion.topic, self.provider_limits, parallel_rounds, discussion.emit, stream,
+                    Budget.from_config(**budget_limits),
+                )
+        except asyncio.CancelledError:
+            discussion.status = "cancelled"
+            discussion.emit("cancelled", {})
+        except Exception as e:
+            print(f"Discussion {discussion.id} failed: {e}", file=sys.stderr)
+            discussion.status = "failed"
+            discussion.emit("failed", {"error": str(e)})
+        else:
+            discussion.status = "finished"
+            discussion.emit("finished", {"rounds": len(discussion.record["rounds"]), "timings": discussion.record["timings"]})
+
+    @staticmethod
+    def _cancelled_before_start(discussion):
+        # A task cancelled before its first step never runs _run's handlers.
+        if not discussion.done:
+            discussion.status = "cancelled"
+            discussion.emit("cancelled", {})
+
+    def cancel(self, discussion):
+        """
+        Cancels a queued or running discussion; returns False if it had already ended.
+        """
+        if discussion.done:
+            return False
+        discussion.task.cancel()
+        return True
+
+    def _prune(self):
+        # Forget the oldest ended discussions beyond the retention limit.
+        ended = [d for d in self.discussions.values() if d.done]
+        for discussion in ended[:max(0, len(ended) - config.SERVER_MAX_FINISHED)]:
+            del self.discussions[discussion.id]
+
+    async def close(self):
+        """
+        Cancels every discussion and closes the shared provider clients.
+        """
+        tasks = [d.task for d in self.discussions.values() if not d.done]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await aclose_clients()
+
+    ##############################
+    # HTTP
+    ##############################
+
+    async def handle(self, reader, writer):
+        """
+        Serves one HTTP request per connection.
+        """
+        try:
+            try:
+                method, path, query, headers, body = await _read_request(reader)
+                await self._dispatch(method, path, query, headers, body, writer)
+            except HTTPError as e:
+                _write_json(writer, e.status, {"error": str(e)})
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method, path, query, headers, body, writer):
+        parts = [part for part in path.split("/") if part]
+
+        if parts == ["metrics"] and method == "GET":
+            _write_response(writer, 200, "text/plain; version=0.0.4", telemetry.render_prometheus().encode("utf-8"))
+            return
+        if not parts or parts[0] != "discussions" or len(parts) > 3:
+            raise HTTPError(404, f"Unknown path: {path}")
+
+        if len(parts) == 1:
+            if method == "POST":
+                request = _parse_json(body)
+                topic = request.get("topic")
+                if not isinstance(topic, str) or not topic.strip():
+                    raise HTTPError(400, "A non-empty 'topic' string is required")
+                discussion = self.start(topic, bool(request.get("stream", False)), request.get("parallel_rounds"),
+                                        _parse_budget(request.get("budget")))
+                _write_json(writer, 201, discussion.describe())
+            elif method == "GET":
+                _write_json(writer, 200, {"discussions": [d.describe() for d in reversed(self.discussions.values())]})
+            else:
+                raise HTTPError(405, f"{method} is not supported on {path}")
+            return
+
+        discussion = self.discussions.get(parts[1])
+        if discussion is None:
+            raise HTTPError(404, f"No discussion with id {parts[1]}")
+
+        if len(parts) == 3:
+            if parts[2] != "events" or method != "GET":
+                raise HTTPError(404, f"Unknown path: {path}")
+            after = headers.get("last-event-id") or query.get("after", [None])[0]
+            await self._stream_events(discussion, _parse_int(after, "event id") + 1 if after is not None else 0, writer)
+        elif method == "GET":
+            _write_json(writer, 200, {
+                **discussion.describe(),
+                "events": [{"id": i, "event": event, "data": data} for i, event, data in discussion.events],
+                "record": discussion.record,
+            })
+        elif method == "DELETE":
+            if not self.cancel(discussion):
+                raise HTTPError(409, f"Discussion {discussion.id} has already {discussion.status}")
+            _write_json(writer, 200, discussion.describe())
+        else:
+            raise HTTPError(405, f"{method} is not supported on {path}")
+
+    async def _stream_events(self, discussion, seen, writer):
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Connection: close\r\n\r\n"
+        )
+        while True:
+            for i, event, data in discussion.events[seen:]:
+                writer.write(f"id: {i}\nevent: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+                seen = i + 1
+                if event in TERMINAL_EVENTS:
+                    await writer.drain()
+                    return
+            await writer.drain()
+            before = seen
+            await discussion.wait_for_events(seen, config.SERVER_SSE_KEEPALIVE)
+            if len(discussion.events) == before:
+                # Comment line that keeps proxies from closing an idle stream
+                writer.write(b": keepalive\n\n")
+
+async def _read_request(reader):
+    request_line = (await reader.readline()).decode("latin-1").strip()
+    if not request_line:
+        raise ConnectionError("empty request")
+    try:
+        method, target, _ = request_line.split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode("latin-1").strip()
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    path, _, query = target.partition("?")
+    length = _parse_int(headers.get("content-length") or 0, "Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, "Request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), path, parse_qs(query), headers, body
+
+def _parse_int(value, name):
+    try:
+        return int(value)
+    except ValueError:
+        raise HTTPError(400, f"Invalid {name}: {value}")
+
+def _parse_budget(value):
+    # Budget limits of a POST body, as keyword arguments for Budget.from_config
+    if value is None:
+        return {}
+    if not isinstance(value, dict) or not set(value) <= BUDGET_LIMITS:
+        raise HTTPError(400, f"'budget' must be an object with any of: {', '.join(sorted(BUDGET_LIMITS))}")
+    for name, limit in value.items():
+        if limit is not None and (isinstance(limit, bool) or not isinstance(limit, (int, float)) or limit < 0):
+            raise HTTPError(400, f"Invalid budget {name}: {limit}")
+    return value
+
+def _parse_json(body):
+    try:
+        request = json.loads(body or b"{}")
+    except ValueError:
+        raise HTTPError(400, "Invalid JSON body")
+    if not isinstance(request, dict):
+        raise HTTPError(400, "The request body must be a JSON object")
+    return request
+
+def _write_response(writer, status, content_type, data):
+    writer.write(
+        f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(data)}\r\n"
+        "Connection: close\r\n\r\n".encode("latin-1") + data
+    )
+
+def _write_json(writer, status, body):
+    _write_response(writer, status, "application/json", json.dumps(body, ensure_ascii=False).encode("utf-8"))
+
+async def serve(host=None, port=None, max_active=None, provider_concurrency=None, parallel_rounds=None, ready=None):
+    """
+    Runs the server until cancelled.
+
+    Args:
+        host: Interface to bind; defaults to config.SERVER_HOST
+        port: Port to bind; defaults to config.SERVER_PORT (0 picks a free port)
+        max_active, provider_concurrency, parallel_rounds: See DiscussionServer
+        ready: Optional function called with the bound (host, port) once listening
+    """
+    app = DiscussionServer(max_active, provider_concurrency, parallel_rounds)
+    server = await asyncio.start_server(
+        app.handle,
+        host or config.SERVER_HOST,
+        config.SERVER_PORT if port is None else port,
+    )
+    if ready is not None:
+        ready(server.sockets[0].getsockname()[:2])
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await app.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve Neural-Chat discussions over HTTP with Server-Sent Events.")
+    parser.add_argument("--host", default=config.SERVER_HOST, help="Interface to bind")
+    parser.add_argument("--port", type=int, default=config.SERVER_PORT, help="Port to bind")
+    parser.add_argument("--max-active", type=int, default=config.SERVER_MAX_ACTIVE, help="Discussions running at once")
+    parser.add_argument("--provider-concurrency", type=int, default=config.SERVER_PROVIDER_CONCURRENCY, help="Maximum in-flight calls per provider")
+    args = parser.parse_args(argv)
+    telemetry.start()
+
+    def ready(address):
+        print(f"Serving Neural-Chat on http://{address[0]}:{address[1]}", file=sys.stderr)
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.max_active, args.provider_concurrency, ready=ready))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
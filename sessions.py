@@ -0,0 +1,238 @@
+"""
+Durable, append-only store of Neural-Chat discussions.
+
+Every round start (with its model order), model turn (contribution, vote,
+error), round outcome and final summary is committed to a SQLite database
+in WAL mode as it happens, with synchronous=FULL so a committed turn
+survives a crash or power loss. A discussion interrupted in any round can
+be resumed by id: completed turns are replayed from the store instead of
+calling the providers again.
+
+Past sessions can be scanned for analytics with scan_turns(), which streams
+rows from a memory-mapped database instead of loading whole discussions.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+import config
+
+class SessionNotFoundError(Exception):
+    """
+    Raised when resuming a discussion id that is not in the store.
+    """
+
+class RoundRecord:
+    """
+    What the store knows about one round of a discussion.
+
+    Attributes:
+        models: Model names in the order they were called
+        turns: Recorded results ({"model", "contribution", "vote"[, "error"]}) in call order
+        outcome: {"true_votes", "false_votes", "continue"} once the round ended, else None
+    """
+
+    __slots__ = ("models", "turns", "outcome")
+
+    def __init__(self, models):
+        self.models = models
+        self.turns = []
+        self.outcome = None
+
+class SessionRecord:
+    """
+    A stored discussion: its topic, rounds and (once finished) summary.
+    """
+
+    __slots__ = ("id", "topic", "created", "status", "summary", "rounds")
+
+    def __init__(self, id, topic, created, status, summary):
+        self.id = id
+        self.topic = topic
+        self.created = created
+        self.status = status
+        self.summary = summary
+        self.rounds = []
+
+    @property
+    def finished(self):
+        return self.status == "finished"
+
+class SessionStore:
+    """
+    SQLite-backed append-only log of discussion events.
+
+    Args:
+        path: SQLite database file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id TEXT PRIMARY KEY, topic TEXT NOT NULL, created REAL NOT NULL, "
+            "status TEXT NOT NULL, summary TEXT)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            "session_id TEXT NOT NULL, seq INTEGER NOT NULL, round INTEGER NOT NULL, "
+            "kind TEXT NOT NULL, model TEXT, data TEXT NOT NULL, created REAL NOT NULL, "
+            "PRIMARY KEY (session_id, seq))"
+        )
+        self._next_seq = {}
+
+    def _append(self, session_id, round_index, kind, model, data):
+        with self._lock:
+            seq = self._next_seq.get(session_id)
+            if seq is None:
+                seq = self._conn.execute(
+                    "SELECT COALESCE(MAX(seq) + 1, 0) FROM events WHERE session_id = ?", (session_id,)
+                ).fetchone()[0]
+            self._conn.execute(
+                "INSERT INTO events (session_id, seq, round, kind, model, data, created) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (session_id, seq, round_index, kind, model, json.dumps(data), time.time()),
+            )
+            self._next_seq[session_id] = seq + 1
+
+    def create(self, topic):
+        """
+        Starts a new discussion and returns its id.
+        """
+        session_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (id, topic, created, status) VALUES (?, ?, ?, 'running')",
+                (session_id, topic, time.time()),
+            )
+            self._next_seq[session_id] = 0
+        return session_id
+
+    def start_round(self, session_id, round_index, models):
+        """
+        Records the start of a round and the order its models will be called in.
+        """
+        self._append(session_id, round_index, "round_start", None, {"models": list(models)})
+
+    def add_turn(self, session_id, round_index, result):
+        """
+        Records one model's result as soon as it is received.
+        """
+        self._append(session_id, round_index, "turn", result.get("model"), result)
+
+    def end_round(self, session_id, round_index, true_votes, false_votes, continue_discussion):
+        """
+        Records a round's vote outcome.
+        """
+        self._append(session_id, round_index, "round_end", None, {
+            "true_votes": true_votes, "false_votes": false_votes, "continue": continue_discussion,
+        })
+
+    def finish(self, session_id, summary):
+        """
+        Marks a discussion as finished with its final summary.
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE sessions SET status = 'finished', summary = ? WHERE id = ?", (summary, session_id)
+            )
+
+    def load(self, session_id):
+        """
+        Returns the SessionRecord for a discussion id.
+
+        Raises:
+            SessionNotFoundError: if the id is unknown
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, topic, created, status, summary FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                raise SessionNotFoundError(f"No stored discussion with id {session_id}")
+            events = self._conn.execute(
+                "SELECT round, kind, data FROM events WHERE session_id = ? ORDER BY seq", (session_id,)
+            ).fetchall()
+        session = SessionRecord(*row)
+        for round_index, kind, data in events:
+            data = json.loads(data)
+            if kind == "round_start":
+                # A round restarted after a crash keeps its first recorded order.
+                if round_index == len(session.rounds):
+                    session.rounds.append(RoundRecord(data["models"]))
+            elif kind == "turn":
+                session.rounds[round_index].turns.append(data)
+            elif kind == "round_end":
+                session.rounds[round_index].outcome = data
+        return session
+
+    def list_sessions(self, limit=20):
+        """
+        Returns (id, topic, created, status) for the most recent discussions.
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, topic, created, status FROM sessions ORDER BY created DESC LIMIT ?", (limit,)
+            ).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def scan_turns(path=None, since=None, model=None, mmap_bytes=None):
+    """
+    Streams every recorded turn in a session store, oldest first.
+
+    Opens its own read-only connection with SQLite's memory-mapped I/O, so
+    scanning a large archive neither copies pages through read() calls nor
+    holds more than one row in Python at a time.
+
+    Args:
+        path: Store to scan; defaults to config.SESSION_STORE_PATH
+        since: Only turns recorded at or after this UNIX timestamp
+        model: Only turns by this model name
+        mmap_bytes: Size of the memory map; defaults to config.SESSION_SCAN_MMAP_BYTES
+
+    Yields:
+        (session_id, round_index, result) tuples
+    """
+    path = path or config.SESSION_STORE_PATH
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        conn.execute(f"PRAGMA mmap_size={int(mmap_bytes or config.SESSION_SCAN_MMAP_BYTES)}")
+        query = "SELECT session_id, round, data FROM events WHERE kind = 'turn'"
+        args = []
+        if since is not None:
+            query += " AND created >= ?"
+            args.append(since)
+        if model is not None:
+            query += " AND model = ?"
+            args.append(model)
+        # rowid order is insertion order and needs no sort.
+        for session_id, round_index, data in conn.execute(query + " ORDER BY rowid", args):
+            yield session_id, round_index, json.loads(data)
+    finally:
+        conn.close()
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_session_store():
+    """
+    Returns the process-wide SessionStore, or None when config.SESSION_STORE_PATH is None.
+    """
+    global _store
+    if not config.SESSION_STORE_PATH:
+        return None
+    with _store_lock:
+        if _store is None or _store.path != config.SESSION_STORE_PATH:
+            if _store is not None:
+                _store.close()
+            _store = SessionStore(config.SESSION_STORE_PATH)
+        return _store
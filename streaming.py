@@ -0,0 +1,223 @@
+"""
+Incremental parsing of streamed {"contribution": ..., "vote": ...} responses.
+
+Providers stream the JSON response a few characters at a time. The parser
+here pulls the decoded contribution text out of the partial JSON as it
+arrives, so it can be shown to the user at time-to-first-token instead of
+after the full generation, and resolves the vote as soon as it appears.
+"""
+
+import re
+
+from telemetry import record_usage
+
+_CONTRIBUTION_KEY = re.compile(r'"contribution"\s*:\s*"')
+_VOTE_VALUE = re.compile(r'"vote"\s*:\s*(true|false|"[^"]*")', re.IGNORECASE)
+
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+class ContributionStreamParser:
+    """
+    Extracts the contribution text and vote from a partially received JSON object.
+
+    Text before the opening brace (such as a ```json fence) is tolerated.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.contribution = ""
+        self.vote = None
+        self._start = None   # index of the first character of the contribution string
+        self._pos = None     # next undecoded index inside the contribution string
+        self._end = None     # index just past the closing quote of the contribution string
+
+    def feed(self, chunk):
+        """
+        Adds a chunk of streamed text.
+
+        Returns:
+            The newly decoded part of the contribution (possibly empty)
+        """
+        if not chunk:
+            return ""
+        self.buffer += chunk
+        delta = ""
+        if self._start is None:
+            match = _CONTRIBUTION_KEY.search(self.buffer)
+            if match:
+                self._start = self._pos = match.end()
+        if self._start is not None and self._end is None:
+            delta = self._decode()
+            self.contribution += delta
+        if self.vote is None:
+            self._resolve_vote()
+        return delta
+
+    @property
+    def complete(self):
+        """
+        True once the contribution string has been closed.
+        """
+        return self._end is not None
+
+    def _decode(self):
+        # Decode as much of the JSON string as is complete; stop before a
+        # partial escape sequence and pick it up on the next chunk.
+        buf = self.buffer
+        pos = self._pos
+        out = []
+        while pos < len(buf):
+            ch = buf[pos]
+            if ch == '"':
+                self._end = pos + 1
+                pos += 1
+                break
+            if ch != '\\':
+                out.append(ch)
+                pos += 1
+                continue
+            if pos + 1 >= len(buf):
+                break
+            code = buf[pos + 1]
+            if code == 'u':
+                if pos + 6 > len(buf):
+                    break
+                value = int(buf[pos + 2:pos + 6], 16)
+                step = 6
+                if 0xD800 <= value < 0xDC00:
+                    # Surrogate pair: wait for the low half.
+                    if pos + 12 > len(buf):
+                        break
+                    low = int(buf[pos + 8:pos + 12], 16)
+                    value = 0x10000 + ((value - 0xD800) << 10) + (low - 0xDC00)
+                    step = 12
+                out.append(chr(value))
+                pos += step
+            else:
+                out.append(_ESCAPES.get(code, code))
+                pos += 2
+        self._pos = pos
+        return "".join(out)
+
+    def _resolve_vote(self):
+        # Only look outside the contribution string, which may itself mention a vote.
+        if self._start is None:
+            regions = [self.buffer]
+        elif self._end is None:
+            regions = [self.buffer[:self._start]]
+        else:
+            regions = [self.buffer[:self._start], self.buffer[self._end:]]
+        for region in regions:
+            match = _VOTE_VALUE.search(region)
+            if match:
+                value = match.group(1).lower()
+                if value.startswith('"'):
+                    value = value.strip('"')
+                self.vote = value in ("true", "yes", "y", "1", "t")
+                return
+
+class ContributionStream:
+    """
+    Collects a streamed response while forwarding contribution text to a callback.
+
+    Every streamed attempt (including a retry of a failed one) is parsed from
+    scratch. If text of an earlier attempt was already forwarded, on_token is
+    first called with None to withdraw it.
+
+    Args:
+        on_token: Called with each newly decoded piece of the contribution, or None
+    """
+
+    def __init__(self, on_token=None):
+        self.on_token = on_token
+        self.parser = ContributionStreamParser()
+        self.emitted = False
+
+    def reset(self):
+        """
+        Starts a new attempt, withdrawing any text already forwarded.
+        """
+        self.parser = ContributionStreamParser()
+        if self.emitted:
+            self.on_token(None)
+            self.emitted = False
+
+    def feed(self, text):
+        delta = self.parser.feed(text)
+        if delta and self.on_token is not None:
+            self.on_token(delta)
+            self.emitted = True
+
+    def consume(self, texts):
+        """
+        Feeds every text delta from an iterable and returns the full response text.
+        """
+        self.reset()
+        parts = []
+        for text in texts:
+            if text:
+                parts.append(text)
+                self.feed(text)
+        return "".join(parts)
+
+    async def aconsume(self, texts):
+        """
+        Async variant of consume for async iterables.
+        """
+        self.reset()
+        parts = []
+        async for text in texts:
+            if text:
+                parts.append(text)
+                self.feed(text)
+        return "".join(parts)
+
+    def finish(self, result):
+        """
+        Emits the whole contribution if nothing was streamed (e.g. a cached or
+        fallback response), so callers always see the contribution once.
+        """
+        if not self.emitted and self.on_token is not None:
+            contribution = result.get("contribution", "")
+            if contribution:
+                self.on_token(contribution)
+                self.emitted = True
+        return result
+
+def openai_text_deltas(chunks):
+    """
+    Yields content deltas from an OpenAI-compatible chat-completions stream.
+    """
+    for chunk in chunks:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+        elif getattr(chunk, "usage", None):
+            record_usage(chunk.usage)
+
+async def openai_text_deltas_async(chunks):
+    """
+    Async variant of openai_text_deltas.
+    """
+    async for chunk in chunks:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+        elif getattr(chunk, "usage", None):
+            record_usage(chunk.usage)
+
+def gemini_text_deltas(chunks):
+    """
+    Yields text from a streamed Gemini generate_content response.
+    """
+    for chunk in chunks:
+        record_usage(getattr(chunk, "usage_metadata", None))
+        if chunk.parts:
+            yield chunk.text
+
+async def gemini_text_deltas_async(chunks):
+    """
+    Async variant of gemini_text_deltas.
+    """
+    async for chunk in chunks:
+        record_usage(getattr(chunk, "usage_metadata", None))
+        if chunk.parts:
+            yield chunk.text
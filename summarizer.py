@@ -0,0 +1,174 @@
+"""
+Incremental summarization of a running discussion.
+
+Instead of sending the whole transcript to the summarizer once the
+discussion is over, a RunningSummary folds each finished round into a
+compact running summary in the background while the next round is being
+discussed. The final answer is then written from that summary plus the last
+round's contributions, a short request that returns almost immediately.
+
+The terminal (main.py) uses the thread-based update()/final(); batch mode
+uses update_async()/final_async() on its event loop. One RunningSummary
+must only be driven through one of the two.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from models import summary_chat, summary_chat_async
+from prompts import get_running_summary_prompt, get_final_summary_prompt
+from transcript import Transcript, TEXT_FORMAT
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=config.SUMMARY_WORKERS, thread_name_prefix="summarizer")
+        return _executor
+
+def _entries_text(entries):
+    # One "Model: contribution" line per entry
+    return Transcript(entries).render(None, TEXT_FORMAT).strip()
+
+class RunningSummary:
+    """
+    Running summary of one discussion, updated round by round.
+
+    Args:
+        topic: The discussion topic
+        budget: Optional Budget of the discussion; updates leave its summary
+            reserve for the final summary
+
+    Attributes:
+        summary: Summary of every entry folded so far ("" before the first update)
+        updates: Number of completed background updates
+        update_seconds: Total time spent in background updates
+        final_seconds: Time taken by the final summary request
+    """
+
+    def __init__(self, topic, budget=None):
+        self.topic = topic
+        self.budget = budget
+        self.summary = ""
+        self.updates = 0
+        self.update_seconds = 0.0
+        self.final_seconds = 0.0
+        # Entries handed to an update so far
+        self._taken = 0
+        # Text of entries whose update failed, retried with the next one
+        self._unfolded = []
+        self._pending = None
+
+    def _take(self, transcript):
+        entries = transcript[self._taken:]
+        self._taken += len(entries)
+        return _entries_text(entries)
+
+    def _fold_request(self, new_text):
+        texts = self._unfolded + [new_text]
+        return texts, get_running_summary_prompt(self.topic, self.summary, "\n".join(texts))
+
+    def _folded(self, texts, reply, start):
+        if reply:
+            self.summary = reply.strip()
+            self._unfolded = []
+        else:
+            # Keep the text so the next update or the final summary still covers it.
+            self._unfolded = texts
+        self.updates += 1
+        self.update_seconds += time.perf_counter() - start
+
+    def _fold(self, new_text):
+        start = time.perf_counter()
+        texts, prompt = self._fold_request(new_text)
+        self._folded(texts, summary_chat(prompt, config.RUNNING_SUMMARY_MAX_TOKENS, self.budget, reserve=True), start)
+
+    async def _fold_async(self, new_text):
+        start = time.perf_counter()
+        texts, prompt = self._fold_request(new_text)
+        self._folded(texts, await summary_chat_async(prompt, config.RUNNING_SUMMARY_MAX_TOKENS, self.budget, reserve=True), start)
+
+    def _recent(self, transcript):
+        # Entries the running summary does not cover yet
+        return "\n".join(self._unfolded + [self._take(transcript)]).strip()
+
+    def _final_reply(self, reply, recent, start):
+        self.final_seconds = time.perf_counter() - start
+        if reply:
+            return reply
+        # Without a final summary (failed call or spent budget), fall back to
+        # what is known locally: the running summary, then the last contributions.
+        return "\n\n".join(part for part in (self.summary, recent) if part) or "No summary available."
+
+    def update(self, transcript):
+        """
+        Starts folding the entries added since the last update into the summary.
+
+        Runs in a background thread and returns immediately; only one update
+        runs at a time, so this first waits for the previous one (which has
+        normally finished while the round was being discussed).
+        """
+        self.wait()
+        if len(transcript) > self._taken:
+            self._pending = _get_executor().submit(self._fold, self._take(transcript))
+
+    def wait(self):
+        """
+        Blocks until the background update, if any, has finished.
+        """
+        if self._pending is not None:
+            self._pending.result()
+            self._pending = None
+
+    def cancel(self):
+        """
+        Cancels the background update, if any, for a discussion that was abandoned.
+        """
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+
+    def final(self, transcript):
+        """
+        Returns the final summary of the discussion.
+
+        Waits for the pending update, then asks for the final answer from the
+        running summary and the entries not folded into it yet.
+        """
+        self.wait()
+        start = time.perf_counter()
+        recent = self._recent(transcript)
+        reply = summary_chat(get_final_summary_prompt(self.topic, self.summary, recent), config.FINAL_SUMMARY_MAX_TOKENS, self.budget)
+        return self._final_reply(reply, recent, start)
+
+    async def update_async(self, transcript):
+        """
+        Async variant of update: the update runs as a task on the current event loop.
+        """
+        await self.wait_async()
+        if len(transcript) > self._taken:
+            self._pending = asyncio.ensure_future(self._fold_async(self._take(transcript)))
+
+    async def wait_async(self):
+        """
+        Async variant of wait.
+        """
+        if self._pending is not None:
+            await self._pending
+            self._pending = None
+
+    async def final_async(self, transcript):
+        """
+        Async variant of final.
+        """
+        await self.wait_async()
+        start = time.perf_counter()
+        recent = self._recent(transcript)
+        reply = await summary_chat_async(get_final_summary_prompt(self.topic, self.summary, recent), config.FINAL_SUMMARY_MAX_TOKENS, self.budget)
+        return self._final_reply(reply, recent, start)
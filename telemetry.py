@@ -0,0 +1,400 @@
+"""
+Instrumentation for Neural-Chat provider calls, rounds and discussions.
+
+When config.TELEMETRY_ENABLED is set, every provider call made through
+ratelimit.py is recorded as a span with its queueing, network, parse and
+retry time, token usage and estimated cost. Rounds and discussions record
+their wall time. Spans and timings are appended to a JSON-lines file and
+aggregated into Prometheus counters and histograms, which can be scraped
+from a local endpoint or written to a node-exporter textfile.
+
+When telemetry is disabled, start_span() returns None and every other hook
+returns immediately.
+"""
+
+import atexit
+import contextvars
+import json
+import os
+import threading
+import time
+
+import config
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_current_span = contextvars.ContextVar("neural_chat_span", default=None)
+_lock = threading.Lock()
+_jsonl_file = None
+_server = None
+_started = False
+
+class Span:
+    """
+    Timing and usage of one provider call, including its retries.
+    """
+
+    __slots__ = (
+        "provider", "model", "started", "queue_seconds", "call_seconds", "parse_seconds",
+        "retry_seconds", "attempts", "input_tokens", "output_tokens", "cached_input_tokens",
+        "usage_estimated",
+    )
+
+    def __init__(self, provider, model):
+        self.provider = provider
+        self.model = model
+        self.started = time.perf_counter()
+        self.queue_seconds = 0.0
+        self.call_seconds = 0.0
+        self.parse_seconds = 0.0
+        self.retry_seconds = 0.0
+        self.attempts = 0
+        self.input_tokens = None
+        self.output_tokens = None
+        self.cached_input_tokens = 0
+        self.usage_estimated = False
+
+    @property
+    def network_seconds(self):
+        return max(0.0, self.call_seconds - self.parse_seconds)
+
+    @property
+    def cost(self):
+        if self.input_tokens is None:
+            return None
+        return estimate_cost(self.model, self.input_tokens, self.output_tokens or 0, self.cached_input_tokens)
+
+def estimate_cost(model_id, input_tokens, output_tokens, cached_input_tokens=0):
+    """
+    Returns the US dollar cost of a call from config.MODEL_PRICES, or None for unknown models.
+
+    cached_input_tokens of the input_tokens were read from the provider's
+    prompt cache and are priced at config.CACHED_INPUT_PRICES where known.
+    """
+    prices = config.MODEL_PRICES.get(model_id)
+    if prices is None:
+        return None
+    input_price, output_price = prices
+    cached_price = config.CACHED_INPUT_PRICES.get(model_id, input_price)
+    cached_input_tokens = min(cached_input_tokens, input_tokens)
+    return ((input_tokens - cached_input_tokens) * input_price + cached_input_tokens * cached_price
+            + output_tokens * output_price) / 1_000_000
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.count += 1
+
+# Aggregates exported to Prometheus, keyed by label tuples
+_call_seconds = {}     # (provider,) -> _Histogram
+_calls = {}            # (provider, status) -> count
+_retries = {}          # (provider,) -> count
+_tokens = {}           # (provider, direction) -> count; direction "cached_input" is part of "input"
+_cost = {}             # (provider,) -> USD
+_parses = {}           # (model, outcome) -> count
+_round_seconds = _Histogram()
+_discussion_seconds = _Histogram()
+
+def start():
+    """
+    Starts the configured exporters. Safe to call more than once.
+    """
+    global _server, _started
+    if not config.TELEMETRY_ENABLED:
+        return
+    with _lock:
+        if config.TELEMETRY_PROMETHEUS_PORT and _server is None:
+            _server = _start_metrics_server(config.TELEMETRY_PROMETHEUS_PORT)
+        if not _started:
+            _started = True
+            atexit.register(flush)
+
+def start_span(provider, model, always=False):
+    """
+    Opens a span for a provider call, or returns None when telemetry is disabled.
+
+    With always=True a span is opened regardless, so the call's usage can be
+    read (for budgets) even when it is not exported.
+    """
+    if not config.TELEMETRY_ENABLED and not always:
+        return None
+    return Span(provider, model)
+
+def _cached_input_tokens(usage):
+    # Input tokens read from the provider's prompt cache: OpenAI and xAI
+    # (prompt_tokens_details.cached_tokens), DeepSeek (prompt_cache_hit_tokens),
+    # Anthropic (cache_read_input_tokens) and Gemini (cached_content_token_count).
+    details = getattr(usage, "prompt_tokens_details", None)
+    for value in (getattr(details, "cached_tokens", None),
+                  getattr(usage, "prompt_cache_hit_tokens", None),
+                  getattr(usage, "cache_read_input_tokens", None),
+                  getattr(usage, "cached_content_token_count", None)):
+        if isinstance(value, int) and value > 0:
+            return value
+    return 0
+
+def record_usage(usage, accumulate=False):
+    """
+    Records provider-reported token usage on the current span.
+
+    Accepts the usage objects of the OpenAI (prompt_tokens/completion_tokens),
+    Anthropic (input_tokens/output_tokens) and Gemini
+    (prompt_token_count/candidates_token_count) SDKs, including the input
+    tokens each reports as read from its prompt cache. Later calls overwrite
+    earlier ones, so streams may report their running totals; pass
+    accumulate=True for the usage of a further request made within the same
+    call (such as a re-ask).
+    """
+    span = _current_span.get()
+    if span is None or usage is None:
+        return
+    for input_name, output_name in (("prompt_tokens", "completion_tokens"),
+                                    ("input_tokens", "output_tokens"),
+                                    ("prompt_token_count", "candidates_token_count")):
+        input_tokens = getattr(usage, input_name, None)
+        output_tokens = getattr(usage, output_name, None)
+        if input_tokens is not None or output_tokens is not None:
+            cached = _cached_input_tokens(usage)
+            if input_name == "input_tokens" and input_tokens is not None:
+                # Anthropic counts cache reads and writes apart from input_tokens.
+                input_tokens += cached + (getattr(usage, "cache_creation_input_tokens", None) or 0)
+            if input_tokens is not None:
+                span.input_tokens = input_tokens + ((span.input_tokens or 0) if accumulate else 0)
+            if output_tokens is not None:
+                span.output_tokens = output_tokens + ((span.output_tokens or 0) if accumulate else 0)
+            span.cached_input_tokens = cached + (span.cached_input_tokens if accumulate else 0)
+            return
+
+def timed_parse(parse):
+    """
+    Decorator adding the time spent in a response parser to the current span.
+    """
+    def wrapper(*args, **kwargs):
+        span = _current_span.get()
+        if span is None:
+            return parse(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return parse(*args, **kwargs)
+        finally:
+            span.parse_seconds += time.perf_counter() - start
+    wrapper.__name__ = parse.__name__
+    wrapper.__doc__ = parse.__doc__
+    wrapper.__wrapped__ = parse
+    return wrapper
+
+def activate(span):
+    """
+    Makes span current for record_usage() and timed_parse(); returns a token for deactivate().
+    """
+    return _current_span.set(span)
+
+def deactivate(token):
+    _current_span.reset(token)
+
+def finish_span(span, error=None, estimated_tokens=None, result=None):
+    """
+    Closes a span, updates the aggregates and appends it to the JSON-lines file.
+
+    Args:
+        span: Span returned by start_span
+        error: The ProviderError the call ended with, if any
+        estimated_tokens: Input token estimate used when the provider reported no usage
+        result: Parsed result, used to estimate output tokens when none were reported
+    """
+    duration = time.perf_counter() - span.started
+    if span.input_tokens is None and estimated_tokens is not None:
+        span.input_tokens = estimated_tokens
+        span.usage_estimated = True
+    if span.output_tokens is None and result is not None:
+        span.output_tokens = (len(result.get("contribution", "")) + 3) // 4
+        span.usage_estimated = True
+    if not config.TELEMETRY_ENABLED:
+        # Opened only to measure usage for a budget.
+        return
+    status = "ok" if error is None else error.__class__.__name__
+    cost = span.cost
+
+    with _lock:
+        _call_seconds.setdefault((span.provider,), _Histogram()).observe(duration)
+        _calls[(span.provider, status)] = _calls.get((span.provider, status), 0) + 1
+        if span.attempts > 1:
+            _retries[(span.provider,)] = _retries.get((span.provider,), 0) + span.attempts - 1
+        for direction, count in (("input", span.input_tokens), ("output", span.output_tokens),
+                                 ("cached_input", span.cached_input_tokens)):
+            if count:
+                _tokens[(span.provider, direction)] = _tokens.get((span.provider, direction), 0) + count
+        if cost is not None:
+            _cost[(span.provider,)] = _cost.get((span.provider,), 0.0) + cost
+
+    _write({
+        "type": "call",
+        "time": time.time(),
+        "provider": span.provider,
+        "model": span.model,
+        "status": status,
+        "error": str(error) if error is not None else None,
+        "attempts": span.attempts,
+        "seconds": round(duration, 6),
+        "queue_seconds": round(span.queue_seconds, 6),
+        "network_seconds": round(span.network_seconds, 6),
+        "parse_seconds": round(span.parse_seconds, 6),
+        "retry_seconds": round(span.retry_seconds, 6),
+        "input_tokens": span.input_tokens,
+        "output_tokens": span.output_tokens,
+        "cached_input_tokens": span.cached_input_tokens,
+        "usage_estimated": span.usage_estimated,
+        "cost_usd": cost,
+    })
+
+def record_parse(model_name, outcome):
+    """
+    Counts how a model's reply was parsed (see parsing.py).
+    """
+    if not config.TELEMETRY_ENABLED:
+        return
+    with _lock:
+        _parses[(model_name, outcome)] = _parses.get((model_name, outcome), 0) + 1
+
+def record_round(seconds, round_index, calls):
+    """
+    Records the wall time of a discussion round.
+    """
+    if not config.TELEMETRY_ENABLED:
+        return
+    with _lock:
+        _round_seconds.observe(seconds)
+    _write({"type": "round", "time": time.time(), "round": round_index + 1, "calls": calls, "seconds": round(seconds, 6)})
+
+def record_discussion(seconds, rounds):
+    """
+    Records the wall time of a whole discussion and refreshes the Prometheus textfile.
+    """
+    if not config.TELEMETRY_ENABLED:
+        return
+    with _lock:
+        _discussion_seconds.observe(seconds)
+    _write({"type": "discussion", "time": time.time(), "rounds": rounds, "seconds": round(seconds, 6)})
+    flush()
+
+def _write(record):
+    global _jsonl_file
+    if not config.TELEMETRY_JSONL_PATH:
+        return
+    line = json.dumps(record) + "\n"
+    with _lock:
+        if _jsonl_file is None:
+            _jsonl_file = open(config.TELEMETRY_JSONL_PATH, "a", encoding="utf-8")
+        _jsonl_file.write(line)
+
+def flush():
+    """
+    Flushes the JSON-lines file and rewrites the Prometheus textfile, if configured.
+    """
+    with _lock:
+        if _jsonl_file is not None:
+            _jsonl_file.flush()
+    path = config.TELEMETRY_PROMETHEUS_TEXTFILE
+    if path:
+        # Write then rename so a scraper never reads a partial file.
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(render_prometheus())
+        os.replace(tmp_path, path)
+
+def _labels(names, values):
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+
+def _render_histogram(lines, name, histogram, labels=""):
+    cumulative = 0
+    for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), histogram.counts):
+        cumulative += count
+        le = f'le="{bound}"'
+        lines.append(f"{name}_bucket{{{labels + ',' if labels else ''}{le}}} {cumulative}")
+    suffix = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{suffix} {histogram.total}")
+    lines.append(f"{name}_count{suffix} {histogram.count}")
+
+def render_prometheus():
+    """
+    Returns the aggregates in the Prometheus text exposition format.
+    """
+    lines = []
+    with _lock:
+        lines.append("# HELP neural_chat_call_seconds Provider call latency including queueing and retries.")
+        lines.append("# TYPE neural_chat_call_seconds histogram")
+        for key, histogram in sorted(_call_seconds.items()):
+            _render_histogram(lines, "neural_chat_call_seconds", histogram, _labels(("provider",), key))
+
+        for name, help_text, values, label_names in (
+            ("neural_chat_calls_total", "Provider calls by outcome.", _calls, ("provider", "status")),
+            ("neural_chat_retries_total", "Provider call retries.", _retries, ("provider",)),
+            ("neural_chat_tokens_total", "Tokens sent and received (cached_input: input read from the provider's prompt cache).", _tokens, ("provider", "direction")),
+            ("neural_chat_cost_usd_total", "Estimated provider cost in US dollars.", _cost, ("provider",)),
+            ("neural_chat_parse_total", "Model replies by parse outcome.", _parses, ("model", "outcome")),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in sorted(values.items()):
+                lines.append(f"{name}{{{_labels(label_names, key)}}} {value}")
+
+        for name, help_text, histogram in (
+            ("neural_chat_round_seconds", "Discussion round wall time.", _round_seconds),
+            ("neural_chat_discussion_seconds", "Whole discussion wall time.", _discussion_seconds),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            _render_histogram(lines, name, histogram)
+    return "\n".join(lines) + "\n"
+
+def summary_lines():
+    """
+    Returns a short per-provider latency, token, prompt cache hit rate and cost table for the terminal.
+    """
+    lines = []
+    with _lock:
+        for (provider,), histogram in sorted(_call_seconds.items(), key=lambda item: -item[1].total):
+            mean = histogram.total / histogram.count
+            tokens_in = _tokens.get((provider, "input"), 0)
+            tokens_out = _tokens.get((provider, "output"), 0)
+            hit_rate = _tokens.get((provider, "cached_input"), 0) / tokens_in if tokens_in else 0.0
+            cost = _cost.get((provider,), 0.0)
+            lines.append(f"{provider:>10}: {histogram.count:4d} calls, {histogram.total:7.2f}s total, "
+                         f"{mean:6.2f}s mean, {tokens_in} in ({hit_rate:.0%} cached) / {tokens_out} out tokens, ~${cost:.4f}")
+    return lines
+
+def _start_metrics_server(port):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,317 @@
+"""
+Append-only discussion transcript for Neural-Chat.
+
+A Transcript stores the discussion entries in order and keeps, for every
+(participant, wire format) pair that has been requested, a pre-rendered view
+of the history. Views are extended incrementally as entries are appended, so
+each model call only formats the contributions it has not seen yet instead of
+re-walking the whole discussion.
+
+Model contributions are stored as slotted Turn records with interned model
+names. A turn's contribution string is stored once and shared: the message
+every other participant sees ("Model: ...") is rendered the first time it is
+needed and cached on the Turn, so all views of a turn hold references to the
+same objects instead of each keeping its own decorated copy.
+"""
+
+import sys
+
+# Wire formats understood by Transcript.render()
+CHAT_FORMAT = "chat"            # OpenAI-style message list (GPT-4o, Grok, DeepSeek)
+ANTHROPIC_FORMAT = "anthropic"  # Anthropic messages list (only user/assistant roles)
+TEXT_FORMAT = "text"            # Single prompt string (Gemini)
+
+class Turn:
+    """
+    One model contribution to the discussion.
+
+    Supports the read-only mapping access of the {"model": ..., "content": ...}
+    dicts it replaces (turn["model"], turn.get("content"), "model" in turn).
+
+    Args:
+        model: Model name (interned, so turns of the same model share it)
+        content: The contribution
+        failed: True if the call failed and content is an error or fallback
+            message rather than something the model said
+    """
+
+    __slots__ = ("model", "content", "failed", "_message", "_line")
+
+    _KEYS = ("model", "content")
+
+    def __init__(self, model, content, failed=False):
+        self.model = sys.intern(model) if type(model) is str else model
+        self.content = content
+        self.failed = failed
+        self._message = None
+        self._line = None
+
+    def message(self):
+        """
+        Returns the chat message other participants see; shared, must not be modified.
+        """
+        if self._message is None:
+            self._message = {"role": "assistant", "content": f"{self.model}: {self.content}"}
+        return self._message
+
+    def line(self):
+        """
+        Returns the prompt line other participants see in TEXT_FORMAT.
+        """
+        if self._line is None:
+            self._line = f"\n{self.model}: {self.content}"
+        return self._line
+
+    def __getitem__(self, key):
+        if key not in self._KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self._KEYS else default
+
+    def __contains__(self, key):
+        return key in self._KEYS
+
+    def keys(self):
+        return self._KEYS
+
+    def to_dict(self):
+        return {"model": self.model, "content": self.content}
+
+    def __eq__(self, other):
+        if isinstance(other, Turn):
+            return self.model == other.model and self.content == other.content
+        return isinstance(other, dict) and other == self.to_dict()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+def _as_turn(entry):
+    # {"model", "content"} dicts are stored as Turns; other entries are kept as they are.
+    if type(entry) is dict and len(entry) == 2 and 'model' in entry and 'content' in entry:
+        return Turn(entry['model'], entry['content'])
+    return entry
+
+class RoundVotes:
+    """
+    Votes cast in one round, packed one bit per vote into a bytearray.
+
+    Iterates and measures like the list of booleans it replaces.
+    """
+
+    __slots__ = ("_bits", "_count", "true_votes")
+
+    def __init__(self, votes=()):
+        self._bits = bytearray()
+        self._count = 0
+        self.true_votes = 0
+        for vote in votes:
+            self.append(vote)
+
+    def append(self, vote):
+        if self._count % 8 == 0:
+            self._bits.append(0)
+        if vote:
+            self._bits[-1] |= 1 << (self._count % 8)
+            self.true_votes += 1
+        self._count += 1
+
+    @property
+    def false_votes(self):
+        return self._count - self.true_votes
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("vote index out of range")
+        return bool(self._bits[index // 8] >> (index % 8) & 1)
+
+    def to_list(self):
+        """
+        Returns the votes as a list of booleans.
+        """
+        return list(self)
+
+    def __iter__(self):
+        return (self[i] for i in range(self._count))
+
+    def __len__(self):
+        return self._count
+
+    def __repr__(self):
+        return f"RoundVotes({list(self)!r})"
+
+def _model_line(entry, participant):
+    if entry['model'] == participant:
+        return f"YOUR PREVIOUS RESPONSE: {entry['content']}"
+    return f"{entry['model']}: {entry['content']}"
+
+def _render_chat(entry, participant):
+    if isinstance(entry, Turn):
+        if entry.model == participant:
+            return {"role": "assistant", "content": _model_line(entry, participant)}
+        return entry.message()
+    if isinstance(entry, dict) and 'role' in entry and 'content' in entry:
+        # Keep existing formatted messages
+        return entry
+    if isinstance(entry, dict) and 'model' in entry and 'content' in entry:
+        # Mark the participant's own previous responses
+        return {"role": "assistant", "content": _model_line(entry, participant)}
+    if isinstance(entry, str):
+        return {"role": "assistant", "content": entry}
+    return None
+
+def _render_anthropic(entry, participant):
+    if isinstance(entry, Turn):
+        return _render_chat(entry, participant)
+    if isinstance(entry, dict) and 'role' in entry and 'content' in entry:
+        if entry['role'] in ['user', 'assistant']:
+            return entry
+        return {"role": "assistant", "content": entry['content']}
+    return _render_chat(entry, participant)
+
+def _render_text(entry, participant):
+    if isinstance(entry, Turn):
+        if entry.model == participant:
+            return f"\n{_model_line(entry, participant)}"
+        return entry.line()
+    if isinstance(entry, dict) and 'model' in entry and 'content' in entry:
+        return f"\n{_model_line(entry, participant)}"
+    if isinstance(entry, dict) and 'role' in entry and 'content' in entry:
+        return f"\n{entry.get('role').capitalize()}: {entry.get('content')}"
+    if isinstance(entry, str):
+        return f"\n{entry}"
+    return None
+
+_RENDERERS = {
+    CHAT_FORMAT: _render_chat,
+    ANTHROPIC_FORMAT: _render_anthropic,
+    TEXT_FORMAT: _render_text,
+}
+
+class _View:
+    """
+    Rendered history for one participant in one wire format.
+
+    Message formats keep a list of rendered messages. TEXT_FORMAT keeps the
+    prompt string itself, extended with the new lines on every catch-up.
+    """
+
+    __slots__ = ("render_entry", "participant", "items", "rendered", "text")
+
+    def __init__(self, render_entry, participant, text=False):
+        self.render_entry = render_entry
+        self.participant = participant
+        self.items = None if text else []
+        self.rendered = 0
+        self.text = "" if text else None
+
+    def catch_up(self, entries):
+        if self.rendered == len(entries):
+            return
+        rendered = [item for item in (self.render_entry(entry, self.participant) for entry in entries[self.rendered:])
+                    if item is not None]
+        if self.items is None:
+            self.text += "".join(rendered)
+        else:
+            self.items.extend(rendered)
+        self.rendered = len(entries)
+
+class Transcript:
+    """
+    Ordered, append-only list of discussion entries with cached rendered views.
+
+    Model contributions are stored as Turn records ({"model": ..., "content": ...}
+    dicts are converted on the way in); {"role": ..., "content": ...} dicts and
+    plain strings are kept as they are, for compatibility with the raw
+    context lists accepted by the *_chat functions. A Transcript can be
+    iterated, indexed and measured like the list it replaces.
+    """
+
+    def __init__(self, entries=None):
+        self._entries = [_as_turn(entry) for entry in entries] if entries else []
+        self._views = {}
+        self._round_starts = []
+
+    def append(self, entry):
+        """
+        Appends an entry. Existing views pick it up the next time they are rendered.
+        """
+        self._entries.append(_as_turn(entry))
+
+    def add(self, model, content, failed=False):
+        """
+        Appends a model contribution; failed marks the result of a failed call (see Turn).
+        """
+        self._entries.append(Turn(model, content, failed))
+
+    def start_round(self):
+        """
+        Marks the start of a new discussion round at the current end of the transcript.
+        """
+        self._round_starts.append(len(self._entries))
+
+    @property
+    def round_count(self):
+        return len(self._round_starts)
+
+    def round_bounds(self, index):
+        """
+        Returns the (start, end) entry indices of a round marked with start_round().
+        """
+        start = self._round_starts[index]
+        if index + 1 < len(self._round_starts):
+            return start, self._round_starts[index + 1]
+        return start, len(self._entries)
+
+    def render(self, participant, fmt=CHAT_FORMAT):
+        """
+        Returns the history as seen by a participant in the given wire format.
+
+        Args:
+            participant: Model name whose own contributions are marked as
+                "YOUR PREVIOUS RESPONSE"
+            fmt: CHAT_FORMAT, ANTHROPIC_FORMAT or TEXT_FORMAT
+
+        Returns:
+            A list of message dicts for the message formats, or a prompt
+            string (one line per entry, each starting with a newline) for
+            TEXT_FORMAT. Returned lists are shared and must not be modified.
+        """
+        view = self._views.get((participant, fmt))
+        if view is None:
+            view = self._views[(participant, fmt)] = _View(_RENDERERS[fmt], participant, fmt == TEXT_FORMAT)
+        view.catch_up(self._entries)
+        if fmt == TEXT_FORMAT:
+            return view.text
+        return view.items
+
+    def to_list(self):
+        """
+        Returns the entries as plain JSON-serialisable values (Turns become dicts).
+        """
+        return [entry.to_dict() if isinstance(entry, Turn) else entry for entry in self._entries]
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getitem__(self, index):
+        return self._entries[index]
+
+    def __repr__(self):
+        return f"Transcript({self._entries!r})"
+
+def as_transcript(context_messages):
+    """
+    Returns context_messages as a Transcript, wrapping plain lists.
+    """
+    if isinstance(context_messages, Transcript):
+        return context_messages
+    return Transcript(context_messages)